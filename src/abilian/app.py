@@ -44,6 +44,7 @@ from abilian.services import (
     audit_service,
     auth_service,
     conversion_service,
+    image_service,
     index_service,
     preferences_service,
     repository_service,
@@ -365,6 +366,7 @@ class Application(
         activity_service.init_app(self)
         preferences_service.init_app(self)
         conversion_service.init_app(self)
+        image_service.init_app(self)
         vocabularies_service.init_app(self)
         antivirus.init_app(self)
 
@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+from .audit import *  # noqa
 from .base import *  # noqa
 from .config import *  # noqa
+from .conversion import *  # noqa
+from .images import *  # noqa
 from .indexing import *  # noqa
+from .repository import *  # noqa
@@ -0,0 +1,93 @@
+""""""
+
+from __future__ import annotations
+
+import time
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+
+from abilian.core.extensions import db
+from abilian.services.audit import FORMAT_ERROR_VALUE, AuditEntry, load_pickled_changes
+
+
+@click.command()
+@click.option("--batch-size", default=1000, help="Entries converted per transaction.")
+@click.option(
+    "--keep-pickle/--no-keep-pickle",
+    default=True,
+    help="Keep legacy pickled changes of converted entries (default: kept).",
+)
+@with_appcontext
+def migrate_audit_changes(batch_size: int, keep_pickle: bool):
+    """Convert changes of audit entries from pickle to JSON.
+
+    Entries are converted in batches, each in its own transaction: an
+    interrupted run can be started again, converted entries are skipped.
+    Entries which can't be decoded are reported and left untouched.
+    """
+    table = AuditEntry.__table__
+    select = (
+        sa.select([table.c.id, table.c.changes_pickle])
+        .where(table.c.changes_json.is_(None))
+        .where(table.c.changes_pickle.isnot(None))
+        .order_by(table.c.id)
+        .limit(batch_size)
+    )
+    values = {"changes_json": sa.bindparam("changes_json")}
+    if not keep_pickle:
+        values["changes_pickle"] = None
+    update = table.update().where(table.c.id == sa.bindparam("_id")).values(values)
+
+    start = time.perf_counter()
+    converted = 0
+    failed = []
+    last_id = 0
+    while True:
+        rows = db.session.execute(select.where(table.c.id > last_id)).fetchall()
+        if not rows:
+            break
+
+        params = []
+        for entry_id, changes_pickle in rows:
+            changes_json = _convert(changes_pickle)
+            if changes_json is None:
+                failed.append(entry_id)
+                continue
+            params.append({"_id": entry_id, "changes_json": changes_json})
+
+        if params:
+            db.session.execute(update, params)
+            db.session.commit()
+
+        last_id = rows[-1][0]
+        converted += len(params)
+        elapsed = time.perf_counter() - start
+        click.echo(
+            f"{converted} entries converted, {converted / elapsed:.0f} entries/s"
+        )
+
+    click.echo(f"Done: {converted} entries converted.")
+    if failed:
+        click.echo(
+            f"{len(failed)} entries could not be decoded, left as is: "
+            + ", ".join(str(entry_id) for entry_id in failed),
+            err=True,
+        )
+
+
+def _convert(changes_pickle: bytes) -> str | None:
+    """JSON changes of a legacy entry, or `None` if it can't be decoded
+    without loss."""
+    try:
+        load_pickled_changes(changes_pickle)
+    except Exception:
+        return None
+
+    # decoded and encoded as by the model, without loading entries
+    entry = AuditEntry(changes_pickle=changes_pickle)
+    entry.changes = entry.get_changes()
+    if FORMAT_ERROR_VALUE in entry.changes_json:
+        return None
+    return entry.changes_json
@@ -0,0 +1,102 @@
+""""""
+
+from __future__ import annotations
+
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable
+
+import click
+from flask.cli import with_appcontext
+from magic import Magic
+
+from abilian.services import conversion
+from abilian.services.conversion import ConversionError, Converter, converter
+
+#: bundled sample documents
+SAMPLES_DIR = Path(conversion.__file__).parent / "dummy_files"
+
+#: conversion paths: name -> function(converter, digest, content, mime_type, size)
+PATHS: dict[str, Callable[..., Any]] = {
+    "pdf": lambda c, d, b, m, size: c.to_pdf(d, b, m),
+    "text": lambda c, d, b, m, size: c.to_text(d, b, m),
+    "image": lambda c, d, b, m, size: c.to_image(d, b, m, 0, size),
+    "metadata": lambda c, d, b, m, size: c.get_metadata(d, b, m),
+}
+
+
+@click.command()
+@click.option(
+    "--corpus",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Directory of sample documents (default: bundled samples).",
+)
+@click.option("--repeat", default=3, help="Conversions of each document, per path.")
+@click.option("--size", default=500, help="Size of page images.")
+@with_appcontext
+def benchmark_conversions(corpus: str | None, repeat: int, size: int):
+    """Run sample documents through each conversion path, and report
+    throughput per handler.
+
+    Conversion results are not cached between runs.
+    """
+    corpus_dir = Path(corpus) if corpus else SAMPLES_DIR
+
+    files = sorted(p for p in corpus_dir.iterdir() if p.is_file())
+    if not files:
+        raise click.UsageError(f"No document in {corpus_dir}")
+
+    bench = Converter()
+    for handler in converter.handlers:
+        bench.register_handler(handler)
+
+    sniffer = Magic(mime=True)
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench.init_work_dirs(
+            cache_dir=Path(work_dir, "cache"), tmp_dir=Path(work_dir, "tmp")
+        )
+
+        print(f"{'Document':<24} {'Mimetype':<40} {'Path':<9} {'Mean (ms)':>10}")
+        for path in files:
+            mime_type = sniffer.from_file(str(path))
+            content = path.read_bytes()
+            for name, convert in PATHS.items():
+                result = _run(bench, convert, content, mime_type, size, repeat)
+                print(f"{path.name:<24} {mime_type:<40} {name:<9} {result:>10}")
+
+    print()
+    print(
+        f"{'Operation':<32} {'Outcome':<8} {'Calls':>6} {'Mean (ms)':>10} "
+        f"{'Max (ms)':>10} {'Calls/s':>8} {'Output (kB)':>12}"
+    )
+    for m in bench.metrics.snapshot():
+        print(
+            f"{m['name']:<32} {m['outcome']:<8} {m['count']:>6} "
+            f"{m['mean_time'] * 1000:>10.1f} {m['max_time'] * 1000:>10.1f} "
+            f"{m['throughput']:>8.2f} {m['total_size'] / 1024:>12.1f}"
+        )
+
+
+def _run(
+    bench: Converter,
+    convert: Callable[..., Any],
+    content: bytes,
+    mime_type: str,
+    size: int,
+    repeat: int,
+) -> str:
+    durations = []
+    for _i in range(repeat):
+        # new digest: nothing is read from cache
+        digest = uuid.uuid4().hex
+        start = time.perf_counter()
+        try:
+            convert(bench, digest, content, mime_type, size)
+        except (ConversionError, IndexError) as e:
+            return type(e).__name__
+        durations.append(time.perf_counter() - start)
+
+    return f"{sum(durations) / len(durations) * 1000:.1f}"
@@ -0,0 +1,357 @@
+""""""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+from PIL import Image
+from tqdm import tqdm
+
+from abilian.core.extensions import db
+from abilian.core.models.blob import Blob
+from abilian.core.models.subjects import User
+from abilian.services import image
+from abilian.services.image import (
+    BEST,
+    CROP,
+    FAST,
+    FIT,
+    ImageCache,
+    cache_key,
+    resize,
+)
+
+logger = logging.getLogger(__name__)
+
+#: bundled sample images
+IMAGE_SAMPLES_DIR = Path(image.__file__).parent / "tests"
+
+#: default checkpoint of `generate-renditions`, in instance folder
+RENDITIONS_CHECKPOINT = "image_renditions.json"
+
+Rendition = Tuple[int, str, Optional[str]]
+#: `(id, digest, content loader)`
+SourceItem = Tuple[int, Optional[str], Callable[[], Optional[bytes]]]
+
+
+@click.command()
+@click.option(
+    "--corpus",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Directory of sample images (default: bundled samples).",
+)
+@click.option(
+    "--megapixels",
+    default=24.0,
+    help="Enlarge samples to this size, like camera photos (0: as is).",
+)
+@click.option("--sizes", default="32,64,500", help="Comma separated sizes.")
+@click.option("--repeat", default=5, help="Resizes of each image, per setting.")
+def benchmark_resize(corpus: str | None, megapixels: float, sizes: str, repeat: int):
+    """Compare "fast" and "best" resize qualities on sample images.
+
+    Resized images are not cached.
+    """
+    corpus_dir = Path(corpus) if corpus else IMAGE_SAMPLES_DIR
+    samples = []
+    for path in sorted(p for p in corpus_dir.iterdir() if p.is_file()):
+        try:
+            content = _prepare(path, megapixels)
+        except OSError:
+            # not an image
+            continue
+        samples.append((path.name, content))
+
+    if not samples:
+        raise click.UsageError(f"No image in {corpus_dir}")
+
+    target_sizes = [int(s) for s in sizes.split(",")]
+
+    cache = image.image_cache
+    image.image_cache = ImageCache(max_memory=0)
+    try:
+        print(
+            f"{'Image':<24} {'Pixels':>11} {'Mode':<5} {'Size':>5} "
+            f"{'Best (ms)':>10} {'Fast (ms)':>10} {'Speedup':>8}"
+        )
+        for name, content in samples:
+            with Image.open(BytesIO(content)) as img:
+                pixels = "{}x{}".format(*img.size)
+            for mode in (FIT, CROP):
+                for size in target_sizes:
+                    best = _time(content, size, mode, BEST, repeat)
+                    fast = _time(content, size, mode, FAST, repeat)
+                    print(
+                        f"{name:<24} {pixels:>11} {mode:<5} {size:>5} "
+                        f"{best * 1000:>10.1f} {fast * 1000:>10.1f} "
+                        f"{best / fast:>7.1f}x"
+                    )
+    finally:
+        image.image_cache = cache
+
+
+def _prepare(path: Path, megapixels: float) -> bytes:
+    content = path.read_bytes()
+    if not megapixels:
+        return content
+
+    with Image.open(BytesIO(content)) as img:
+        factor = math.sqrt(megapixels * 1e6 / (img.width * img.height))
+        if factor <= 1:
+            return content
+        img = img.convert("RGB")
+        img = img.resize(
+            (int(img.width * factor), int(img.height * factor)), Image.BICUBIC
+        )
+        output = BytesIO()
+        img.save(output, "JPEG", quality=90)
+        return output.getvalue()
+
+
+def _time(content: bytes, size: int, mode: str, quality: str, repeat: int) -> float:
+    """Mean duration of a resize, in seconds."""
+    start = time.perf_counter()
+    for _i in range(repeat):
+        resize(content, size, size, mode=mode, quality=quality)
+    return (time.perf_counter() - start) / repeat
+
+
+@click.command()
+@click.option(
+    "--workers", default=0, help="Number of processes (default: number of CPUs)."
+)
+@click.option("--batch-size", default=50, help="Rows read at once.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=f"Progress file (default: {RENDITIONS_CHECKPOINT} in instance folder).",
+)
+@click.option("--restart", is_flag=True, help="Ignore progress of previous runs.")
+@click.option("--blobs/--no-blobs", default=True, help="Process image blobs.")
+@click.option("--users/--no-users", default=True, help="Process user photos.")
+@with_appcontext
+def generate_renditions(
+    workers: int,
+    batch_size: int,
+    checkpoint: str | None,
+    restart: bool,
+    blobs: bool,
+    users: bool,
+):
+    """Generate thumbnails of image blobs and user photos in the image cache.
+
+    Rows are read by increasing id, in batches resized by a pool of
+    processes. The last id done is saved after each batch: an interrupted
+    run resumes there, and a later run only processes new rows. Thumbnails
+    already cached are skipped.
+    """
+    # imported here: views register listeners and templates helpers
+    from abilian.web.views.images import avatar_renditions, blob_renditions
+
+    if users:
+        # thumbnails of photos without digest could not be looked up
+        count = _backfill_photo_digests(batch_size)
+        if count:
+            click.echo(f"users: {count} photo digests stored")
+
+    checkpoint_path = Path(
+        checkpoint or Path(current_app.instance_path, RENDITIONS_CHECKPOINT)
+    )
+    progress: dict[str, int] = {}
+    if not restart and checkpoint_path.exists():
+        progress = json.loads(checkpoint_path.read_text())
+
+    kinds = []
+    if blobs:
+        kinds.append(("blobs", _blob_batches, blob_renditions()))
+    if users:
+        kinds.append(("users", _user_batches, avatar_renditions()))
+
+    cache = image.image_cache
+    if cache.cache_dir is None:
+        raise click.UsageError("No image cache directory (IMAGE_CACHE_DIR)")
+    init_args = (str(cache.cache_dir), cache.max_size, image.default_quality)
+
+    with ProcessPoolExecutor(
+        max_workers=workers or None, initializer=_init_worker, initargs=init_args
+    ) as executor:
+        for kind, batches, renditions in kinds:
+            if not renditions:
+                continue
+
+            start = time.perf_counter()
+            sources = rendered = failed = 0
+            bar = tqdm(desc=kind, unit=" images")
+            for last_id, items in batches(progress.get(kind, 0), batch_size):
+                futures = {}
+                for item_id, source_id, load in items:
+                    missing = _missing(renditions, source_id)
+                    if not missing:
+                        continue
+                    content = load()
+                    if content is None:
+                        logger.warning("%s %d: no content", kind, item_id)
+                        failed += 1
+                        continue
+                    futures[item_id] = executor.submit(
+                        _render, content, source_id, missing
+                    )
+
+                for item_id, future in futures.items():
+                    try:
+                        rendered += future.result()
+                    except Exception:
+                        logger.warning(
+                            "%s %d: can't generate thumbnails",
+                            kind,
+                            item_id,
+                            exc_info=True,
+                        )
+                        failed += 1
+
+                sources += len(futures)
+                progress[kind] = last_id
+                checkpoint_path.write_text(json.dumps(progress))
+                bar.update(len(items))
+                elapsed = time.perf_counter() - start
+                bar.set_postfix(renditions=rendered, per_s=f"{rendered / elapsed:.1f}")
+                db.session.expunge_all()
+            bar.close()
+
+            elapsed = time.perf_counter() - start
+            click.echo(
+                f"{kind}: {rendered} thumbnails of {sources} images "
+                f"({failed} failed) in {elapsed:.1f}s, "
+                f"{rendered / elapsed if elapsed else 0:.1f} thumbnails/s"
+            )
+
+
+@click.command()
+@click.option("--batch-size", default=50, help="Users updated per transaction.")
+@with_appcontext
+def backfill_photo_digests(batch_size: int):
+    """Store digest of user photos set before digests were recorded.
+
+    Avatar URLs and thumbnails of these photos then get stable cache keys.
+    """
+    count = _backfill_photo_digests(batch_size)
+    click.echo(f"Done: {count} photo digests stored.")
+
+
+def _backfill_photo_digests(batch_size: int) -> int:
+    table = User.__table__
+    select = (
+        sa.select([table.c.id, table.c.photo])
+        .where(table.c.photo_digest.is_(None))
+        .where(table.c.photo.isnot(None))
+        .order_by(table.c.id)
+        .limit(batch_size)
+    )
+    update = (
+        table.update()
+        .where(table.c.id == sa.bindparam("_id"))
+        .values(photo_digest=sa.bindparam("photo_digest"))
+    )
+
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(select.where(table.c.id > last_id)).fetchall()
+        if not rows:
+            return count
+
+        params = [
+            {"_id": user_id, "photo_digest": hashlib.md5(photo).hexdigest()}
+            for user_id, photo in rows
+        ]
+        db.session.execute(update, params)
+        db.session.commit()
+        last_id = rows[-1][0]
+        count += len(params)
+
+
+def _missing(renditions: List[Rendition], source_id: str | None) -> List[Rendition]:
+    if source_id is None:
+        # digest unknown: computed from content by `resize`
+        return renditions
+    return [
+        (size, mode, fmt)
+        for size, mode, fmt in renditions
+        if cache_key(source_id, size, size, mode, fmt) not in image.image_cache
+    ]
+
+
+def _blob_batches(
+    after: int, batch_size: int
+) -> Iterator[tuple[int, List[SourceItem]]]:
+    """Batches of image blobs with id > `after`: `(last id, items)`."""
+    while True:
+        batch = (
+            Blob.query.filter(Blob.id > after).order_by(Blob.id).limit(batch_size).all()
+        )
+        if not batch:
+            return
+        after = batch[-1].id
+        items = [
+            (blob.id, blob.meta.get("md5"), _blob_loader(blob))
+            for blob in batch
+            if (blob.meta.get("mimetype") or "").startswith("image/")
+        ]
+        yield after, items
+
+
+def _user_batches(
+    after: int, batch_size: int
+) -> Iterator[tuple[int, List[SourceItem]]]:
+    """Batches of users with a photo, like :func:`_blob_batches`. Photos are
+    loaded only when a thumbnail is missing."""
+    while True:
+        batch = (
+            db.session.query(User.id, User.photo_digest)
+            .filter(User.id > after, User.photo.isnot(None))
+            .order_by(User.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return
+        after = batch[-1].id
+        items = [(user_id, digest, _photo_loader(user_id)) for user_id, digest in batch]
+        yield after, items
+
+
+def _blob_loader(blob: Blob) -> Callable[[], bytes | None]:
+    return lambda: blob.value
+
+
+def _photo_loader(user_id: int) -> Callable[[], bytes | None]:
+    query = db.session.query(User.photo).filter(User.id == user_id)
+    return query.scalar
+
+
+def _init_worker(cache_dir: str, max_size: int, quality: str):
+    # each worker writes to the shared directory; nothing is kept in memory
+    image.image_cache = ImageCache(
+        max_memory=0, cache_dir=Path(cache_dir), max_size=max_size
+    )
+    image.default_quality = quality
+
+
+def _render(content: bytes, source_id: str | None, renditions: List[Rendition]) -> int:
+    for size, mode, fmt in renditions:
+        image.resize(content, size, size, mode=mode, format=fmt, source_id=source_id)
+    return len(renditions)
@@ -0,0 +1,308 @@
+""""""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Iterator
+from uuid import UUID
+
+import click
+from flask.cli import with_appcontext
+
+from abilian.core.extensions import db
+from abilian.core.models.blob import Blob
+from abilian.services import get_service
+from abilian.services.repository.backends import FileSystemBackend, rel_path
+from abilian.services.repository.compression import (
+    COMPRESSED_SUFFIX,
+    is_compressed,
+    open_file,
+)
+
+CHUNK_SIZE = 256 * 1024
+
+
+@click.command()
+@click.option("--delete/--no-delete", default=False, help="Remove orphan files.")
+@click.option("--verify/--no-verify", default=False, help="Check md5 digests.")
+@click.option("--workers", default=4, help="Number of I/O threads.")
+@click.option("--batch-size", default=500, help="Blob rows checked per query.")
+@click.option("--max-rate", default=0.0, help="Max files per second (0: no limit).")
+@click.option("--min-age", default=3600, help="Ignore files younger than this (s).")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="File used to save progress and resume an interrupted run.",
+)
+@with_appcontext
+def check_repository(
+    delete: bool,
+    verify: bool,
+    workers: int,
+    batch_size: int,
+    max_rate: float,
+    min_age: int,
+    checkpoint: str | None,
+):
+    """Check repository integrity and find orphan files.
+
+    Reports files without a `Blob` row, `Blob` rows without a file,
+    (optionally) files whose content doesn't match their md5 digest, and
+    stalled session repository transaction directories. Orphan files and
+    stalled transactions are removed only with `--delete`.
+    """
+    checker = RepositoryChecker(
+        delete=delete,
+        verify=verify,
+        workers=workers,
+        batch_size=batch_size,
+        max_rate=max_rate,
+        min_age=min_age,
+        checkpoint=Path(checkpoint) if checkpoint else None,
+    )
+    checker.run()
+    checker.print_report()
+
+
+class Throttle:
+    """Limit the rate of an operation shared between threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RepositoryChecker:
+    """Cross-check the repository tree against the `blob` table.
+
+    The tree is scanned one top-level fan-out directory at a time by a thread
+    pool; database lookups are done in the main thread, in batches. Progress
+    is saved after each directory when a checkpoint file is given.
+    """
+
+    def __init__(
+        self,
+        delete: bool = False,
+        verify: bool = False,
+        workers: int = 4,
+        batch_size: int = 500,
+        max_rate: float = 0.0,
+        min_age: int = 3600,
+        checkpoint: Path | None = None,
+    ):
+        self.delete = delete
+        self.verify = verify
+        self.workers = workers
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.checkpoint = checkpoint
+        self.throttle = Throttle(max_rate)
+
+        backend = get_service("repository").app_state.backend
+        if not isinstance(backend, FileSystemBackend):
+            raise click.UsageError("Only the filesystem backend can be checked.")
+        self.root: Path = backend.path
+        self.transactions_root: Path = get_service(
+            "session_repository"
+        ).app_state.path
+
+        self.state: dict[str, Any] = {
+            "done_dirs": [],
+            "last_blob_id": 0,
+            "scanned": 0,
+            "orphans": [],
+            "missing": [],
+            "corrupted": [],
+            "stalled_transactions": [],
+        }
+        if checkpoint is not None and checkpoint.exists():
+            with checkpoint.open("rt") as f:
+                self.state.update(json.load(f))
+
+    def save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+
+        tmp_path = self.checkpoint.with_name(f"{self.checkpoint.name}.tmp")
+        with tmp_path.open("wt") as f:
+            json.dump(self.state, f)
+        tmp_path.replace(self.checkpoint)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            self.check_files()
+            self.check_blobs()
+        self.check_transactions()
+
+        # run is complete: next run must start over
+        if self.checkpoint is not None and self.checkpoint.exists():
+            self.checkpoint.unlink()
+
+    # files -> blobs
+    def check_files(self):
+        done = set(self.state["done_dirs"])
+        top_dirs = sorted(p for p in self.root.iterdir() if p.name not in done)
+        futures = {self.executor.submit(self._scan_dir, d): d for d in top_dirs}
+
+        for future in as_completed(futures):
+            top_dir = futures[future]
+            files = future.result()
+            self.state["scanned"] += len(files)
+
+            for start in range(0, len(files), self.batch_size):
+                self._check_files_batch(files[start : start + self.batch_size])
+
+            self.state["done_dirs"].append(top_dir.name)
+            self.save_checkpoint()
+
+    def _scan_dir(self, top_dir: Path) -> list[tuple[Path, UUID | None]]:
+        """List files under a fan-out directory, with their uuid."""
+        if not top_dir.is_dir():
+            return [(top_dir, None)]
+
+        min_mtime = time.time() - self.min_age
+        result = []
+        for path in top_dir.glob("**/*"):
+            if not path.is_file():
+                continue
+
+            self.throttle.wait()
+            if path.stat().st_mtime > min_mtime:
+                # may be in the middle of a commit
+                continue
+
+            suffix = COMPRESSED_SUFFIX if is_compressed(path) else ""
+            try:
+                uuid = UUID(path.name[: len(path.name) - len(suffix)])
+            except ValueError:
+                uuid = None
+            else:
+                if path.relative_to(self.root) != rel_path(uuid, suffix):
+                    uuid = None
+            result.append((path, uuid))
+
+        return result
+
+    def _check_files_batch(self, files: list[tuple[Path, UUID | None]]):
+        uuids = [uuid for _path, uuid in files if uuid is not None]
+        rows = (
+            db.session.query(Blob.uuid, Blob.meta).filter(Blob.uuid.in_(uuids)).all()
+        )
+        digests = {uuid: meta.get("md5") for uuid, meta in rows}
+
+        to_verify = []
+        for path, uuid in files:
+            if uuid not in digests:
+                self._orphan(path)
+            elif self.verify and digests[uuid]:
+                to_verify.append((path, digests[uuid]))
+
+        futures = [
+            self.executor.submit(self._verify, path, md5) for path, md5 in to_verify
+        ]
+        for future in as_completed(futures):
+            path = future.result()
+            if path is not None:
+                self.state["corrupted"].append(str(path))
+
+    def _orphan(self, path: Path):
+        self.state["orphans"].append(str(path))
+        if self.delete:
+            path.unlink()
+
+    def _verify(self, path: Path, md5: str) -> Path | None:
+        """Return `path` if its content doesn't match `md5`."""
+        self.throttle.wait()
+        digest = hashlib.md5()
+        with open_file(path) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        return None if digest.hexdigest() == md5 else path
+
+    # blobs -> files
+    def check_blobs(self):
+        repository = get_service("repository")
+        while True:
+            rows = (
+                db.session.query(Blob.id, Blob.uuid)
+                .filter(Blob.id > self.state["last_blob_id"])
+                .order_by(Blob.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            exists = self.executor.map(
+                self._exists, (uuid for _id, uuid in rows), repeat(repository)
+            )
+            for (blob_id, uuid), found in zip(rows, exists):
+                if not found:
+                    self.state["missing"].append([blob_id, str(uuid)])
+
+            self.state["last_blob_id"] = rows[-1][0]
+            self.save_checkpoint()
+
+    def _exists(self, uuid: UUID, repository: Any) -> bool:
+        self.throttle.wait()
+        return repository.exists(uuid)
+
+    # leftovers of crashed processes
+    def check_transactions(self):
+        if not self.transactions_root.exists():
+            return
+
+        min_mtime = time.time() - self.min_age
+        for path in self.transactions_root.iterdir():
+            if path.stat().st_mtime > min_mtime:
+                continue
+
+            self.state["stalled_transactions"].append(str(path))
+            if self.delete:
+                if path.is_dir():
+                    shutil.rmtree(str(path), ignore_errors=True)
+                else:
+                    path.unlink()
+
+    def print_report(self):
+        state = self.state
+
+        def print_list(title: str, items: Iterator[Any]):
+            items = list(items)
+            print(f"{title}: {len(items)}")
+            for item in items:
+                print(f"    {item}")
+
+        print(f"Files scanned: {state['scanned']}")
+        action = " (removed)" if self.delete else ""
+        print_list(f"Orphan files{action}", state["orphans"])
+        print_list(
+            "Blobs without file",
+            (f"id={blob_id} uuid={uuid}" for blob_id, uuid in state["missing"]),
+        )
+        if self.verify:
+            print_list("Corrupted files", state["corrupted"])
+        print_list(f"Stalled transactions{action}", state["stalled_transactions"])
@@ -60,6 +60,76 @@ class DefaultConfig:
     TRACKING_CODE = ""  # tracking code for web analytics to insert before </body>
     MAIL_ADDRESS_TAG_CHAR = None
 
+    # Audit entries: collect them as plain rows during the transaction and
+    # insert them with a single statement at commit, instead of adding
+    # AuditEntry objects to each flush.
+    AUDIT_BULK_INSERT = False
+
+    # Repository storage: "filesystem" or "s3" (see
+    # abilian.services.repository.backends for REPOSITORY_S3 settings)
+    REPOSITORY_BACKEND = "filesystem"
+    REPOSITORY_S3: dict[str, Any] = {}
+
+    # Store repository files compressed (already compressed types are skipped)
+    REPOSITORY_COMPRESSION = False
+
+    # Document conversions: number of worker threads (0: convert in the
+    # requesting thread) and maximum number of queued conversions.
+    CONVERSION_WORKERS = 0
+    CONVERSION_MAX_PENDING = 100
+
+    # Conversion cache bounds: maximum size in bytes, and maximum age in
+    # seconds since last access (0: no limit). With CONVERSION_CACHE_INDEX,
+    # access times are tracked in a SQLite database instead of file times.
+    CONVERSION_CACHE_MAX_SIZE = 0
+    CONVERSION_CACHE_MAX_AGE = 0
+    CONVERSION_CACHE_INDEX = False
+
+    # Convert new blobs in background (Celery), to the renditions listed by
+    # CONVERSION_PREWARM_POLICY for their mimetype (see
+    # `abilian.services.conversion.prewarm`; None: default policy).
+    CONVERSION_PREWARM = False
+    CONVERSION_PREWARM_POLICY = None
+    CONVERSION_PREWARM_IMAGE_SIZE = 500
+
+    # Extract text, render pages and read information of PDF documents up
+    # to this size (bytes) in process, when `pypdfium2` is installed.
+    CONVERSION_PDFIUM = True
+    CONVERSION_PDFIUM_MAX_SIZE = 20 * 1024**2
+
+    # Resized images: memory budget of each process, in bytes, in front of a
+    # directory shared by all processes (default: "image_cache" in instance
+    # folder), bounded by IMAGE_CACHE_MAX_SIZE bytes (0: no limit).
+    IMAGE_CACHE_MEMORY = 16 * 1024**2
+    IMAGE_CACHE_DIR = None
+    IMAGE_CACHE_MAX_SIZE = 0
+
+    # Image resizing: "best" (Lanczos filter, as in previous versions) or
+    # "fast" (reduced scale decoding of JPEG images, bicubic filter: much
+    # faster for large photos, but slightly different thumbnails).
+    IMAGE_RESIZE_QUALITY = "best"
+
+    # Formats of resized images served to clients which accept them, in order
+    # of preference, e.g. ["WEBP"] ("AVIF" is smaller than "WEBP" but slower to
+    # encode). Others get PNG or JPEG. When set, image responses vary on the
+    # Accept header: caches in front of the application must honor it.
+    IMAGE_FORMATS = []
+
+    # Thumbnails of image blobs generated by `flask generate-renditions`, as
+    # (size, mode) pairs (user photos: avatar sizes). 120 "crop": ImageInput.
+    IMAGE_BLOB_RENDITIONS = [(120, "crop")]
+
+    # Office to PDF conversion: number of persistent LibreOffice instances
+    # (0: start a new process for each document), recycled after N jobs.
+    LIBREOFFICE_POOL_SIZE = 0
+    LIBREOFFICE_POOL_MAX_JOBS = 200
+
+    # File downloads: let the front-end server stream repository files.
+    # One of None (stream from Python), "nginx", "apache" or "lighttpd".
+    FILES_OFFLOAD = None
+    # nginx only: `internal` location aliased to the application data dir.
+    FILES_OFFLOAD_NGINX_PREFIX = "/_protected_files/"
+
 
 default_config: dict[str, Any] = dict(Flask.default_config)
 default_config.update(vars(DefaultConfig))
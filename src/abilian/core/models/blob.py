@@ -6,9 +6,13 @@ References to files stored in a on-disk repository
 from __future__ import annotations
 
 import hashlib
+import mmap
+import shutil
+import tempfile
 import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Union
+from typing import Iterator, Optional, Union
 from typing.io import IO
 
 import sqlalchemy as sa
@@ -22,6 +26,8 @@ from sqlalchemy.types import Integer
 from abilian.core.models.base import Model
 from abilian.core.sqlalchemy import UUID, JSONDict
 
+CHUNK_SIZE = 256 * 1024
+
 
 class Blob(Model):
     """Model for storing large file content.
@@ -56,31 +62,116 @@ class Blob(Model):
 
     @property
     def size(self) -> int:
-        """Return size in bytes of value."""
+        """Return size in bytes of value.
+
+        Size is recorded in `self.meta['size']` when value is set, so that
+        remote content is not fetched to get it.
+        """
+        size = self.meta.get("size")
+        if size is not None:
+            return size
+
+        from abilian.services.repository.compression import file_size
+
         f = self.file
-        return f.stat().st_size if f is not None else 0
+        return file_size(f) if f is not None else 0
 
     @property
     def value(self) -> bytes | None:
         """Binary value content."""
-        v = self.file
-        if v is None:
+        from abilian.services.repository import session_repository as repository
+
+        stream = repository.open(self, self.uuid)
+        if stream is None:
             return None
-        return v.open("rb").read()
+        with stream:
+            return stream.read()
+
+    def open(self) -> IO[bytes]:
+        """Return a read-only binary stream on value content.
+
+        Prefer this to :attr:`value` for large files: content is read by
+        chunks instead of being loaded in memory at once.
+
+        :raises:FileNotFoundError if blob has no file
+        """
+        from abilian.services.repository import session_repository as repository
+
+        stream = repository.open(self, self.uuid)
+        if stream is None:
+            raise FileNotFoundError(f"No file for blob {self.uuid}")
+        return stream
+
+    @contextmanager
+    def mmap(self) -> Iterator[mmap.mmap | bytes]:
+        """Context manager giving a read-only memory map of value content.
+
+        Pages are loaded by the OS on access, so large files can be handed to
+        APIs expecting a bytes-like object without copying them on the heap.
+        Compressed files are first decompressed to an anonymous temporary
+        file. An empty value yields `b""`, since empty files can't be mapped.
+
+        :raises:FileNotFoundError if blob has no file
+        """
+        from abilian.services.repository.compression import is_compressed
+
+        path = self.file
+        if path is None:
+            raise FileNotFoundError(f"No file for blob {self.uuid}")
+
+        if is_compressed(path):
+            f = tempfile.TemporaryFile()
+            with self.open() as stream:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            f.flush()
+        else:
+            f = path.open("rb")
+
+        with f:
+            f.seek(0, 2)
+            if not f.tell():
+                yield b""
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def _compute_md5(self) -> str | None:
+        md5, _size = self._compute_digest()
+        return md5
+
+    def _compute_digest(self) -> tuple[str | None, int]:
+        """Return md5 and size of value, reading it once."""
+        try:
+            stream = self.open()
+        except FileNotFoundError:
+            return None, 0
+
+        digest = hashlib.md5()
+        size = 0
+        with stream:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
 
     @value.setter
     def value(self, value: bytes | str | IO):
         """Store binary content to applications's repository and update
-        `self.meta['md5']`.
+        `self.meta['md5']` and `self.meta['size']`.
 
         :param:content: bytes, or any object with a `read()` method
         :param:encoding: encoding to use when content is Unicode
         """
         from abilian.services.repository import session_repository as repository
 
-        repository.set(self, self.uuid, value)
-        if self.value:
-            self.meta["md5"] = str(hashlib.md5(self.value).hexdigest())
+        content_type = getattr(value, "content_type", None)
+        mimetype = content_type or self.meta.get("mimetype")
+        repository.set(self, self.uuid, value, mimetype=mimetype)
+        md5, size = self._compute_digest()
+        self.meta["size"] = size
+        if size:
+            self.meta["md5"] = md5
 
         filename = getattr(value, "filename", None)
         if filename:
@@ -88,7 +179,6 @@ class Blob(Model):
                 filename = filename.decode("utf-8")
             self.meta["filename"] = filename
 
-        content_type = getattr(value, "content_type", None)
         if content_type:
             self.meta["mimetype"] = content_type
 
@@ -98,20 +188,23 @@ class Blob(Model):
         from abilian.services.repository import session_repository as repository
 
         repository.delete(self, self.uuid)
+        self.meta.pop("size", None)
 
     @property
     def md5(self) -> str:
         """Return md5 from meta, or compute it if absent."""
         md5 = self.meta.get("md5")
         if md5 is None:
-            if self.value:
-                md5 = str(hashlib.md5(self.value).hexdigest())
+            if self.size:
+                md5 = self._compute_md5()
 
         return md5
 
     def __bool__(self) -> bool:
         """A blob is considered falsy if it has no file."""
-        return self.file is not None and self.file.exists()
+        from abilian.services.repository import session_repository as repository
+
+        return repository.exists(self, self.uuid)
 
     # Py3k compat
     __nonzero__ = __bool__
@@ -119,6 +212,9 @@ class Blob(Model):
 
 @listens_for(sa.orm.Session, "after_flush")
 def _blob_propagate_delete_content(session: Session, flush_context: UOWTransaction):
+    from abilian.services.repository import session_repository as repository
+
     deleted = (obj for obj in session.deleted if isinstance(obj, Blob))
     for blob in deleted:
-        del blob.value
+        # not `del blob.value`: meta of a deleted row must not be modified
+        repository.delete(blob, blob.uuid)
@@ -8,6 +8,7 @@ else, like "people" or "principal" ?
 
 from __future__ import annotations
 
+import hashlib
 import random
 import string
 from abc import ABCMeta, abstractmethod
@@ -23,7 +24,14 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, deferred, relationship
 from sqlalchemy.orm.mapper import Mapper
 from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
-from sqlalchemy.types import Boolean, DateTime, Integer, LargeBinary, UnicodeText
+from sqlalchemy.types import (
+    Boolean,
+    DateTime,
+    Integer,
+    LargeBinary,
+    String,
+    UnicodeText,
+)
 
 from abilian.core import sqlalchemy as sa_types
 from abilian.core.util import fqcn
@@ -199,6 +207,9 @@ class User(Principal, UserMixin, db.Model):
     password = Column(UnicodeText, default="*", info={"audit_hide_content": True})
 
     photo = deferred(Column(LargeBinary))
+    #: md5 hex digest of `photo`, maintained when it is set: photo URLs are
+    #: built without loading it
+    photo_digest = Column(String(32), nullable=True, info=SYSTEM)
 
     last_active = Column(DateTime, info=SYSTEM)
     locale = Column(sa_types.Locale, nullable=True, default=None)
@@ -310,6 +321,11 @@ def _add_user_indexes(mapper: Mapper, cls: type[User]):
     idx.info["engines"] = ("postgresql",)
 
 
+@listens_for(User.photo, "set", propagate=True)
+def _set_photo_digest(user: User, value: bytes | None, oldvalue, initiator):
+    user.photo_digest = hashlib.md5(value).hexdigest() if value else None
+
+
 @set_entity_type
 class Group(Principal, db.Model):
     __indexable__ = False
@@ -11,6 +11,7 @@ from io import StringIO
 from pathlib import Path
 
 from flask import Flask
+from pytest import raises
 
 from abilian.core.models.blob import Blob
 from abilian.core.sqlalchemy import SQLAlchemy
@@ -47,6 +48,11 @@ def test_md5(app: Flask, db: SQLAlchemy):
 def test_size(app: Flask, db: SQLAlchemy):
     blob = Blob("test")
     assert blob.size == 4
+    assert blob.meta["size"] == 4
+
+    del blob.value
+    assert "size" not in blob.meta
+    assert blob.size == 0
 
 
 def test_filename(app: Flask, db: SQLAlchemy):
@@ -149,3 +155,37 @@ def test_value(app: Flask, db: SQLAlchemy):
 
     session.commit()
     assert repository.get(blob.uuid) is None
+
+
+def test_open(app: Flask, db: SQLAlchemy):
+    blob = Blob(b"some content")
+    with blob.open() as f:
+        assert f.read() == b"some content"
+
+    blob.uuid = uuid.uuid4()
+    with raises(FileNotFoundError):
+        blob.open()
+
+
+def test_mmap(app: Flask, db: SQLAlchemy):
+    blob = Blob(b"some content")
+    with blob.mmap() as data:
+        assert data[:4] == b"some"
+        assert len(data) == 12
+
+    blob = Blob(b"")
+    with blob.mmap() as data:
+        assert data == b""
+
+
+def test_mmap_compressed(app: Flask, db: SQLAlchemy):
+    repository.app_state.compress = True
+    content = b"some content" * 1000
+    blob = Blob(content)
+    db.session.add(blob)
+    db.session.commit()
+
+    with blob.mmap() as data:
+        assert data[:] == content
+    assert blob.value == content
+    assert blob.size == len(content)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import hashlib
+
 from flask import Flask
 
 from abilian.core.models.subjects import Group, User
@@ -28,6 +30,17 @@ def test_user(app: Flask, db: SQLAlchemy):
     assert not user.is_online
 
 
+def test_photo_digest():
+    user = User(email="test@test.com")
+    assert user.photo_digest is None
+
+    user.photo = b"photo"
+    assert user.photo_digest == hashlib.md5(b"photo").hexdigest()
+
+    user.photo = None
+    assert user.photo_digest is None
+
+
 def test_group(app: Flask, db: SQLAlchemy):
     group = Group(name="test_group")
     db.session.add(group)
@@ -14,6 +14,7 @@ from .base import Service, ServiceState
 # Don't remove (used to force import order)
 assert Service, ServiceState
 
+from . import image as image_service
 from .activity import ActivityService
 from .antivirus import service as antivirus
 from .audit import audit_service
@@ -82,16 +82,26 @@ class AntiVirusService(Service):
         return res
 
     def _scan(self, file_or_stream):
-        content = file_or_stream
         if isinstance(file_or_stream, Blob):
-            # py3 compat: bytes == py2 str(). Pathlib uses os.fsencode()
-            file_or_stream = bytes(file_or_stream.file)
-        elif isinstance(file_or_stream, str):
-            file_or_stream = file_or_stream.encode(os.fsencode)
+            # repository files may be stored compressed: scan actual content
+            try:
+                stream = file_or_stream.open()
+            except FileNotFoundError:
+                logger.warning("No file to scan for blob %s", file_or_stream.uuid)
+                return None
+            with stream:
+                return self._scan_stream(stream)
+
+        if isinstance(file_or_stream, str):
+            file_or_stream = os.fsencode(file_or_stream)
 
         if isinstance(file_or_stream, bytes):
-            content = open(file_or_stream, "rb")
+            with open(file_or_stream, "rb") as f:
+                return self._scan_stream(f)
+
+        return self._scan_stream(file_or_stream)
 
+    def _scan_stream(self, content):
         if content.seekable():
             pos = content.tell()
             content.seek(0, io.SEEK_END)
@@ -10,16 +10,20 @@ TODO: In the future, we may decide to:
 
 from __future__ import annotations
 
+import base64
+import json
 import logging
 import pickle
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 from typing import Any
+from uuid import UUID
 
 from flask import current_app
 from flask_sqlalchemy import BaseQuery
 from sqlalchemy import LargeBinary
 from sqlalchemy.orm import relationship
-from sqlalchemy.orm.base import NEVER_SET
+from sqlalchemy.orm.base import NEVER_SET, NO_VALUE
 from sqlalchemy.schema import Column, ForeignKey
 from sqlalchemy.types import DateTime, Integer, String, UnicodeText
 
@@ -32,6 +36,12 @@ UPDATE = 1
 DELETION = 2
 RELATED = 1 << 7
 
+#: version of the JSON serialization of changes
+CHANGES_FORMAT = 1
+
+#: replaces values that can't be decoded to text
+FORMAT_ERROR_VALUE = "[[Somme error occurred. Working on it]]"
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,6 +65,48 @@ class Changes:
 
         return c
 
+    @staticmethod
+    def from_json(data: str) -> Changes:
+        return Changes._from_dict(json.loads(data))
+
+    @staticmethod
+    def _from_dict(data: dict[str, Any]) -> Changes:
+        c = Changes()
+        for name, value in data.get("columns", {}).items():
+            if isinstance(value, dict):
+                c.columns[name] = Changes._from_dict(value)
+            else:
+                c.columns[name] = tuple(decode_value(v) for v in value)
+        for name, (appended, removed) in data.get("collections", {}).items():
+            c.collections[name] = (appended, removed)
+        return c
+
+    def to_json(self) -> str:
+        """Serialize changes, as formatted by
+        :meth:`AuditEntry._format_changes` (collections items are strings).
+
+        Values are encoded by :func:`encode_value`.
+        """
+        data = self._to_dict()
+        data["format"] = CHANGES_FORMAT
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    def _to_dict(self) -> dict[str, Any]:
+        columns: dict[str, Any] = {}
+        for name, value in self.columns.items():
+            if isinstance(value, Changes):
+                columns[name] = value._to_dict()
+            else:
+                columns[name] = [encode_value(v) for v in value]
+
+        data: dict[str, Any] = {"columns": columns}
+        if self.collections:
+            data["collections"] = {
+                name: [list(appended), list(removed)]
+                for name, (appended, removed) in self.collections.items()
+            }
+        return data
+
     def set_column_changes(self, name: str, old_value: Any, new_value: Any):
         self.columns[name] = (old_value, new_value)
 
@@ -84,6 +136,87 @@ class Changes:
         return bool(self.columns) or bool(self.collections)
 
 
+_SYMBOLS = {"never_set": NEVER_SET, "no_value": NO_VALUE}
+
+_DECODERS = {
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "time": time.fromisoformat,
+    "timedelta": lambda v: timedelta(seconds=v),
+    "decimal": Decimal,
+    "uuid": UUID,
+    "bytes": base64.b64decode,
+    "tuple": lambda v: tuple(decode_value(i) for i in v),
+    "set": lambda v: {decode_value(i) for i in v},
+    "dict": lambda v: {k: decode_value(i) for k, i in v.items()},
+    "repr": str,
+}
+
+
+def encode_value(value: Any) -> Any:
+    """JSON representation of a column value.
+
+    JSON types are kept as is; other values are tagged: `{"$t": type, "v":
+    value}`. Dicts are always tagged, so they can't be mistaken for a tagged
+    value. Unknown types are stored as their string representation (type
+    "repr"), decoded as strings.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, tuple):
+        return {"$t": "tuple", "v": [encode_value(v) for v in value]}
+    for name, symbol in _SYMBOLS.items():
+        if value is symbol:
+            return {"$t": name}
+
+    # datetime is a subclass of date
+    if isinstance(value, datetime):
+        return {"$t": "datetime", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {"$t": "date", "v": value.isoformat()}
+    if isinstance(value, time):
+        return {"$t": "time", "v": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"$t": "timedelta", "v": value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {"$t": "decimal", "v": str(value)}
+    if isinstance(value, UUID):
+        return {"$t": "uuid", "v": str(value)}
+    if isinstance(value, bytes):
+        return {"$t": "bytes", "v": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, (set, frozenset)):
+        return {"$t": "set", "v": [encode_value(v) for v in value]}
+    if isinstance(value, dict):
+        return {"$t": "dict", "v": {str(k): encode_value(v) for k, v in value.items()}}
+    return {"$t": "repr", "v": str(value)}
+
+
+def decode_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+
+    type_ = value["$t"]
+    if type_ in _SYMBOLS:
+        return _SYMBOLS[type_]
+    return _DECODERS[type_](value["v"])
+
+
+def load_pickled_changes(data: bytes) -> Changes | dict:
+    """Unpickle legacy changes (may have been pickled by Python 2).
+
+    :raises: exceptions of :func:`pickle.loads`
+    """
+    # XXX: this workaround may or may not work
+    try:
+        return pickle.loads(data, encoding="utf-8")
+    except (UnicodeDecodeError, TypeError):
+        return pickle.loads(data, encoding="bytes")
+
+
 class AuditEntry(db.Model):
     """Logs modifications to auditable classes."""
 
@@ -104,6 +237,10 @@ class AuditEntry(db.Model):
     user_id = Column(Integer, ForeignKey(User.id))
     user = relationship(User, foreign_keys=user_id)
 
+    #: serialized :class:`Changes`, see :meth:`Changes.to_json`
+    changes_json = Column(UnicodeText)
+
+    #: legacy serialization, read when `changes_json` is not set
     changes_pickle = Column(LargeBinary)
 
     query: BaseQuery
@@ -127,21 +264,29 @@ class AuditEntry(db.Model):
         return self.type & RELATED
 
     def get_changes(self) -> Changes:
-        # Using Pickle here instead of JSON because we need to pickle values
-        # such as dates. This could make schema migration more difficult,
-        # though.
-        #
-        # Convoluted and buggy code below to manage the PY2 -> PY3 transition
-        if self.changes_pickle:
-            # XXX: this workaround may or may not work
+        """Decoded changes, kept until the serialized value is changed: only
+        entries whose changes are displayed are decoded, once."""
+        data = self.changes_json or self.changes_pickle
+        cached = getattr(self, "_decoded_changes", None)
+        if cached is not None and cached[0] is data:
+            return cached[1]
+
+        changes = self._decode_changes()
+        self._decoded_changes = (data, changes)
+        return changes
+
+    def _decode_changes(self) -> Changes:
+        if self.changes_json:
+            changes = Changes.from_json(self.changes_json)
+
+        # Legacy entries. Convoluted and buggy code below to manage the
+        # PY2 -> PY3 transition
+        elif self.changes_pickle:
             try:
-                changes = pickle.loads(self.changes_pickle, encoding="utf-8")
-            except (UnicodeDecodeError, TypeError):
-                try:
-                    changes = pickle.loads(self.changes_pickle, encoding="bytes")
-                except Exception:
-                    logger.warning("migration error on audit entry:", exc_info=True)
-                    changes = Changes()
+                changes = load_pickled_changes(self.changes_pickle)
+            except Exception:
+                logger.warning("migration error on audit entry:", exc_info=True)
+                changes = Changes()
 
             if isinstance(changes, dict):
                 changes = Changes.from_legacy(changes)
@@ -179,12 +324,18 @@ class AuditEntry(db.Model):
         return changes
 
     def set_changes(self, changes: Changes):
-        changes = self._format_changes(changes)
-        self.changes_pickle = pickle.dumps(changes, protocol=2)
+        self.changes_json = self.serialize_changes(changes)
+        self.changes_pickle = None
 
     changes = property(get_changes, set_changes)
 
-    def _format_changes(self, changes: Changes) -> Changes:
+    @staticmethod
+    def serialize_changes(changes: Changes) -> str:
+        """Value of `changes_json` for `changes`."""
+        return AuditEntry._format_changes(changes).to_json()
+
+    @staticmethod
+    def _format_changes(changes: Changes) -> Changes:
         uchanges = Changes()
         if isinstance(changes, dict):
             changes = Changes.from_legacy(changes)
@@ -194,7 +345,7 @@ class AuditEntry(db.Model):
             uv = []
             if isinstance(v, Changes):
                 # field k is a related model with its own changes
-                uv = self._format_changes(v)
+                uv = AuditEntry._format_changes(v)
             else:
                 for val in v:
                     if isinstance(val, bytes):
@@ -206,7 +357,7 @@ class AuditEntry(db.Model):
                             current_app.logger.error(
                                 "A Unicode error happened on changes %s", repr(changes)
                             )
-                            val = "[[Somme error occurred. Working on it]]"
+                            val = FORMAT_ERROR_VALUE
                     uv.append(val)
                 uv = tuple(uv)
             uchanges.columns[k] = uv
@@ -14,7 +14,7 @@ from inspect import isclass
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
 
 import sqlalchemy as sa
-from flask import current_app, g
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import Model
 from sqlalchemy import event, extract
 from sqlalchemy.orm import Query, Session
@@ -32,6 +32,9 @@ if TYPE_CHECKING:
 
 log = logging.getLogger(__name__)
 
+#: `session.info` key of audit rows to insert at commit (bulk insert mode)
+_ROWS_KEY = "abilian_audit_rows"
+
 
 class AuditableMeta:
     backref_attr: str | None = None
@@ -79,6 +82,8 @@ class AuditService(Service):
 
         if not self._listening:
             event.listen(Session, "after_flush", self.create_audit_entries)
+            event.listen(Session, "before_commit", self.insert_audit_rows)
+            event.listen(Session, "after_soft_rollback", self.discard_audit_rows)
             self._listening = True
 
     def start(self, ignore_state: bool = False):
@@ -231,6 +236,7 @@ class AuditService(Service):
         if not self.running or self.app_state.creating_entries:
             return
 
+        bulk = current_app.config.get("AUDIT_BULK_INSERT", False)
         self.app_state.creating_entries = True
         try:
             # if an error happens during audit creation it should not break the rest of
@@ -244,7 +250,10 @@ class AuditService(Service):
             ):
                 for model in identity_set:
                     try:
-                        entry = self.log(session, model, op)
+                        if bulk:
+                            entry = self.entry_values(model, op)[1]
+                        else:
+                            entry = self.log(session, model, op)
                         if entry:
                             entries.append(entry)
                     except Exception:
@@ -252,13 +261,82 @@ class AuditService(Service):
                             raise
                         log.error("Exception during entry creation", exc_info=True)
 
+            if bulk:
+                if entries:
+                    transaction = session.transaction
+                    rows = session.info.setdefault(_ROWS_KEY, [])
+                    rows.extend((transaction, values) for values in entries)
+            else:
                 session.add_all(entries)
         finally:
             self.app_state.creating_entries = False
 
-    def log(self, session: Session, model: Any, op_type: int) -> AuditEntry | None:
+    def insert_audit_rows(self, session: Session):
+        """Bulk insert mode (config: `AUDIT_BULK_INSERT`): insert audit rows
+        collected during the transaction, with a single statement.
+
+        Rows are inserted in a savepoint, in the committed transaction: audit
+        entries are committed with the changes they log, and a failure is
+        logged without preventing the commit.
+        """
+        if session.transaction.nested:
+            return
+
+        if has_app_context() and current_app.config.get("AUDIT_BULK_INSERT", False):
+            # last flush of the transaction: its audit rows are collected too
+            session.flush()
+        rows = session.info.pop(_ROWS_KEY, None)
+        if not rows:
+            return
+
+        # entities deleted later in the transaction can't be referenced
+        deleted = {
+            values["entity_id"]
+            for _transaction, values in rows
+            if values["type"] == DELETION
+        }
+        params = []
+        for _transaction, values in rows:
+            values = dict(values)
+            if values["_fk_entity_id"] in deleted:
+                values["_fk_entity_id"] = None
+            params.append(values)
+
+        connection = session.connection()
+        savepoint = connection.begin_nested()
+        try:
+            connection.execute(AuditEntry.__table__.insert(), params)
+        except Exception:
+            savepoint.rollback()
+            if current_app.debug or current_app.testing:
+                raise
+            log.error("Exception during audit entries insertion", exc_info=True)
+        else:
+            savepoint.commit()
+
+    def discard_audit_rows(self, session: Session, previous_transaction):
+        rows = session.info.get(_ROWS_KEY)
+        if not rows:
+            return
+
+        if previous_transaction.parent is None:
+            del session.info[_ROWS_KEY]
+            return
+
+        # savepoint rolled back: forget rows collected in it
+        session.info[_ROWS_KEY] = [
+            (transaction, values)
+            for transaction, values in rows
+            if not _is_within(transaction, previous_transaction)
+        ]
+
+    def entry_values(
+        self, model: Any, op_type: int
+    ) -> tuple[Entity | None, dict[str, Any] | None]:
+        """Audited entity and column values of the audit entry logging an
+        operation on `model`; `(None, None)` if it isn't logged."""
         if not self.is_auditable(model):
-            return None
+            return None, None
 
         entity = model
         try:
@@ -273,25 +351,15 @@ class AuditService(Service):
             for attr in meta.related:
                 entity = getattr(entity, attr)
                 if entity is None:
-                    return None
-
-        entry = AuditEntry(type=op_type, user_id=user_id)
-        if op_type != DELETION:
-            # DELETION|RELATED: deletion of a related model is ok: entity is still
-            # here
-            entry.entity = entity
-
-        entry.entity_id = entity.id
-        entry.entity_type = entity.entity_type
+                    return None, None
 
         entity_name = ""
         for attr_name in ("name", "path", "__path_before_delete"):
             if hasattr(entity, attr_name):
                 entity_name = getattr(entity, attr_name)
-        entry.entity_name = entity_name
 
         changes = Changes()
-        op = entry.op
+        op = op_type & ~RELATED
         if op == CREATION:
             for instrumented_attr in meta.audited_attrs:
                 value = getattr(model, instrumented_attr.key)
@@ -305,7 +373,7 @@ class AuditService(Service):
         elif op == UPDATE:
             changes = getattr(model, "__changes__", changes)
             if not changes:
-                return None
+                return None, None
 
         if hasattr(model, "__changes__"):
             del model.__changes__
@@ -324,7 +392,27 @@ class AuditService(Service):
             changes = Changes()
             changes.set_related_changes(related_name, related_changes)
 
-        entry.changes = changes
+        return entity, {
+            "happened_at": datetime.utcnow(),
+            "type": op_type,
+            "user_id": user_id,
+            # DELETION|RELATED: deletion of a related model is ok: entity is
+            # still here
+            "_fk_entity_id": entity.id if op_type != DELETION else None,
+            "entity_id": entity.id,
+            "entity_type": entity.entity_type,
+            "entity_name": entity_name,
+            "changes_json": AuditEntry.serialize_changes(changes),
+        }
+
+    def log(self, session: Session, model: Any, op_type: int) -> AuditEntry | None:
+        entity, values = self.entry_values(model, op_type)
+        if values is None:
+            return None
+
+        entry = AuditEntry(**values)
+        if entry.type != DELETION:
+            entry.entity = entity
         return entry
 
     def entries_for(self, entity, limit=None):
@@ -341,6 +429,14 @@ class AuditService(Service):
 audit_service = AuditService()
 
 
+def _is_within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
 def format_large_value(value: Any) -> Any:
     try:
         if len(value) > 1000:
@@ -3,6 +3,8 @@
 from __future__ import annotations
 
 import datetime
+import pickle
+from decimal import Decimal
 from itertools import count
 
 import sqlalchemy as sa
@@ -16,7 +18,7 @@ from abilian.core.extensions import db
 from abilian.core.models.base import AUDITABLE_HIDDEN, SEARCHABLE
 from abilian.core.models.subjects import create_root_user
 
-from . import CREATION, DELETION, UPDATE, AuditEntry, audit_service
+from . import CREATION, DELETION, UPDATE, AuditEntry, Changes, audit_service
 
 
 class IntegerCollection(db.Model):
@@ -255,3 +257,79 @@ def test_audit_collections(app, session):
     entry = AuditEntry.query.one()
     changes = entry.changes
     assert changes.collections == {"integers": (["1"], [])}
+
+
+def test_audit_bulk_insert(app, session):
+    app.config["AUDIT_BULK_INSERT"] = True
+    create_root_user()
+    audit_service.start()
+    session.commit()
+    AuditEntry.query.delete()
+    session.commit()
+
+    account = DummyAccount(name="John SARL")
+    session.add(account)
+    session.flush()
+    # inserted at commit
+    assert AuditEntry.query.count() == 0
+    session.commit()
+
+    entry = AuditEntry.query.one()
+    assert entry.type == CREATION
+    assert entry.entity == account
+    assert entry.changes.columns["name"] == (NEVER_SET, "John SARL")
+
+    # changes rolled back with a savepoint are not logged
+    savepoint = session.begin_nested()
+    account.website = "http://www.john.com/"
+    session.flush()
+    savepoint.rollback()
+    session.commit()
+    assert AuditEntry.query.count() == 1
+
+    # entity deleted in the same transaction
+    other = DummyAccount(name="Doe")
+    session.add(other)
+    session.flush()
+    other_id = other.id
+    session.delete(other)
+    session.commit()
+    entries = AuditEntry.query.filter(AuditEntry.entity_id == other_id).all()
+    assert sorted(e.type for e in entries) == [CREATION, DELETION]
+    assert all(e.entity is None for e in entries)
+
+
+def test_changes_serialization():
+    related = Changes()
+    related.set_column_changes("amount", Decimal("1.50"), None)
+    changes = Changes()
+    changes.set_column_changes("name", NEVER_SET, "John")
+    changes.set_column_changes(
+        "birthday", datetime.date(2012, 12, 25), datetime.datetime(2020, 1, 2, 3, 4)
+    )
+    changes.set_column_changes("meta", None, {"$t": 1, "tags": ["a"]})
+    changes.set_column_changes("point", (1, (2, 3)), [4, (5,)])
+    changes.set_related_changes("lines 1", related)
+    changes.collections["integers"] = (["1"], [])
+
+    decoded = Changes.from_json(changes.to_json())
+    assert decoded.columns["name"] == (NEVER_SET, "John")
+    assert decoded.columns["birthday"] == changes.columns["birthday"]
+    assert decoded.columns["meta"] == (None, {"$t": 1, "tags": ["a"]})
+    assert decoded.columns["point"] == ((1, (2, 3)), [4, (5,)])
+    assert decoded.columns["lines 1"].columns == {"amount": (Decimal("1.50"), None)}
+    assert decoded.collections == {"integers": (["1"], [])}
+
+
+def test_legacy_changes():
+    legacy = Changes()
+    legacy.set_column_changes("website", "", "http://www.john.com/")
+    entry = AuditEntry(changes_pickle=pickle.dumps(legacy, protocol=2))
+    assert entry.changes.columns == {"website": ("", "http://www.john.com/")}
+    # decoded once
+    assert entry.changes is entry.changes
+
+    # migrated
+    entry.changes = entry.changes
+    assert entry.changes_pickle is None
+    assert entry.changes.columns == {"website": ("", "http://www.john.com/")}
@@ -19,6 +19,7 @@ from abilian.services.conversion.handlers import (
 )
 
 from .exceptions import ConversionError
+from .scheduler import BACKGROUND, INTERACTIVE, QueueFull
 from .service import Converter, HandlerNotFound
 
 # Singleton, yuck!
@@ -36,6 +37,9 @@ __all__ = (
     "Converter",
     "ConversionError",
     "HandlerNotFound",
+    "QueueFull",
+    "INTERACTIVE",
+    "BACKGROUND",
 )
 
 # converter.register_handler(AbiwordPDFHandler())
@@ -1,23 +1,110 @@
+"""Filesystem cache for conversion results.
+
+An entry is stored in `cache_dir/<type>/<fan-out>/<digest>.blob`. The
+fan-out directory is named after the first 2 characters of the digest.
+
+The cache can be bounded in size (`max_size`, in bytes) and in age
+(`max_age`, in seconds since last access). Least recently used entries are
+evicted first. Access times are tracked with file modification times. With
+`use_index`, they are kept in a SQLite database in the cache directory
+instead: the cache size is then known without scanning the directory, and is
+shared by all processes using it.
+
+Entries are written to a temporary file which is then renamed, so concurrent
+readers never see a partial entry.
+
+Keys without a digest (content of unknown identity) are never cached: reads
+miss, writes are discarded.
+"""
+
 from __future__ import annotations
 
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from tempfile import NamedTemporaryFile
+from typing import IO, Iterator, Optional, Tuple, Union
 
 CacheKey = Tuple[str, str]
 
+INDEX_NAME = "index.sqlite"
+
+#: minimum interval between two lookups for expired entries, in seconds
+EXPIRE_INTERVAL = 60
+
+#: when over `max_size`, entries are evicted down to this fraction of it, so
+#: that the next writes don't trigger an eviction (and a directory scan) each
+LOW_WATER = 0.9
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS entry ("
+    "path TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entry_atime ON entry (atime)",
+    # total size, maintained by triggers
+    "CREATE TABLE IF NOT EXISTS total ("
+    "id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO total VALUES (0, 0)",
+    "CREATE TRIGGER IF NOT EXISTS entry_insert AFTER INSERT ON entry "
+    "BEGIN UPDATE total SET size = size + new.size; END",
+    "CREATE TRIGGER IF NOT EXISTS entry_update AFTER UPDATE OF size ON entry "
+    "BEGIN UPDATE total SET size = size + new.size - old.size; END",
+    "CREATE TRIGGER IF NOT EXISTS entry_delete AFTER DELETE ON entry "
+    "BEGIN UPDATE total SET size = size - old.size; END",
+]
+
 
 class Cache:
+    def __init__(
+        self,
+        cache_dir: Path | None = None,
+        max_size: int = 0,
+        max_age: int = 0,
+        use_index: bool = False,
+    ):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.use_index = use_index
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._size: int | None = None
+        self._last_expire = 0.0
+        self._cache_dir: Path | None = None
+        if cache_dir is not None:
+            self.cache_dir = cache_dir
 
-    cache_dir: Path
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, path: Path):
+        self._cache_dir = path
+        self._size = None
+        self._last_expire = 0.0
+        self._local = threading.local()
+
+    @property
+    def bounded(self) -> bool:
+        return bool(self.max_size or self.max_age)
 
     def _path(self, key: CacheKey) -> Path:
         """File path for `key`:"""
-        type = key[0]
-        uuid = key[1]
-        return self.cache_dir / type / f"{uuid}.blob"
+        type, digest = key
+        return self.cache_dir / type / (digest[0:2] or "_") / f"{digest}.blob"
+
+    def _rel(self, path: Path) -> str:
+        return path.relative_to(self.cache_dir).as_posix()
 
     def __contains__(self, key: CacheKey) -> bool:
-        return self._path(key).exists()
+        return bool(key[1]) and self._path(key).exists()
 
     def get(self, key: CacheKey) -> str | bytes | None:
         if key[0] == "txt":
@@ -27,31 +114,283 @@ class Cache:
 
     __getitem__ = get
 
-    def get_bytes(self, key: CacheKey) -> bytes | None:
-        if key in self:
-            path = self._path(key)
-            return path.read_bytes()
-        else:
+    def get_bytes(self, key: CacheKey, count: bool = True) -> bytes | None:
+        """Content of the entry, or `None`.
+
+        :param:count: `False` to leave hit and miss counters alone, e.g. when
+            a lookup already counted is checked again before converting.
+        """
+        if not key[1]:
             return None
 
-    def get_text(self, key: CacheKey) -> str | None:
-        if key in self:
-            path = self._path(key)
-            return path.read_text("utf8")
-        else:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            if count:
+                self._count("misses")
+            return None
+
+        if count:
+            self._count("hits")
+        self._touch(path)
+        return data
+
+    def get_text(self, key: CacheKey, count: bool = True) -> str | None:
+        data = self.get_bytes(key, count)
+        if data is None:
+            return None
+        return data.decode("utf8")
+
+    def open(self, key: CacheKey) -> IO[bytes] | None:
+        """Binary file on the cached entry, or `None`."""
+        if not key[1]:
             return None
 
-    def set(self, key: CacheKey, value: str | bytes):
         path = self._path(key)
-        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            f = path.open("rb")
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        self._touch(path)
+        return f
+
+    def set(self, key: CacheKey, value: str | bytes):
         if key[0] == "txt":
             assert isinstance(value, str)
-            path.write_text(value, "utf8")
+            data = value.encode("utf8")
         else:
             assert isinstance(value, bytes)
-            path.write_bytes(value)
+            data = value
+
+        with self.open_write(key) as f:
+            f.write(data)
+
+    @contextmanager
+    def open_write(self, key: CacheKey) -> Iterator[IO[bytes]]:
+        """Binary file to write the content of an entry to.
+
+        The entry is stored when the context exits without error. Without a
+        digest, content is discarded.
+        """
+        if not key[1]:
+            with open(os.devnull, "wb") as f:
+                yield f
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = NamedTemporaryFile(dir=str(path.parent), prefix=".tmp", delete=False)
+        try:
+            with f:
+                yield f
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+        size = os.stat(f.name).st_size
+        try:
+            old_size = path.stat().st_size
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(f.name, str(path))
+
+        if self.use_index:
+            self._db().execute(
+                "INSERT INTO entry (path, size, atime) VALUES (?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET size = excluded.size, "
+                "atime = excluded.atime",
+                (self._rel(path), size, time.time()),
+            )
+        else:
+            with self._lock:
+                if self._size is not None:
+                    self._size += size - old_size
+
+        self.evict(expire=False)
 
     __setitem__ = set
 
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _touch(self, path: Path):
+        if not self.bounded:
+            return
+
+        if self.use_index:
+            self._db().execute(
+                "UPDATE entry SET atime = ? WHERE path = ?",
+                (time.time(), self._rel(path)),
+            )
+        else:
+            try:
+                os.utime(str(path))
+            except FileNotFoundError:
+                pass
+
+    def _files(self) -> list[tuple[float, int, Path]]:
+        """All entries, with last access time and size."""
+        files = []
+        for path in self.cache_dir.rglob("*.blob"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def size(self) -> int:
+        """Total size of cached entries, in bytes."""
+        if self.use_index:
+            return self._db().execute("SELECT size FROM total").fetchone()[0]
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _mtime, size, _path in self._files())
+            return self._size
+
+    def stats(self) -> dict[str, int]:
+        """Hit, miss and eviction counters of this process, and cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": self.size(),
+        }
+
+    def evict(self, expire: bool = True):
+        """Remove expired entries, then least recently used entries until the
+        cache size is below `max_size`.
+
+        With `expire=False`, expired entries are looked up only if not done
+        in the last `EXPIRE_INTERVAL` seconds.
+        """
+        if not self.bounded:
+            return
+
+        now = time.time()
+        expire = bool(self.max_age) and (
+            expire or now - self._last_expire >= EXPIRE_INTERVAL
+        )
+        if expire:
+            self._last_expire = now
+
+        if self.use_index:
+            self._evict_indexed(now, expire)
+        else:
+            self._evict_files(now, expire)
+
+    def _evict_files(self, now: float, expire: bool):
+        with self._lock:
+            over_size = self.max_size and (
+                self._size is None or self._size > self.max_size
+            )
+            if not (expire or over_size):
+                return
+
+            # size is recomputed: other processes may have added entries
+            files = sorted(self._files())
+            total = sum(size for _mtime, size, _path in files)
+            min_mtime = now - self.max_age if self.max_age else 0
+            target = self.max_size * LOW_WATER if total > self.max_size else total
+
+            for mtime, size, path in files:
+                if mtime >= min_mtime and not (self.max_size and total > target):
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self._count("evictions")
+
+            self._size = total
+
+    def _evict_indexed(self, now: float, expire: bool):
+        db = self._db()
+        victims = []
+        if expire:
+            victims += db.execute(
+                "SELECT path FROM entry WHERE atime < ?", (now - self.max_age,)
+            ).fetchall()
+            for (path,) in victims:
+                self._remove_indexed(db, path)
+
+        if self.max_size:
+            total = db.execute("SELECT size FROM total").fetchone()[0]
+            if total <= self.max_size:
+                return
+
+            excess = total - self.max_size * LOW_WATER
+            rows = db.execute("SELECT path, size FROM entry ORDER BY atime")
+            victims = []
+            for path, size in rows:
+                if excess <= 0:
+                    break
+                victims.append(path)
+                excess -= size
+            rows.close()
+            for path in victims:
+                self._remove_indexed(db, path)
+
+    def _remove_indexed(self, db: sqlite3.Connection, rel_path: str):
+        cursor = db.execute("DELETE FROM entry WHERE path = ?", (rel_path,))
+        if not cursor.rowcount:
+            # evicted by another thread or process
+            return
+
+        try:
+            (self.cache_dir / rel_path).unlink()
+        except FileNotFoundError:
+            pass
+        self._count("evictions")
+
+    def _db(self) -> sqlite3.Connection:
+        """SQLite connection to the index, one per thread."""
+        local = self._local
+        if getattr(local, "pid", None) == os.getpid():
+            return local.db
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self.cache_dir / INDEX_NAME
+        is_new = not index_path.exists()
+
+        db = sqlite3.connect(str(index_path), timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            db.execute(statement)
+
+        if is_new:
+            # index existing entries
+            db.executemany(
+                "INSERT INTO entry (path, size, atime) VALUES (?, ?, ?) "
+                "ON CONFLICT (path) DO NOTHING",
+                ((self._rel(path), size, mtime) for mtime, size, path in self._files()),
+            )
+
+        local.db = db
+        local.pid = os.getpid()
+        return db
+
     def clear(self):
-        pass
+        """Remove all entries."""
+        if self._cache_dir is None or not self.cache_dir.exists():
+            return
+
+        with self._lock:
+            for child in self.cache_dir.iterdir():
+                if child.name.startswith(INDEX_NAME):
+                    continue
+                if child.is_dir():
+                    shutil.rmtree(str(child), ignore_errors=True)
+                else:
+                    child.unlink()
+
+            if self.use_index:
+                self._db().execute("DELETE FROM entry")
+            self._size = 0
@@ -0,0 +1,56 @@
+""""""
+
+from __future__ import annotations
+
+from flask import current_app
+from flask_debugtoolbar.panels import DebugPanel
+
+from . import converter
+
+
+class ConversionDebugPanel(DebugPanel):
+    """A panel to display conversion cache counters and conversion metrics
+    of the current process, and conversions done during the request."""
+
+    name = "Conversion"
+
+    user_enable = True
+    has_content = True
+
+    def process_request(self, request):
+        self.counts = self._counts()
+
+    def _counts(self) -> dict[tuple[str, str], int]:
+        return {
+            (m["name"], m["outcome"]): m["count"] for m in converter.metrics.snapshot()
+        }
+
+    def nav_title(self):
+        return "Conversion"
+
+    def nav_subtitle(self):
+        """Subtitle showing until title in toolbar."""
+        before = getattr(self, "counts", {})
+        calls = sum(self._counts().values()) - sum(before.values())
+        return f"{calls} calls in request"
+
+    def title(self):
+        return "Conversion"
+
+    def url(self):
+        return ""
+
+    def content(self) -> str:
+        before = getattr(self, "counts", {})
+        metrics = converter.metrics.snapshot()
+        for m in metrics:
+            m["request_count"] = m["count"] - before.get((m["name"], m["outcome"]), 0)
+
+        ctx = {"cache": converter.cache.stats(), "metrics": metrics}
+
+        jinja_env = current_app.jinja_env
+        jinja_env.filters.update(self.jinja_env.filters)
+        template = jinja_env.get_or_select_template(
+            "debug_panels/conversion_panel.html"
+        )
+        return template.render(ctx)
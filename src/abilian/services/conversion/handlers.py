@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import glob
 import hashlib
+import io
+import itertools
 import logging
 import mimetypes
 import os
@@ -12,7 +14,8 @@ import traceback
 from abc import ABCMeta, abstractmethod
 from base64 import b64decode, b64encode
 from pathlib import Path
-from typing import Any, List
+from tempfile import TemporaryDirectory
+from typing import IO, Any, Iterator, List
 from xmlrpc.client import ServerProxy
 
 from flask import Flask
@@ -20,8 +23,10 @@ from magic import Magic
 
 from abilian.services.image import resize
 
+from . import pdfium
 from .exceptions import ConversionError
-from .util import get_tmp_dir, make_temp_file
+from .libreoffice import OfficePool, uno
+from .util import get_tmp_dir, make_temp_file, run_process, split_pages
 
 logger = logging.getLogger(__name__)
 
@@ -105,6 +110,10 @@ class PdfToTextHandler(Handler):
     produces_mime_types = ["text/plain"]
 
     def convert(self, blob: bytes, **kw: Any) -> str:
+        pages = pdfium.backend.call(blob, pdfium.text_pages)
+        if pages is not None:
+            return "".join(f"{page}\f" for page in pages)
+
         with make_temp_file(blob) as in_fn, make_temp_file() as out_fn:
             try:
                 subprocess.check_call(["pdftotext", in_fn, out_fn])
@@ -127,6 +136,40 @@ class PdfToTextHandler(Handler):
 
         return converted_unicode
 
+    def iter_pages(self, blob: bytes | IO[bytes]) -> Iterator[str]:
+        """Extract text page by page, while `pdftotext` is running.
+
+        `pdftotext` is killed if the iterator is closed before the end.
+        """
+        pages = pdfium.backend.call(blob, pdfium.text_pages)
+        if pages is not None:
+            # small document, already extracted
+            yield from pages
+            return
+
+        with make_temp_file(blob) as in_fn:
+            try:
+                process = subprocess.Popen(
+                    ["pdftotext", "-enc", "UTF-8", in_fn, "-"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            except OSError as e:
+                raise ConversionError("pdftotext failed") from e
+
+            stream = io.TextIOWrapper(process.stdout, encoding="utf8", errors="ignore")
+            try:
+                yield from split_pages(stream)
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                stream.close()
+                returncode = process.wait()
+
+        if returncode:
+            raise ConversionError(f"pdftotext failed (exit code {returncode})")
+
 
 class AbiwordTextHandler(Handler):
     accepts_mime_types = ["application/msword"]
@@ -210,10 +253,74 @@ class ImageMagickHandler(Handler):
                 raise ConversionError("convert failed") from e
 
 
+def pdf_info(filename: str) -> dict[str, str]:
+    """Document information dictionary of a PDF file, as given by `pdfinfo`.
+
+    Only the document header and trailer are read: this is cheap even for
+    large files.
+    """
+    try:
+        output = subprocess.check_output(["pdfinfo", filename])
+    except OSError:
+        logger.error("Conversion failed, probably pdfinfo is not installed")
+        raise
+    except subprocess.CalledProcessError as e:
+        raise ConversionError("pdfinfo failed") from e
+
+    info = {}
+    for line in output.split(b"\n"):
+        if b":" in line:
+            key, value = line.strip().split(b":", 1)
+            info[str(key, errors="replace")] = str(value.strip(), errors="replace")
+    return info
+
+
 class PdfToPpmHandler(Handler):
     accepts_mime_types = ["application/pdf", "application/x-pdf"]
     produces_mime_types = ["image/jpeg"]
 
+    def page_count(self, blob: bytes | IO[bytes]) -> int:
+        count = pdfium.backend.call(blob, pdfium.page_count)
+        if count is not None:
+            return count
+
+        with make_temp_file(blob) as in_fn:
+            return int(pdf_info(in_fn).get("Pages", 0))
+
+    def render_page(
+        self, blob: bytes | IO[bytes], index: int, size: int = 500
+    ) -> bytes:
+        """Render only page `index` (0-based), scaled so that its largest
+        side is `size` pixels.
+
+        :raises IndexError: if the document has no such page.
+        """
+        image = pdfium.backend.call(blob, pdfium.render_page, index, size)
+        if image is not None:
+            return image
+
+        with make_temp_file(blob) as in_fn, make_temp_file() as out_fn:
+            page_count = int(pdf_info(in_fn).get("Pages", 0))
+            if not 0 <= index < page_count:
+                raise IndexError(f"No page {index} in a {page_count} pages document")
+
+            page = str(index + 1)
+            # `-singlefile`: output is written to `out_fn.jpg`
+            cmd = ["pdftoppm", "-jpeg", "-singlefile", "-f", page, "-l", page]
+            cmd += ["-scale-to", str(size), in_fn, out_fn]
+            image_fn = f"{out_fn}.jpg"
+            try:
+                subprocess.check_call(cmd)
+                with open(image_fn, "rb") as image:
+                    return image.read()
+            except Exception as e:
+                raise ConversionError("pdftoppm failed") from e
+            finally:
+                try:
+                    os.remove(image_fn)
+                except OSError:
+                    pass
+
     def convert(self, blob: bytes, size: int = 500, **kw) -> list[bytes]:
         """Size is the maximum horizontal size."""
         file_list: list[str] = []
@@ -224,7 +331,8 @@ class PdfToPpmHandler(Handler):
 
                 converted_images = []
                 for fn in file_list:
-                    converted = resize(open(fn, "rb").read(), size, size)
+                    with open(fn, "rb") as image:
+                        converted = resize(image, size, size)
                     converted_images.append(converted)
 
                 return converted_images
@@ -260,7 +368,6 @@ class UnoconvPdfHandler(Handler):
     produces_mime_types = ["application/pdf"]
     run_timeout = 60
     unoconv = "unoconv"
-    _process: subprocess.Popen
 
     def init_app(self, app):
         unoconv = app.config.get("UNOCONV_LOCATION")
@@ -305,7 +412,6 @@ class UnoconvPdfHandler(Handler):
 
     def convert(self, blob, **kw):
         """Convert using unoconv converter."""
-        timeout = self.run_timeout
         with make_temp_file(blob) as in_fn, make_temp_file(
             prefix="tmp-unoconv-", suffix=".pdf"
         ) as out_fn:
@@ -320,36 +426,8 @@ class UnoconvPdfHandler(Handler):
             else:
                 cmd = [self.unoconv] + args
 
-            def run_uno():
-                try:
-                    self._process = subprocess.Popen(
-                        cmd, close_fds=True, cwd=bytes(self.tmp_dir)
-                    )
-                    self._process.communicate()
-                except Exception as e:
-                    logger.error("run_uno error: %s", bytes(e), exc_info=True)
-                    raise ConversionError("unoconv failed") from e
-
-            run_thread = threading.Thread(target=run_uno)
-            run_thread.start()
-            run_thread.join(timeout)
-
-            try:
-                if run_thread.is_alive():
-                    # timeout reached
-                    self._process.terminate()
-                    if self._process.poll() is not None:
-                        try:
-                            self._process.kill()
-                        except OSError:
-                            logger.warning("Failed to kill process %s", self._process)
-
-                    raise ConversionError(f"Conversion timeout ({timeout})")
-
-                converted = open(out_fn).read()
-                return converted
-            finally:
-                del self._process
+            run_process(cmd, self.run_timeout, cwd=self.tmp_dir)
+            return Path(out_fn).read_bytes()
 
 
 class LibreOfficePdfHandler(Handler):
@@ -373,7 +451,15 @@ class LibreOfficePdfHandler(Handler):
     produces_mime_types = ["application/pdf"]
     run_timeout = 60
     soffice = "soffice"
-    _process: subprocess.Popen
+
+    #: pool of persistent LibreOffice instances, set up if
+    #: `LIBREOFFICE_POOL_SIZE` config value is > 0
+    pool: OfficePool | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+        self._profile_ids = itertools.count()
 
     def init_app(self, app: Flask):
         soffice = app.config.get("SOFFICE_LOCATION")
@@ -403,13 +489,64 @@ class LibreOfficePdfHandler(Handler):
             soffice = None
 
         self.soffice = soffice
+        self.init_pool(app)
+
+    def init_pool(self, app: Flask):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        pool_size = app.config.get("LIBREOFFICE_POOL_SIZE", 0)
+        if not pool_size or not self.soffice:
+            return
+
+        if uno is None:
+            self.log.warning(
+                "LibreOffice pool disabled: uno module is not available. "
+                "Falling back to one LibreOffice process per conversion."
+            )
+            return
+
+        self.pool = OfficePool(
+            self.soffice,
+            size=pool_size,
+            work_dir=Path(app.instance_path, "tmp", "libreoffice"),
+            max_jobs=app.config.get("LIBREOFFICE_POOL_MAX_JOBS", 200),
+            timeout=self.run_timeout,
+        )
+
+    def _profile_dir(self) -> Path:
+        """LibreOffice user profile of the current thread.
+
+        LibreOffice instances running at once can't share a profile: the
+        second one would hand its document over to the first one and exit.
+        """
+        profile_dir = getattr(self._local, "profile_dir", None)
+        if profile_dir is None:
+            name = f"{os.getpid()}-{next(self._profile_ids)}"
+            profile_dir = Path(self.tmp_dir, "soffice-profiles", name).resolve()
+            self._local.profile_dir = profile_dir
+        return profile_dir
 
     def convert(self, blob: bytes, **kw: Any) -> bytes:
         """Convert using soffice converter."""
-        timeout = self.run_timeout
-        with make_temp_file(blob) as in_fn:
+        if self.pool is not None:
+            return self.pool.convert(blob)
+
+        with make_temp_file(blob) as in_fn, TemporaryDirectory(
+            dir=str(self.tmp_dir), prefix="tmp-soffice-"
+        ) as out_dir:
 
-            cmd = [self.soffice, "--headless", "--convert-to", "pdf", in_fn]
+            cmd = [
+                self.soffice,
+                "--headless",
+                f"-env:UserInstallation={self._profile_dir().as_uri()}",
+                "--convert-to",
+                "pdf",
+                "--outdir",
+                out_dir,
+                in_fn,
+            ]
 
             # # TODO: fix this if needed, or remove if not needed
             # if os.path.exists(
@@ -419,37 +556,12 @@ class LibreOfficePdfHandler(Handler):
             #         '/usr/local/bin/unoconv', '-f', 'pdf', '-o', out_fn, in_fn
             #     ]
 
-            def run_soffice():
-                try:
-                    self._process = subprocess.Popen(
-                        cmd, close_fds=True, cwd=bytes(self.tmp_dir)
-                    )
-                    self._process.communicate()
-                except Exception as e:
-                    logger.error("soffice error: %s", e, exc_info=True)
-                    raise ConversionError("soffice conversion failed") from e
-
-            run_thread = threading.Thread(target=run_soffice)
-            run_thread.start()
-            run_thread.join(timeout)
-
+            run_process(cmd, self.run_timeout, cwd=self.tmp_dir)
+            out_fn = Path(out_dir, Path(in_fn).stem + ".pdf")
             try:
-                if run_thread.is_alive():
-                    # timeout reached
-                    self._process.terminate()
-                    if self._process.poll() is not None:
-                        try:
-                            self._process.kill()
-                        except OSError:
-                            logger.warning("Failed to kill process %s", self._process)
-
-                    raise ConversionError(f"Conversion timeout ({timeout})")
-
-                out_fn = f"{os.path.splitext(in_fn)[0]}.pdf"
-                converted = open(out_fn, "rb").read()
-                return converted
-            finally:
-                del self._process
+                return out_fn.read_bytes()
+            except FileNotFoundError as e:
+                raise ConversionError("soffice conversion failed") from e
 
 
 class CloudoooPdfHandler(Handler):
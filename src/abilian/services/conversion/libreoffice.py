@@ -0,0 +1,301 @@
+"""Pool of long-running LibreOffice processes, driven through UNO.
+
+Starting LibreOffice takes seconds and a few hundred MB of memory: instead of
+spawning `soffice --convert-to` for each document, a fixed number of headless
+instances are kept listening on named pipes, each with its own user profile.
+A conversion takes an idle instance from the pool, so at most `size`
+conversions run at once; other callers wait for an instance to be released.
+
+Instances are started lazily, restarted when they don't respond or after
+`max_jobs` conversions, and killed when a conversion exceeds its timeout.
+
+Requires the `uno` Python bindings (`python3-uno` on Debian/Ubuntu).
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import IO, Any
+
+from .exceptions import ConversionError
+from .util import make_temp_file
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+logger = logging.getLogger(__name__)
+
+#: seconds to wait for a new instance to accept connections
+START_TIMEOUT = 30
+
+#: PDF export filter, by document service
+PDF_FILTERS = [
+    ("com.sun.star.sheet.SpreadsheetDocument", "calc_pdf_Export"),
+    ("com.sun.star.presentation.PresentationDocument", "impress_pdf_Export"),
+    ("com.sun.star.drawing.DrawingDocument", "draw_pdf_Export"),
+    ("com.sun.star.text.TextDocument", "writer_pdf_Export"),
+]
+
+
+def _properties(**kwargs: Any) -> tuple:
+    properties = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+#: pools to shut down when the interpreter exits
+_pools: weakref.WeakSet[OfficePool] = weakref.WeakSet()
+
+
+@atexit.register
+def _shutdown_pools():
+    for pool in list(_pools):
+        pool.shutdown()
+
+
+class OfficeWorker:
+    """One headless LibreOffice instance.
+
+    `generation` is incremented each time the instance is (re)started: a
+    conversion abandoned after a timeout must not affect its successor.
+    """
+
+    process: subprocess.Popen | None = None
+    desktop: Any = None
+    generation = 0
+
+    def __init__(self, soffice: str, work_dir: Path, name: str):
+        self.soffice = soffice
+        self.name = name
+        self.profile_dir = work_dir / name
+        self.pipe_name = f"abilian-{name}"
+        self.jobs = 0
+
+    def __repr__(self):
+        pid = self.process.pid if self.process else None
+        return f"<OfficeWorker {self.name} pid={pid} jobs={self.jobs}>"
+
+    @property
+    def connection(self) -> str:
+        return f"pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+
+    def start(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            self.soffice,
+            "--headless",
+            "--invisible",
+            "--nocrashreport",
+            "--nodefault",
+            "--nologo",
+            "--nofirststartwizard",
+            "--norestore",
+            f"-env:UserInstallation={self.profile_dir.as_uri()}",
+            f"--accept={self.connection}",
+        ]
+        self.process = subprocess.Popen(
+            cmd,
+            close_fds=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.jobs = 0
+        self.generation += 1
+        self.desktop = self._connect()
+        logger.debug("Started %r", self)
+
+    def _connect(self) -> Any:
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local
+        )
+        deadline = time.monotonic() + START_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f"uno:{self.connection}")
+                break
+            except NoConnectException:
+                if self.process.poll() is not None:
+                    raise ConversionError("LibreOffice failed to start")
+                if time.monotonic() > deadline:
+                    self.kill()
+                    raise ConversionError("LibreOffice did not start in time")
+                time.sleep(0.25)
+
+        return context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", context
+        )
+
+    def is_alive(self) -> bool:
+        """Health check: process is running and answers UNO calls."""
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            self.desktop.getComponents()
+        except Exception:
+            return False
+        return True
+
+    def stop(self):
+        if self.process is None:
+            return
+
+        try:
+            self.desktop.terminate()
+        except Exception:
+            # expected: connection is closed by the terminating process
+            pass
+
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+        self.process = None
+        self.desktop = None
+
+    def kill(self):
+        if self.process is None:
+            return
+
+        try:
+            self.process.kill()
+            self.process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            logger.warning("Failed to kill process %s", self.process.pid)
+        self.process = None
+        self.desktop = None
+
+    def convert(self, in_fn: str, out_fn: str):
+        generation = self.generation
+        document = self.desktop.loadComponentFromURL(
+            Path(in_fn).as_uri(), "_blank", 0, _properties(Hidden=True, ReadOnly=True)
+        )
+        if document is None:
+            raise ConversionError("LibreOffice could not load document")
+
+        try:
+            filter_name = "writer_pdf_Export"
+            for service, name in PDF_FILTERS:
+                if document.supportsService(service):
+                    filter_name = name
+                    break
+
+            document.storeToURL(
+                Path(out_fn).as_uri(), _properties(FilterName=filter_name)
+            )
+        finally:
+            if self.generation == generation:
+                self.jobs += 1
+            document.close(True)
+
+
+class OfficePool:
+    """Fixed-size pool of :class:`OfficeWorker`."""
+
+    def __init__(
+        self,
+        soffice: str,
+        size: int,
+        work_dir: Path,
+        max_jobs: int = 200,
+        timeout: int = 60,
+    ):
+        if uno is None:
+            raise RuntimeError("LibreOffice pool requires the uno module")
+
+        self.soffice = soffice
+        self.size = size
+        self.work_dir = work_dir
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._workers: list[OfficeWorker] = []
+        self._idle: queue.Queue[OfficeWorker] = queue.Queue()
+        _pools.add(self)
+
+    def _ensure_workers(self):
+        # after a fork, instances belong to the parent process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._workers = [
+                OfficeWorker(self.soffice, self.work_dir, f"worker-{self._pid}-{i}")
+                for i in range(self.size)
+            ]
+            self._idle = queue.Queue()
+            for worker in self._workers:
+                self._idle.put(worker)
+
+    def convert(self, blob: bytes | IO[bytes]) -> bytes:
+        self._ensure_workers()
+        worker = self._idle.get()
+        try:
+            if worker.jobs >= self.max_jobs or not worker.is_alive():
+                worker.stop()
+                worker.start()
+
+            with make_temp_file(blob) as in_fn, make_temp_file(
+                prefix="tmp-soffice-", suffix=".pdf"
+            ) as out_fn:
+                self._run(worker, in_fn, out_fn)
+                with open(out_fn, "rb") as f:
+                    return f.read()
+        except Exception:
+            # a document can fail to convert on a healthy instance: restart
+            # only an instance that died or lost its connection
+            if worker.process is not None and not worker.is_alive():
+                worker.kill()
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def _run(self, worker: OfficeWorker, in_fn: str, out_fn: str):
+        errors: list[Exception] = []
+
+        def run():
+            try:
+                worker.convert(in_fn, out_fn)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+
+        if thread.is_alive():
+            worker.kill()
+            raise ConversionError(f"Conversion timeout ({self.timeout})")
+
+        if errors:
+            raise ConversionError("LibreOffice conversion failed") from errors[0]
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+
+        for worker in self._workers:
+            worker.stop()
+            shutil.rmtree(str(worker.profile_dir), ignore_errors=True)
+        self._workers = []
+        self._pid = None
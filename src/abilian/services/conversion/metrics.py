@@ -0,0 +1,105 @@
+"""Conversion metrics: number of calls, duration and output size of
+conversions, by operation (like `"to_pdf"` or `"PdfToTextHandler.convert"`)
+and outcome (`"ok"` or `"error"`).
+
+Metrics are kept in memory, per process.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class Stat:
+    __slots__ = ("count", "total_time", "max_time", "total_size")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_size = 0
+
+    def add(self, duration: float, size: int):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.total_size += size
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.count if self.count else 0.0,
+            "max_time": self.max_time,
+            "total_size": self.total_size,
+            # calls per second of conversion time
+            "throughput": self.count / self.total_time if self.total_time else 0.0,
+        }
+
+
+def output_size(value: Any) -> int:
+    """Size of a conversion result: bytes or characters."""
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(output_size(v) for v in value)
+    return 0
+
+
+class Recorder:
+    """Given by :meth:`Metrics.measure`: set `size` for streamed results."""
+
+    def __init__(self):
+        self.size = 0
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str], Stat] = {}
+
+    def record(self, name: str, outcome: str, duration: float, size: int = 0):
+        with self._lock:
+            stat = self._stats.get((name, outcome))
+            if stat is None:
+                stat = self._stats[(name, outcome)] = Stat()
+            stat.add(duration, size)
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[Recorder]:
+        """Record duration of the block, and its outcome: `"error"` if it
+        raises an exception."""
+        recorder = Recorder()
+        start = time.perf_counter()
+        try:
+            yield recorder
+        except GeneratorExit:
+            # a stream closed by its consumer: not an error
+            self.record(name, "ok", time.perf_counter() - start, recorder.size)
+            raise
+        except BaseException:
+            self.record(name, "error", time.perf_counter() - start, recorder.size)
+            raise
+        self.record(name, "ok", time.perf_counter() - start, recorder.size)
+
+    def call(self, name: str, func, *args, **kwargs) -> Any:
+        with self.measure(name) as recorder:
+            result = func(*args, **kwargs)
+            recorder.size = output_size(result)
+        return result
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """Current metrics, sorted by name and outcome."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            return [
+                dict(name=name, outcome=outcome, **stat.as_dict())
+                for (name, outcome), stat in items
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
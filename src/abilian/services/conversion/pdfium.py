@@ -0,0 +1,145 @@
+"""In-process PDF backend, using PDFium through `pypdfium2` (optional).
+
+Text extraction, page rendering and document information are done in the
+current process: no temporary file is written, and no poppler tool is
+spawned. Content is given to PDFium as bytes, or as a seekable binary stream
+which is read on demand, so repository files are not loaded in memory.
+
+PDFium is not thread-safe: calls are serialized. Documents larger than
+`max_size` (config: `CONVERSION_PDFIUM_MAX_SIZE`) and documents PDFium can't
+open are left to the poppler-based handlers, which remain the fallback.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import threading
+from typing import IO, Any, Callable
+
+from flask import Flask
+
+try:
+    import pypdfium2
+    from pypdfium2 import PdfiumError
+except ImportError:
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 20 * 1024**2
+
+_lock = threading.Lock()
+
+
+class PdfiumBackend:
+    def __init__(self, enabled: bool = True, max_size: int = DEFAULT_MAX_SIZE):
+        self.enabled = enabled
+        self.max_size = max_size
+
+    def init_app(self, app: Flask):
+        self.enabled = app.config.get("CONVERSION_PDFIUM", True)
+        self.max_size = app.config.get("CONVERSION_PDFIUM_MAX_SIZE", DEFAULT_MAX_SIZE)
+
+    @property
+    def available(self) -> bool:
+        return pypdfium2 is not None and self.enabled
+
+    def accepts(self, content: bytes | IO[bytes]) -> bool:
+        if not self.available:
+            return False
+
+        if isinstance(content, bytes):
+            return len(content) <= self.max_size
+
+        try:
+            if not content.seekable():
+                return False
+            pos = content.tell()
+            size = content.seek(0, io.SEEK_END) - pos
+            content.seek(pos)
+        except (AttributeError, OSError):
+            return False
+        return size <= self.max_size
+
+    def call(
+        self, content: bytes | IO[bytes], func: Callable[..., Any], *args: Any
+    ) -> Any:
+        """Return `func(document, *args)`, or `None` if PDFium can't handle
+        `content`: a stream is then rewound, ready for a fallback handler."""
+        if not self.accepts(content):
+            return None
+
+        pos = 0 if isinstance(content, bytes) else content.tell()
+        with _lock:
+            try:
+                document = pypdfium2.PdfDocument(content)
+                try:
+                    return func(document, *args)
+                finally:
+                    document.close()
+            except PdfiumError:
+                logger.debug("PDFium failed, using fallback", exc_info=True)
+                if not isinstance(content, bytes):
+                    content.seek(pos)
+                return None
+
+
+backend = PdfiumBackend()
+
+
+def page_count(document) -> int:
+    return len(document)
+
+
+def text_pages(document) -> list[str]:
+    pages = []
+    for page in document:
+        textpage = page.get_textpage()
+        try:
+            text = textpage.get_text_range()
+        finally:
+            textpage.close()
+            page.close()
+        # same line endings as pdftotext
+        pages.append(text.replace("\r\n", "\n"))
+    return pages
+
+
+def render_page(document, index: int, size: int) -> bytes:
+    """Render page `index` as JPEG, scaled so that its largest side is
+    `size` pixels."""
+    if not 0 <= index < len(document):
+        raise IndexError(f"No page {index} in a {len(document)} pages document")
+
+    page = document[index]
+    try:
+        width, height = page.get_size()
+        bitmap = page.render(scale=size / max(width, height))
+        image = bitmap.to_pil()
+    finally:
+        page.close()
+
+    output = io.BytesIO()
+    image.save(output, "JPEG")
+    return output.getvalue()
+
+
+def info(document) -> dict[str, str]:
+    """Document information, with the keys `pdfinfo` uses."""
+    result = {
+        key: value for key, value in document.get_metadata_dict().items() if value
+    }
+    result["Pages"] = str(len(document))
+    version = document.get_version()
+    if version:
+        result["PDF version"] = f"{version // 10}.{version % 10}"
+
+    if len(document):
+        page = document[0]
+        try:
+            width, height = page.get_size()
+        finally:
+            page.close()
+        result["Page size"] = f"{width:g} x {height:g} pts"
+    return result
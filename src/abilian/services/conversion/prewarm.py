@@ -0,0 +1,206 @@
+"""Background conversion of new blobs ("pre-warming").
+
+When `CONVERSION_PREWARM` is set, each committed :class:`Blob` whose
+mimetype matches `CONVERSION_PREWARM_POLICY` gets a Celery task which fills
+the conversion cache with its renditions: `"pdf"`, `"text"`, and `"image"`
+(first page preview, `CONVERSION_PREWARM_IMAGE_SIZE` pixels wide). The first
+user to view the document then doesn't wait for the conversions.
+
+Renditions already cached are skipped. A marker file in the cache directory
+tells that a task is queued for a digest, so that the same content uploaded
+twice (or modified twice in a row) doesn't queue duplicate work.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from itertools import chain
+from pathlib import Path
+
+from celery import shared_task
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.unitofwork import UOWTransaction
+
+from abilian.core.celery import safe_session
+from abilian.core.models.blob import Blob
+
+from .exceptions import ConversionError
+from .scheduler import BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = ("pdf", "text", "image")
+
+_OFFICE = ["pdf", "text", "image"]
+
+#: mimetype patterns (regular expressions, as in handlers) -> renditions
+DEFAULT_POLICY: dict[str, list[str]] = {
+    "application/pdf": ["text", "image"],
+    "application/x-pdf": ["text", "image"],
+    "application/msword": _OFFICE,
+    "application/vnd.ms-.*": _OFFICE,
+    "application/vnd.oasis.opendocument.*": _OFFICE,
+    "application/vnd.openxmlformats-officedocument.*": _OFFICE,
+    "text/rtf": _OFFICE,
+}
+
+#: a marker older than this (in seconds) is considered left by a lost task
+MARKER_TTL = 3600
+
+_SESSION_KEY = "abilian_conversion_prewarm"
+
+
+def renditions_for(mime_type: str, policy: dict[str, list[str]]) -> list[str]:
+    for pattern, renditions in policy.items():
+        if re.match(f"^{pattern}$", mime_type):
+            return list(renditions)
+    return []
+
+
+def register_listeners():
+    for name, listener in (
+        ("after_flush", _after_flush),
+        ("after_commit", _after_commit),
+        ("after_soft_rollback", _after_soft_rollback),
+    ):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+def _after_flush(session: Session, flush_context: UOWTransaction):
+    if not has_app_context() or not current_app.config.get("CONVERSION_PREWARM"):
+        return
+
+    # values are read now: after commit, attributes are expired
+    pending = session.info.setdefault(_SESSION_KEY, {})
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Blob) and obj.id is not None:
+            pending[obj.id] = (obj.meta.get("md5"), obj.meta.get("mimetype"))
+    for obj in session.deleted:
+        if isinstance(obj, Blob):
+            pending.pop(obj.id, None)
+
+
+def _after_soft_rollback(session: Session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def _after_commit(session: Session):
+    if session.transaction.nested:
+        return
+
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending or not has_app_context():
+        return
+
+    from . import converter
+
+    config = current_app.config
+    policy = config.get("CONVERSION_PREWARM_POLICY") or DEFAULT_POLICY
+    size = config.get("CONVERSION_PREWARM_IMAGE_SIZE", 500)
+
+    for blob_id, (digest, mime_type) in pending.items():
+        if not digest or not mime_type:
+            continue
+
+        renditions = [
+            r
+            for r in renditions_for(mime_type, policy)
+            if not is_cached(converter, r, digest, size)
+        ]
+        if not renditions or not claim(converter.cache_dir, digest):
+            continue
+
+        try:
+            prewarm_blob.delay(blob_id, digest, mime_type, renditions, size)
+        except Exception:
+            release(converter.cache_dir, digest)
+            logger.error(
+                "Failed to queue conversion of blob %d", blob_id, exc_info=True
+            )
+
+
+def is_cached(converter, rendition: str, digest: str, size: int) -> bool:
+    keys = {
+        "pdf": ("pdf", digest),
+        "text": ("txt", digest),
+        "image": (f"img:0:{size}", digest),
+    }
+    return keys[rendition] in converter.cache
+
+
+def _marker(cache_dir: Path, digest: str) -> Path:
+    return cache_dir / "prewarm" / digest
+
+
+def claim(cache_dir: Path, digest: str) -> bool:
+    """Mark a task as queued for `digest`.
+
+    Returns `False` if another one is already queued.
+    """
+    marker = _marker(cache_dir, digest)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(str(marker), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if marker.stat().st_mtime > time.time() - MARKER_TTL:
+                return False
+        except FileNotFoundError:
+            pass
+        marker.touch()
+        return True
+
+    os.close(fd)
+    return True
+
+
+def release(cache_dir: Path, digest: str):
+    try:
+        _marker(cache_dir, digest).unlink()
+    except FileNotFoundError:
+        pass
+
+
+@shared_task(ignore_result=True)
+def prewarm_blob(
+    blob_id: int, digest: str, mime_type: str, renditions: list[str], size: int
+):
+    """Fill conversion cache for a blob.
+
+    :param:renditions: a list of :data:`RENDITIONS`.
+    """
+    from . import converter
+
+    try:
+        session = safe_session()
+        blob = session.query(Blob).get(blob_id)
+        if blob is None or blob.meta.get("md5") != digest:
+            # deleted or modified since the task was queued
+            return
+
+        for rendition in renditions:
+            try:
+                if rendition == "pdf":
+                    converter.to_pdf(digest, blob, mime_type, priority=BACKGROUND)
+                elif rendition == "text":
+                    converter.to_text(digest, blob, mime_type, priority=BACKGROUND)
+                elif rendition == "image":
+                    converter.to_image(
+                        digest, blob, mime_type, 0, size, priority=BACKGROUND
+                    )
+            except (ConversionError, IndexError):
+                logger.warning(
+                    "Conversion of blob %d to %s failed",
+                    blob_id,
+                    rendition,
+                    exc_info=True,
+                )
+    finally:
+        release(converter.cache_dir, digest)
@@ -0,0 +1,189 @@
+"""Conversion scheduler: single-flight deduplication and bounded job queue.
+
+Jobs are identified by a key, like `(digest, "pdf")`. While a job is queued or
+running, callers submitting the same key get the same future instead of
+starting an identical conversion.
+
+With `workers` > 0, jobs run in a pool of threads, interactive jobs first. At
+most `max_pending` jobs may wait in queue: interactive callers then block
+until a slot is free, background callers get a :class:`QueueFull` error.
+With `workers` = 0, jobs run in the submitting thread (still deduplicated).
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+from .exceptions import ConversionError
+
+logger = logging.getLogger(__name__)
+
+#: priorities: lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+_STOP = object()
+
+
+class QueueFull(ConversionError):
+    pass
+
+
+class _Job:
+    def __init__(self, key: Hashable, fn: Callable[[], Any], priority: int):
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.future: Future = Future()
+        self.started = False
+
+    def run(self):
+        try:
+            result = self.fn()
+        except Exception as e:
+            self.future.set_exception(e)
+        except BaseException as e:
+            # callers joined on this job must not wait forever
+            self.future.set_exception(e)
+            raise
+        else:
+            self.future.set_result(result)
+
+
+class ConversionScheduler:
+    def __init__(self, workers: int = 0, max_pending: int = 100):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, _Job] = {}
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._pid: int | None = None
+        self._threads: list[threading.Thread] = []
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _ensure_threads(self):
+        # called with lock held. After a fork, threads of the parent are gone.
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._queue = queue.PriorityQueue()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"conversion-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def in_worker(self) -> bool:
+        return getattr(self._local, "in_worker", False)
+
+    def _work(self):
+        self._local.in_worker = True
+        while True:
+            _priority, _seq, job = self._queue.get()
+            if job is _STOP:
+                return
+            if self._claim(job):
+                self._execute(job)
+
+    def _claim(self, job: _Job) -> bool:
+        """Mark job as started; returns False if it already was."""
+        with self._lock:
+            if job.started:
+                return False
+            job.started = True
+        if self.workers:
+            self._slots.release()
+        return True
+
+    def _execute(self, job: _Job):
+        try:
+            job.run()
+        finally:
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+
+    def submit(
+        self, key: Hashable, fn: Callable[[], Any], priority: int = INTERACTIVE
+    ) -> Future:
+        """Schedule `fn`, or join the job already scheduled with same key."""
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                if not self.workers or job.started or priority >= job.priority:
+                    return job.future
+                # an interactive caller waits for a background job: queue it
+                # again with higher priority (it will run only once)
+                job.priority = priority
+                self._queue.put((priority, next(self._seq), job))
+                return job.future
+
+            job = _Job(key, fn, priority)
+            if not self.workers:
+                self._inflight[key] = job
+            else:
+                self._ensure_threads()
+
+        if not self.workers:
+            job.started = True
+            self._execute(job)
+            return job.future
+
+        # backpressure
+        if not self._slots.acquire(blocking=priority < BACKGROUND):
+            raise QueueFull("Too many pending conversions")
+
+        with self._lock:
+            other = self._inflight.get(key)
+            if other is not None:
+                # scheduled meanwhile by another thread
+                self._slots.release()
+                return other.future
+            self._inflight[key] = job
+            self._queue.put((priority, next(self._seq), job))
+
+        return job.future
+
+    def run(
+        self, key: Hashable, fn: Callable[[], Any], priority: int = INTERACTIVE
+    ) -> Any:
+        """Run `fn` through the scheduler and wait for its result.
+
+        From a worker thread (a conversion needing another conversion), a
+        job not yet started is run in the current thread, so that workers
+        never wait for jobs stuck in queue behind them.
+        """
+        if self.in_worker:
+            with self._lock:
+                job = self._inflight.get(key)
+            if job is None:
+                return fn()
+            if self._claim(job):
+                self._execute(job)
+            return job.future.result()
+
+        return self.submit(key, fn, priority).result()
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+
+        for _thread in self._threads:
+            self._queue.put((float("inf"), next(self._seq), _STOP))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._pid = None
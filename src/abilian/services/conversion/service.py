@@ -11,27 +11,48 @@ TODO: rename Converter into ConversionService ?
 
 from __future__ import annotations
 
+import json
 import logging
 import shutil
-import subprocess
-from io import BytesIO
+from contextlib import closing
+from functools import wraps
+from io import BytesIO, TextIOWrapper
+from numbers import Real
 from pathlib import Path
-from typing import List
+from typing import IO, Any, Callable, Iterable, Iterator, List
 
 from flask import Flask
 from PIL import Image
 from PIL.ExifTags import TAGS
 
-from .cache import Cache
+from . import pdfium, prewarm
+from .cache import Cache, CacheKey
 from .exceptions import HandlerNotFound
-from .handlers import Handler
-from .util import make_temp_file
+from .handlers import Handler, pdf_info
+from .metrics import Metrics
+from .scheduler import BACKGROUND, INTERACTIVE, ConversionScheduler, QueueFull
+from .util import Content, make_temp_file, open_content, split_pages
 
 logger = logging.getLogger(__name__)
 
 TMP_DIR = "tmp"
 CACHE_DIR = "cache"
 
+PDF_MIME_TYPES = ("application/pdf", "application/x-pdf")
+
+
+def _measured(method: Callable) -> Callable:
+    """Record metrics of a :class:`Converter` method, named after it.
+
+    Includes calls answered from the cache.
+    """
+
+    @wraps(method)
+    def wrapper(self: Converter, *args: Any, **kwargs: Any) -> Any:
+        return self.metrics.call(method.__name__, method, self, *args, **kwargs)
+
+    return wrapper
+
 
 class Converter:
     tmp_dir: Path
@@ -41,14 +62,31 @@ class Converter:
     def __init__(self):
         self.handlers = []
         self.cache = Cache()
+        self.scheduler = ConversionScheduler()
+        self.metrics = Metrics()
 
     def init_app(self, app: Flask):
+        self.cache.max_size = app.config.get("CONVERSION_CACHE_MAX_SIZE", 0)
+        self.cache.max_age = app.config.get("CONVERSION_CACHE_MAX_AGE", 0)
+        self.cache.use_index = app.config.get("CONVERSION_CACHE_INDEX", False)
         self.init_work_dirs(
             cache_dir=Path(app.instance_path, CACHE_DIR),
             tmp_dir=Path(app.instance_path, TMP_DIR),
         )
 
+        self.scheduler.shutdown()
+        self.scheduler = ConversionScheduler(
+            workers=app.config.get("CONVERSION_WORKERS", 0),
+            max_pending=app.config.get("CONVERSION_MAX_PENDING", 100),
+        )
+
         app.extensions["conversion"] = self
+        pdfium.backend.init_app(app)
+
+        if app.config.get("CONVERSION_PREWARM"):
+            # after repository services: files are committed before tasks
+            # are sent
+            prewarm.register_listeners()
 
         for handler in self.handlers:
             handler.init_app(app)
@@ -65,28 +103,70 @@ class Converter:
 
     def clear(self):
         self.cache.clear()
-        for d in (self.tmp_dir, self.cache_dir):
-            shutil.rmtree(bytes(d))
-            d.mkdir()
+        shutil.rmtree(bytes(self.tmp_dir))
+        self.tmp_dir.mkdir()
 
     def register_handler(self, handler: Handler):
         self.handlers.append(handler)
 
-    # TODO: refactor, pass a "File" or "Document" or "Blob" object
-    def to_pdf(self, digest: str, blob: bytes, mime_type: str) -> bytes:
+    # Content to convert (`blob` parameter) can be given as bytes, as a binary
+    # stream or as a `Blob` instance: prefer the latter for large files, their
+    # content is then streamed instead of being loaded in memory.
+
+    # Conversions go through `self.scheduler`: concurrent requests for the
+    # same (digest, format) share a single conversion. `priority` is one of
+    # `scheduler.INTERACTIVE` or `scheduler.BACKGROUND` (pre-warming).
+
+    def _call(self, handler: Handler, method: str, *args, **kwargs) -> Any:
+        """Call a handler method, and record its metrics."""
+        name = f"{handler.__class__.__name__}.{method}"
+        return self.metrics.call(name, getattr(handler, method), *args, **kwargs)
+
+    def _schedule(self, key: CacheKey, convert: Callable[[], Any], priority: int):
+        if not key[1]:
+            # no digest: can't tell if it's the same content
+            return convert()
+        return self.scheduler.run(key, convert, priority)
+
+    @_measured
+    def to_pdf(
+        self,
+        digest: str,
+        blob: Content,
+        mime_type: str,
+        priority: int = INTERACTIVE,
+    ) -> bytes:
         cache_key = ("pdf", digest)
         pdf = self.cache.get_bytes(cache_key)
         if pdf:
             return pdf
 
-        for handler in self.handlers:
-            if handler.accept(mime_type, "application/pdf"):
-                pdf = handler.convert(blob)
-                self.cache[cache_key] = pdf
+        def convert() -> bytes:
+            # converted meanwhile by another process: miss already counted
+            pdf = self.cache.get_bytes(cache_key, count=False)
+            if pdf:
                 return pdf
-        raise HandlerNotFound(f"No handler found to convert from {mime_type} to PDF")
 
-    def to_text(self, digest: str, blob: bytes, mime_type: str) -> str:
+            for handler in self.handlers:
+                if handler.accept(mime_type, "application/pdf"):
+                    with open_content(blob) as content:
+                        pdf = self._call(handler, "convert", content)
+                    self.cache[cache_key] = pdf
+                    return pdf
+            raise HandlerNotFound(
+                f"No handler found to convert from {mime_type} to PDF"
+            )
+
+        return self._schedule(cache_key, convert, priority)
+
+    @_measured
+    def to_text(
+        self,
+        digest: str,
+        blob: Content,
+        mime_type: str,
+        priority: int = INTERACTIVE,
+    ) -> str:
         """Convert a file to plain text.
 
         Useful for full-text indexing. Returns a Unicode string.
@@ -101,22 +181,117 @@ class Converter:
         if text:
             return text
 
-        # Direct conversion possible
-        for handler in self.handlers:
-            if handler.accept(mime_type, "text/plain"):
-                text = handler.convert(blob)
-                self.cache[cache_key] = text
+        def convert() -> str:
+            # converted meanwhile by another process: miss already counted
+            text = self.cache.get_text(cache_key, count=False)
+            if text:
                 return text
 
-        # Use PDF as a pivot format
-        pdf = self.to_pdf(digest, blob, mime_type)
+            # Direct conversion possible
+            for handler in self.handlers:
+                if handler.accept(mime_type, "text/plain"):
+                    with open_content(blob) as content:
+                        text = self._call(handler, "convert", content)
+                    self.cache[cache_key] = text
+                    return text
+
+            # Use PDF as a pivot format
+            pdf = self.to_pdf(digest, blob, mime_type, priority)
+            for handler in self.handlers:
+                if handler.accept("application/pdf", "text/plain"):
+                    text = self._call(handler, "convert", pdf)
+                    self.cache[cache_key] = text
+                    return text
+
+            raise HandlerNotFound(
+                f"No handler found to convert from {mime_type} to text"
+            )
+
+        return self._schedule(cache_key, convert, priority)
+
+    def iter_text(
+        self,
+        digest: str,
+        blob: Content,
+        mime_type: str,
+        max_length: int | None = None,
+        priority: int = INTERACTIVE,
+    ) -> Iterator[str]:
+        """Convert a file to plain text, page by page.
+
+        Unlike :meth:`to_text`, the whole text is never loaded in memory:
+        pages are read from the cache, or from the PDF to text converter
+        output, as they are consumed. Iteration stops after `max_length`
+        characters.
+
+        The text of a document read to its end is stored in the cache.
+        """
+        # Special case, for now (XXX).
+        if mime_type.startswith("image/"):
+            return
+
+        cache_key = ("txt", digest)
+        cached = self.cache.open(cache_key) if digest else None
+        if cached is not None:
+            pages = self._read_text_pages(cached)
+        else:
+            pages = self._convert_text_pages(digest, blob, mime_type, priority)
+
+        with closing(pages):
+            if max_length is None:
+                yield from pages
+                return
+
+            for page in pages:
+                if len(page) >= max_length:
+                    yield page[:max_length]
+                    return
+                max_length -= len(page)
+                yield page
+
+    def _read_text_pages(self, cached: IO[bytes]) -> Iterator[str]:
+        with TextIOWrapper(cached, encoding="utf8") as stream:
+            yield from split_pages(stream)
+
+    def _convert_text_pages(
+        self, digest: str, blob: Content, mime_type: str, priority: int
+    ) -> Iterator[str]:
         for handler in self.handlers:
-            if handler.accept("application/pdf", "text/plain"):
-                text = handler.convert(pdf)
-                self.cache[cache_key] = text
-                return text
+            if handler.accept(mime_type, "text/plain") and not hasattr(
+                handler, "iter_pages"
+            ):
+                # no page information: whole text at once
+                yield self.to_text(digest, blob, mime_type, priority)
+                return
+
+        if mime_type not in PDF_MIME_TYPES:
+            blob = self.to_pdf(digest, blob, mime_type, priority)
 
-        raise HandlerNotFound(f"No handler found to convert from {mime_type} to text")
+        for handler in self.handlers:
+            if handler.accept("application/pdf", "text/plain"):
+                break
+        else:
+            raise HandlerNotFound("No handler found to convert from PDF to text")
+
+        if not hasattr(handler, "iter_pages"):
+            yield self.to_text(digest, blob, "application/pdf", priority)
+            return
+
+        name = f"{handler.__class__.__name__}.iter_pages"
+        with open_content(blob) as content, closing(
+            handler.iter_pages(content)
+        ) as pages, self.metrics.measure(name) as recorder:
+            if not digest:
+                for page in pages:
+                    recorder.size += len(page)
+                    yield page
+                return
+
+            with self.cache.open_write(("txt", digest)) as f:
+                for page in pages:
+                    recorder.size += len(page)
+                    f.write(page.encode("utf8") + b"\f")
+                    yield page
 
     def has_image(self, digest, mime_type, index, size=500):
         """Tell if there is a preview image."""
@@ -133,12 +308,22 @@ class Converter:
         cache_key = (f"img:{index}:{size}", digest)
         return self.cache.get(cache_key)
 
+    @_measured
     def to_image(
-        self, digest: str, blob: bytes, mime_type: str, index: int, size: int = 500
+        self,
+        digest: str,
+        blob: Content,
+        mime_type: str,
+        index: int,
+        size: int = 500,
+        priority: int = INTERACTIVE,
     ) -> bytes:
-        """Convert a file to a list of images.
+        """Render page `index` of a file as a JPEG image, scaled so that its
+        largest side is `size` pixels.
 
-        Returns image at the given index.
+        Only the requested page is rendered; when the content is available
+        in memory, the next and previous pages are then rendered in
+        background.
         """
         # Special case, for now (XXX).
         if mime_type.startswith("image/"):
@@ -149,40 +334,162 @@ class Converter:
         if converted:
             return converted
 
-        # Direct conversion possible
-        for handler in self.handlers:
-            if handler.accept(mime_type, "image/jpeg"):
-                converted_images = handler.convert(blob, size=size)
-                for i in range(0, len(converted_images)):
-                    converted = converted_images[i]
-                    cache_key = (f"img:{i}:{size}", digest)
-                    self.cache[cache_key] = converted
-                return converted_images[index]
-
-        # Use PDF as a pivot format
-        pdf = self.to_pdf(digest, blob, mime_type)
+        def convert() -> bytes:
+            # converted meanwhile by another process: miss already counted
+            converted = self.cache.get_bytes(cache_key, count=False)
+            if converted:
+                return converted
+
+            if mime_type in PDF_MIME_TYPES:
+                with open_content(blob) as content:
+                    converted = self._render_page(content, index, size)
+            else:
+                # Use PDF as a pivot format
+                pdf = self.to_pdf(digest, blob, mime_type, priority)
+                converted = self._render_page(pdf, index, size)
+                self._prerender_neighbours(digest, pdf, index, size)
+
+            self.cache[cache_key] = converted
+            return converted
+
+        converted = self._schedule(cache_key, convert, priority)
+        if mime_type in PDF_MIME_TYPES and isinstance(blob, bytes):
+            self._prerender_neighbours(digest, blob, index, size)
+        return converted
+
+    def _page_renderer(self) -> Handler:
         for handler in self.handlers:
             if handler.accept("application/pdf", "image/jpeg"):
-                converted_images = handler.convert(pdf, size=size)
-                for i in range(0, len(converted_images)):
-                    converted = converted_images[i]
-                    cache_key = (f"img:{i}:{size}", digest)
-                    self.cache[cache_key] = converted
-                return converted_images[index]
+                return handler
+        raise HandlerNotFound("No handler found to convert from PDF to image")
+
+    def _render_page(self, pdf: bytes | IO[bytes], index: int, size: int) -> bytes:
+        handler = self._page_renderer()
+        if hasattr(handler, "render_page"):
+            return self._call(handler, "render_page", pdf, index, size)
+        # handler can only render all pages
+        return self._call(handler, "convert", pdf, size=size)[index]
 
-        raise HandlerNotFound(f"No handler found to convert from {mime_type} to image")
+    def _prerender_neighbours(self, digest: str, pdf: bytes, index: int, size: int):
+        """Render pages around `index` in background, for a smooth browsing.
 
-    def get_metadata(self, digest, content, mime_type):
+        Needs worker threads (`CONVERSION_WORKERS`), and PDF content in memory
+        (it must outlive the current request).
+        """
+        if not self.scheduler.workers or not digest:
+            return
+
+        page_count = self.get_page_count(digest, pdf, "application/pdf")
+        for i in (index + 1, index - 1):
+            if not 0 <= i < page_count:
+                continue
+            if (f"img:{i}:{size}", digest) in self.cache:
+                continue
+
+            def prerender(i: int = i):
+                cache_key = (f"img:{i}:{size}", digest)
+                if cache_key not in self.cache:
+                    self.cache[cache_key] = self._render_page(pdf, i, size)
+
+            try:
+                self.scheduler.submit(
+                    (f"img:{i}:{size}", digest), prerender, BACKGROUND
+                )
+            except QueueFull:
+                # busy: pages will be rendered on demand
+                return
+
+    def get_page_count(
+        self,
+        digest: str,
+        blob: Content,
+        mime_type: str,
+        priority: int = INTERACTIVE,
+    ) -> int:
+        """Number of pages of a document (1 for images).
+
+        Only PDF metadata is read, no page is rendered. Documents in other
+        formats are converted to PDF first.
+        """
+        if mime_type.startswith("image/"):
+            return 1
+
+        metadata = self.get_metadata(digest, blob, mime_type, priority)
+        return int(metadata.get("PDF:Pages", 0))
+
+    @_measured
+    def get_metadata(
+        self,
+        digest: str,
+        content: Content,
+        mime_type: str,
+        priority: int = INTERACTIVE,
+    ) -> dict[str, Any]:
         """Get a dictionary representing the metadata embedded in the given
-        content."""
+        content.
 
+        The result is cached: values are converted to JSON types (EXIF
+        rationals to floats, bytes to strings, tuples to lists).
+        """
+        cache_key = ("meta", digest)
+        cached = self.cache.get_bytes(cache_key) if digest else None
+        if cached:
+            return json.loads(cached)
+
+        def extract() -> dict[str, Any]:
+            # extracted meanwhile by another process: miss already counted
+            cached = self.cache.get_bytes(cache_key, count=False)
+            if cached:
+                return json.loads(cached)
+
+            metadata = _json_value(self._extract_metadata(digest, content, mime_type))
+            self.cache[cache_key] = json.dumps(metadata).encode()
+            return metadata
+
+        return self._schedule(cache_key, extract, priority)
+
+    def stats(self) -> dict[str, Any]:
+        """Cache counters and conversion metrics of this process."""
+        return {"cache": self.cache.stats(), "metrics": self.metrics.snapshot()}
+
+    def get_metadata_batch(
+        self, items: Iterable[tuple[str, Content, str]]
+    ) -> dict[str, dict[str, Any]]:
+        """Metadata of several documents, given as `(digest, content,
+        mime_type)` tuples, by digest.
+
+        Pass `Blob` instances as content: content of documents whose
+        metadata is cached is not read.
+        """
+        result: dict[str, dict[str, Any]] = {}
+        missing = []
+        for digest, content, mime_type in items:
+            if digest in result:
+                continue
+            cached = self.cache.get_bytes(("meta", digest)) if digest else None
+            if cached:
+                result[digest] = json.loads(cached)
+            else:
+                missing.append((digest, content, mime_type))
+
+        for digest, content, mime_type in missing:
+            result[digest] = self.get_metadata(digest, content, mime_type)
+        return result
+
+    def _extract_metadata(
+        self, digest: str, content: Content, mime_type: str
+    ) -> dict[str, Any]:
         # XXX: ad-hoc for now, refactor later
         if mime_type.startswith("image/"):
-            img = Image.open(BytesIO(content))
-            ret = {}
-            if not hasattr(img, "_getexif"):
-                return {}
-            info = img._getexif()
+            with open_content(content) as stream:
+                if isinstance(stream, bytes):
+                    stream = BytesIO(stream)
+                # only image headers are read
+                img = Image.open(stream)
+                ret = {}
+                if not hasattr(img, "_getexif"):
+                    return {}
+                info = img._getexif()
             if not info:
                 return {}
             for tag, value in info.items():
@@ -191,21 +498,31 @@ class Converter:
             return ret
 
         else:
-            if mime_type != "application/pdf":
+            if mime_type not in PDF_MIME_TYPES:
                 content = self.to_pdf(digest, content, mime_type)
 
-            with make_temp_file(content) as in_fn:
-                try:
-                    output = subprocess.check_output(["pdfinfo", in_fn])
-                except OSError:
-                    logger.error("Conversion failed, probably pdfinfo is not installed")
-                    raise
-
-            ret = {}
-            for line in output.split(b"\n"):
-                if b":" in line:
-                    key, value = line.strip().split(b":", 1)
-                    key = str(key)
-                    ret[f"PDF:{key}"] = str(value.strip(), errors="replace")
-
-            return ret
+            with open_content(content) as stream:
+                info = self.metrics.call(
+                    "pdfium.info", pdfium.backend.call, stream, pdfium.info
+                )
+                if info is None:
+                    with make_temp_file(stream) as in_fn:
+                        info = self.metrics.call("pdfinfo", pdf_info, in_fn)
+
+            return {f"PDF:{key}": value for key, value in info.items()}
+
+
+def _json_value(value: Any) -> Any:
+    """Convert metadata values (like EXIF rationals) to JSON types."""
+    if isinstance(value, dict):
+        return {str(k): _json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    if isinstance(value, bytes):
+        return value.decode("utf8", errors="replace").rstrip("\x00")
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, Real):
+        # float, IFDRational
+        return float(value)
+    return str(value)
@@ -3,15 +3,33 @@ from __future__ import annotations
 import os
 import sys
 import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
 from pathlib import Path
 from typing import Iterator, Union
 from warnings import warn
 
+from flask import Flask
 from magic import Magic
-from pytest import fixture, mark
+from pytest import fixture, importorskip, mark, raises
 
+from abilian.core.models.blob import Blob
+from abilian.core.sqlalchemy import SQLAlchemy
+from abilian.services.conversion import pdfium, prewarm
+from abilian.services.conversion.cache import Cache
+from abilian.services.conversion.exceptions import ConversionError
 from abilian.services.conversion.handlers import HAS_LIBREOFFICE, HAS_PDFTOTEXT
+from abilian.services.conversion.libreoffice import OfficePool, uno
+from abilian.services.conversion.metrics import Metrics
+from abilian.services.conversion.scheduler import (
+    BACKGROUND,
+    ConversionScheduler,
+    QueueFull,
+)
 from abilian.services.conversion.service import Converter
+from abilian.services.conversion.util import run_process, split_pages
+from abilian.testing.fixtures import TestConfig
 
 mime_sniffer = Magic(mime=True)
 encoding_sniffer = Magic(mime_encoding=True)
@@ -43,6 +61,55 @@ def test_pdf_to_text(converter):
     assert text
 
 
+@mark.skipif(not HAS_PDFTOTEXT, reason="requires poppler or poppler-util")
+def test_pdf_to_text_pages(converter: Converter):
+    blob = read_file("onepage.pdf")
+    pages = list(converter.iter_text("onepage", blob, "application/pdf"))
+    assert len(pages) == 1
+    assert pages[0]
+
+    # read from cache
+    assert converter.cache.get_text(("txt", "onepage")) == pages[0] + "\f"
+    assert list(converter.iter_text("onepage", blob, "application/pdf")) == pages
+
+    truncated = list(
+        converter.iter_text("onepage", blob, "application/pdf", max_length=5)
+    )
+    assert truncated == [pages[0][:5]]
+
+
+def test_split_pages():
+    stream = StringIO("page 1\fpage 2\f\fpage 4\f")
+    assert list(split_pages(stream)) == ["page 1", "page 2", "", "page 4"]
+
+
+def test_run_process():
+    run_process(["true"], timeout=5)
+
+    with raises(ConversionError):
+        run_process(["false"], timeout=5)
+
+    # the process and its children are killed on timeout
+    start = time.time()
+    with raises(ConversionError, match="timeout"):
+        run_process(["sh", "-c", "sleep 30 & sleep 30"], timeout=0.5)
+    assert time.time() - start < 5
+
+
+def test_run_process_in_parallel():
+    # each call waits for its own process
+    threads = [
+        threading.Thread(target=run_process, args=(["sleep", "0.5"], 5))
+        for _i in range(4)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.time() - start < 2
+
+
 @mark.skipif(not HAS_LIBREOFFICE, reason="requires libreoffice")
 def test_word_to_text(converter: Converter):
     blob = read_file("test.doc")
@@ -86,6 +153,60 @@ def test_image_to_pdf(converter: Converter):
     assert "application/pdf" == mime_sniffer.from_buffer(pdf)
 
 
+# In-process PDF backend
+def test_pdfium_backend():
+    importorskip("pypdfium2")
+    blob = read_file("onepage.pdf")
+    backend = pdfium.PdfiumBackend()
+
+    assert backend.call(blob, pdfium.page_count) == 1
+    assert backend.call(blob, pdfium.info)["Pages"] == "1"
+    (text,) = backend.call(BytesIO(blob), pdfium.text_pages)
+    assert "Foo Bar" in text
+    image = backend.call(blob, pdfium.render_page, 0, 100)
+    assert "image/jpeg" == mime_sniffer.from_buffer(image)
+    with raises(IndexError):
+        backend.call(blob, pdfium.render_page, 1, 100)
+
+    # fallback
+    stream = BytesIO(b"not a pdf")
+    assert backend.call(stream, pdfium.page_count) is None
+    assert stream.tell() == 0
+    backend.max_size = 10
+    assert not backend.accepts(blob)
+    assert backend.call(blob, pdfium.page_count) is None
+
+
+# Metadata
+def test_image_metadata(converter: Converter):
+    blob = read_file("picture.jpg")
+    hits, misses = converter.cache.hits, converter.cache.misses
+    metadata = converter.get_metadata("picture", blob, "image/jpeg")
+    assert ("meta", "picture") in converter.cache
+    # cached result doesn't need content
+    assert converter.get_metadata("picture", b"", "image/jpeg") == metadata
+    # one miss, one hit
+    assert converter.cache.misses == misses + 1
+    assert converter.cache.hits == hits + 1
+
+    batch = converter.get_metadata_batch(
+        [
+            ("picture", b"", "image/jpeg"),
+            ("mugshot", read_file("mugshot.jpg"), "image/jpeg"),
+        ]
+    )
+    assert batch["picture"] == metadata
+    assert ("meta", "mugshot") in converter.cache
+
+
+@mark.skipif(not HAS_PDFTOTEXT, reason="requires poppler or poppler-util")
+def test_pdf_metadata(converter: Converter):
+    blob = read_file("onepage.pdf")
+    metadata = converter.get_metadata("onepage", blob, "application/pdf")
+    assert metadata["PDF:Pages"] == "1"
+    assert converter.get_metadata("onepage", b"", "application/pdf") == metadata
+
+
 # To images
 @mark.skipif(not HAS_PDFTOTEXT, reason="requires poppler or poppler-util")
 def test_pdf_to_images(converter: Converter):
@@ -97,6 +218,21 @@ def test_pdf_to_images(converter: Converter):
     assert "image/jpeg" == mime_sniffer.from_buffer(image)
 
 
+@mark.skipif(not HAS_PDFTOTEXT, reason="requires poppler or poppler-util")
+def test_pdf_page_rendering(converter: Converter):
+    blob = read_file("onepage.pdf")
+    assert converter.get_page_count("onepage", blob, "application/pdf") == 1
+    # read from cached metadata
+    assert ("meta", "onepage") in converter.cache
+
+    image = converter.to_image("onepage", blob, "application/pdf", 0, size=100)
+    assert "image/jpeg" == mime_sniffer.from_buffer(image)
+    assert converter.has_image("onepage", "application/pdf", 0, size=100)
+
+    with raises(IndexError):
+        converter.to_image("onepage", blob, "application/pdf", 1, size=100)
+
+
 # @mark.skipif(
 #    not HAS_PDFTOTEXT or not HAS_LIBREOFFICE, reason="requires poppler or poppler-util"
 # )
@@ -105,3 +241,242 @@ def test_word_to_images(converter: Converter):
     blob = read_file("test.doc")
     image = converter.to_image("", blob, "application/msword", 0)
     assert "image/jpeg" == mime_sniffer.from_buffer(image)
+
+
+@mark.skipif(not HAS_LIBREOFFICE or uno is None, reason="requires libreoffice and uno")
+def test_libreoffice_pool(converter: Converter, tmp_path: Path):
+    pool = OfficePool("soffice", size=1, work_dir=tmp_path, max_jobs=1)
+    try:
+        blob = read_file("test.odt")
+        pdf = pool.convert(blob)
+        assert "application/pdf" == mime_sniffer.from_buffer(pdf)
+
+        # instance is recycled after max_jobs conversions
+        worker = pool._workers[0]
+        pid = worker.process.pid
+        pdf = pool.convert(blob)
+        assert "application/pdf" == mime_sniffer.from_buffer(pdf)
+        assert worker.process.pid != pid
+    finally:
+        pool.shutdown()
+
+
+# Scheduler
+def test_scheduler_single_flight():
+    scheduler = ConversionScheduler(workers=2)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def convert():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b"result"
+
+    try:
+        f1 = scheduler.submit(("digest", "pdf"), convert)
+        started.wait(5)
+        f2 = scheduler.submit(("digest", "pdf"), convert)
+        assert f1 is f2
+        release.set()
+        assert f1.result(5) == b"result"
+        assert calls == [1]
+
+        # job is done: next call converts again
+        assert scheduler.run(("digest", "pdf"), convert) == b"result"
+        assert calls == [1, 1]
+    finally:
+        scheduler.shutdown()
+
+
+def test_scheduler_backpressure():
+    scheduler = ConversionScheduler(workers=1, max_pending=1)
+    release = threading.Event()
+
+    try:
+        running = scheduler.submit("running", lambda: release.wait(5))
+        # wait for the worker to take the first job
+        while not scheduler._inflight["running"].started:
+            time.sleep(0.01)
+
+        scheduler.submit("pending", lambda: None, priority=BACKGROUND)
+        with raises(QueueFull):
+            scheduler.submit("rejected", lambda: None, priority=BACKGROUND)
+
+        release.set()
+        assert running.result(5)
+    finally:
+        scheduler.shutdown()
+
+
+def test_scheduler_base_exception():
+    class Abort(BaseException):
+        pass
+
+    scheduler = ConversionScheduler(workers=0)
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def convert():
+        started.set()
+        release.wait(5)
+        raise Abort()
+
+    def first():
+        try:
+            scheduler.run("key", convert)
+        except Abort as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait(5)
+    # joins the running job
+    future = scheduler.submit("key", convert)
+    release.set()
+    with raises(Abort):
+        future.result(5)
+    thread.join(5)
+    assert len(errors) == 1
+    assert scheduler._inflight == {}
+
+
+def test_scheduler_inline():
+    scheduler = ConversionScheduler(workers=0)
+    assert scheduler.run("key", lambda: 42) == 42
+    assert scheduler._inflight == {}
+
+
+# Metrics
+def test_metrics():
+    metrics = Metrics()
+    assert metrics.call("convert", lambda: b"12345") == b"12345"
+    with raises(ValueError), metrics.measure("convert"):
+        raise ValueError()
+
+    error, ok = metrics.snapshot()
+    assert (ok["name"], ok["outcome"], ok["count"]) == ("convert", "ok", 1)
+    assert ok["total_size"] == 5
+    assert (error["outcome"], error["count"]) == ("error", 1)
+
+    metrics.reset()
+    assert metrics.snapshot() == []
+
+
+# Cache
+def test_cache_size_eviction(tmp_path: Path):
+    cache = Cache(tmp_path, max_size=25)
+    keys = [("pdf", f"digest{i}") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache[key] = b"0123456789"
+        # make access order deterministic
+        os.utime(str(cache._path(key)), (i, i))
+
+    # third entry exceeded size: least recently used entry is gone
+    assert keys[0] not in cache
+    assert cache.get_bytes(keys[1]) == b"0123456789"
+    assert cache.get_bytes(keys[0]) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "size": 20}
+
+    cache.clear()
+    assert keys[1] not in cache
+    assert cache.size() == 0
+
+
+def test_cache_low_water(tmp_path: Path):
+    cache = Cache(tmp_path, max_size=100)
+    scans = []
+    files = cache._files
+    cache._files = lambda: scans.append(1) or files()
+
+    for i in range(200):
+        cache[("pdf", f"digest{i:03}")] = b"0"
+    assert cache.size() <= 100
+    # once full, evictions make room for several writes
+    assert len(scans) < 30
+
+
+def test_cache_no_digest(tmp_path: Path):
+    cache = Cache(tmp_path)
+    cache[("meta", None)] = b"{}"
+    assert ("meta", None) not in cache
+    assert cache.get_bytes(("meta", None)) is None
+    assert cache.open(("txt", "")) is None
+    with cache.open_write(("txt", None)) as f:
+        f.write(b"text")
+    assert cache.size() == 0
+
+
+def test_cache_age_eviction(tmp_path: Path):
+    cache = Cache(tmp_path, max_age=3600)
+    cache[("txt", "digest")] = "text"
+    assert cache.get_text(("txt", "digest")) == "text"
+    assert cache.get_text(("txt", "digest"), count=False) == "text"
+    assert cache.hits == 1
+    os.utime(str(cache._path(("txt", "digest"))), (0, 0))
+
+    cache.evict()
+    assert ("txt", "digest") not in cache
+    assert cache.evictions == 1
+
+
+def test_cache_index(tmp_path: Path):
+    # entries written before the index is created are indexed
+    Cache(tmp_path)[("pdf", "digest0")] = b"0123456789"
+
+    cache = Cache(tmp_path, max_size=25, use_index=True)
+    assert cache.size() == 10
+    cache[("pdf", "digest1")] = b"0123456789"
+    # digest1 becomes the least recently used
+    assert cache.get_bytes(("pdf", "digest0")) == b"0123456789"
+    cache[("pdf", "digest2")] = b"0123456789"
+
+    assert ("pdf", "digest1") not in cache
+    assert ("pdf", "digest0") in cache
+    assert cache.size() == 20
+    assert cache.evictions == 1
+
+    cache.clear()
+    assert cache.size() == 0
+    assert ("pdf", "digest0") not in cache
+
+
+# Pre-warming
+def test_prewarm_policy():
+    policy = prewarm.DEFAULT_POLICY
+    assert prewarm.renditions_for("application/pdf", policy) == ["text", "image"]
+    assert "pdf" in prewarm.renditions_for(
+        "application/vnd.oasis.opendocument.text", policy
+    )
+    assert prewarm.renditions_for("image/png", policy) == []
+
+
+def test_prewarm_claim(converter: Converter):
+    assert prewarm.claim(converter.cache_dir, "digest")
+    # already queued
+    assert not prewarm.claim(converter.cache_dir, "digest")
+    prewarm.release(converter.cache_dir, "digest")
+    assert prewarm.claim(converter.cache_dir, "digest")
+
+
+class PrewarmConfig(TestConfig):
+    CONVERSION_PREWARM = True
+    CONVERSION_PREWARM_POLICY = {"application/pdf": ["text"]}
+
+
+@mark.skipif(not HAS_PDFTOTEXT, reason="requires poppler or poppler-util")
+@mark.parametrize("config", [PrewarmConfig])
+def test_prewarm_on_commit(app: Flask, db: SQLAlchemy, config: type):
+    from abilian.services.conversion import converter
+
+    blob = Blob(read_file("onepage.pdf"))
+    blob.meta["mimetype"] = "application/pdf"
+    db.session.add(blob)
+    db.session.commit()
+
+    # tasks are run eagerly in tests
+    digest = blob.md5
+    assert ("txt", digest) in converter.cache
+    assert not prewarm._marker(converter.cache_dir, digest).exists()
@@ -2,10 +2,15 @@ from __future__ import annotations
 
 import logging
 import os
+import shutil
+import signal
+import subprocess
 from contextlib import contextmanager
 from pathlib import Path
 from tempfile import mkstemp
-from typing import Iterator, Optional
+from typing import IO, Any, Iterator, Optional, Sequence, Union
+
+from .exceptions import ConversionError
 
 logger = logging.getLogger(__name__)
 
@@ -22,22 +27,58 @@ def get_tmp_dir() -> Path:
     return converter.tmp_dir
 
 
+#: Content accepted by the converter: bytes, a binary stream, or an object
+#: with an `open()` method returning a binary stream (like a `Blob`).
+Content = Union[bytes, IO[bytes], Any]
+
+CHUNK_SIZE = 256 * 1024
+
+#: time given to a process to exit after SIGTERM, before SIGKILL
+KILL_GRACE = 5
+
+
 # Utils
+@contextmanager
+def open_content(content: Content) -> Iterator[bytes | IO[bytes]]:
+    """Give `content` as bytes or as a binary stream.
+
+    :class:`Path` and :class:`~abilian.core.models.blob.Blob` instances are
+    opened, and closed on exit.
+    """
+    if isinstance(content, bytes) or hasattr(content, "read"):
+        yield content
+        return
+
+    if isinstance(content, Path):
+        stream = content.open("rb")
+    else:
+        stream = content.open()
+
+    with stream:
+        yield stream
+
+
 @contextmanager
 def make_temp_file(
-    blob: bytes | None = None,
+    blob: bytes | IO[bytes] | None = None,
     prefix: str = "tmp",
     suffix: str = "",
     tmp_dir: Path | None = None,
 ) -> Iterator[str]:
+    """Create a temporary file, filled with `blob` if given.
 
+    `blob` may be a binary stream, which is copied by chunks.
+    """
     if tmp_dir is None:
         tmp_dir = get_tmp_dir()
 
     fd, filename = mkstemp(dir=str(tmp_dir), prefix=prefix, suffix=suffix)
     if blob is not None:
         io = os.fdopen(fd, "wb")
-        io.write(blob)
+        if hasattr(blob, "read"):
+            shutil.copyfileobj(blob, io, CHUNK_SIZE)
+        else:
+            io.write(blob)
         io.close()
     else:
         os.close(fd)
@@ -48,3 +89,66 @@ def make_temp_file(
         os.remove(filename)
     except OSError:
         pass
+
+
+def split_pages(stream: IO[str]) -> Iterator[str]:
+    """Read text from `stream` by chunks, and yield pages separated by form
+    feeds (as in `pdftotext` output)."""
+    buffer = ""
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), ""):
+        buffer += chunk
+        *pages, buffer = buffer.split("\f")
+        yield from pages
+    if buffer:
+        yield buffer
+
+
+def run_process(
+    cmd: Sequence[str], timeout: float, cwd: str | Path | None = None
+) -> None:
+    """Run `cmd` and wait for it to complete.
+
+    The process belongs to this call only, so conversions can run in
+    parallel threads. It is started in its own process group: on timeout the
+    whole group (like `soffice.bin` started by `soffice`) is terminated, then
+    killed if it doesn't exit within :data:`KILL_GRACE` seconds.
+
+    :raises ConversionError: if the process can't be started, times out or
+        exits with an error.
+    """
+    name = os.path.basename(cmd[0])
+    try:
+        process = subprocess.Popen(cmd, cwd=cwd, close_fds=True, start_new_session=True)
+    except OSError as e:
+        logger.error("Can't run %s: %s", name, e, exc_info=True)
+        raise ConversionError(f"{name} failed") from e
+
+    try:
+        returncode = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        _kill(process)
+        raise ConversionError(f"Conversion timeout ({timeout})")
+    except BaseException:
+        # interrupted: don't leave the process behind
+        _kill(process)
+        raise
+
+    if returncode != 0:
+        raise ConversionError(f"{name} failed (exit code {returncode})")
+
+
+def _kill(process: subprocess.Popen):
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            # already gone
+            pass
+        except OSError:
+            logger.warning("Failed to kill process %s", process.pid)
+        try:
+            process.wait(KILL_GRACE)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+    logger.warning("Process %s did not exit", process.pid)
@@ -5,11 +5,28 @@ from __future__ import annotations
 
 import hashlib
 from io import BytesIO
-from typing import Any, Dict, Tuple, Union
+from typing import IO, Any, Dict, Tuple, Union
 
+from flask import Flask
 from PIL import Image
 
-__all__ = ["resize", "get_format", "RESIZE_MODES", "SCALE", "FIT", "CROP"]
+from .cache import ImageCache
+
+__all__ = [
+    "resize",
+    "get_format",
+    "image_cache",
+    "ImageCache",
+    "RESIZE_MODES",
+    "SCALE",
+    "FIT",
+    "CROP",
+    "FAST",
+    "BEST",
+    "init_app",
+    "can_save",
+    "MIME_TYPES",
+]
 
 # resize modes
 
@@ -26,8 +43,51 @@ CROP = "crop"
 
 RESIZE_MODES = frozenset({SCALE, FIT, CROP})
 
-# TODO: cache to file
-cache: dict[Any, bytes] = {}
+# resize qualities
+
+#: JPEG images are decoded at reduced scale (DCT scaling), then resized with a
+#: bicubic filter and a small `reducing_gap`: much faster for large photos,
+#: with hardly visible differences on thumbnails. Other formats are first
+#: reduced by an integer factor, then resized with the same filter.
+FAST = "fast"
+
+#: Lanczos filter, with Pillow default decoding scale and `reducing_gap`
+BEST = "best"
+
+QUALITIES = frozenset({FAST, BEST})
+
+#: default quality, set from `IMAGE_RESIZE_QUALITY` by :func:`init_app`
+default_quality = BEST
+
+#: `reducing_gap` used by :data:`FAST`: image is decoded, then reduced by
+#: integer factors, down to at least this times the target size (Pillow
+#: default is 2)
+FAST_REDUCING_GAP = 1.0
+
+#: MIME types of image formats
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+    "AVIF": "image/avif",
+}
+
+CHUNK_SIZE = 256 * 1024
+
+#: resized images, configured by the application (see :class:`ImageCache`)
+image_cache = ImageCache()
+
+
+def init_app(app: Flask):
+    """Set resize quality (`IMAGE_RESIZE_QUALITY`) and configure the cache of
+    resized images."""
+    global default_quality
+    quality = app.config.get("IMAGE_RESIZE_QUALITY", BEST)
+    if quality not in QUALITIES:
+        raise ValueError(f"Invalid IMAGE_RESIZE_QUALITY: {quality!r}")
+    default_quality = quality
+    image_cache.init_app(app)
 
 
 def open_image(img: BytesIO | bytes) -> Image.Image:
@@ -47,6 +107,13 @@ def get_format(img):
     return image.format
 
 
+def can_save(fmt: str) -> bool:
+    """Return `True` if images can be saved in format `fmt` (like `"WEBP"`),
+    i.e. Pillow was built with support for it."""
+    Image.init()
+    return fmt in Image.SAVE
+
+
 def get_size(img: bytes) -> tuple[int, int]:
     image = open_image(img)
     return image.size
@@ -58,50 +125,137 @@ def get_save_format(fmt: str) -> str:
     return "JPEG"
 
 
-def resize(orig: Any, width: int, height: int, mode: str = FIT) -> bytes:
+def _digest(stream: IO[bytes]) -> str:
+    digest = hashlib.md5()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(
+    source_id: str,
+    width: int,
+    height: int,
+    mode: str = FIT,
+    format: str | None = None,
+    quality: str | None = None,
+) -> tuple:
+    """Key of a rendition in :data:`image_cache`."""
+    return (
+        source_id,
+        mode,
+        width,
+        height,
+        format or "auto",
+        quality or default_quality,
+    )
+
+
+def resize(
+    orig: Any,
+    width: int,
+    height: int,
+    mode: str = FIT,
+    format: str | None = None,
+    source_id: str | None = None,
+    quality: str | None = None,
+) -> bytes:
+    """Resize image.
+
+    :param orig: image as bytes or a seekable binary stream, or a function
+        returning one of them: it is then called only if the rendition is not
+        cached (a stream it returns is closed after use).
+    :param format: output format; default: PNG for GIF and PNG images, JPEG
+        otherwise.
+    :param source_id: stable identifier of the image content, like a blob
+        digest, that changes when the content changes. Cached renditions are
+        then found without reading `orig`; otherwise, `orig` is read and hashed
+        to look up the cache.
+    :param quality: :data:`FAST` or :data:`BEST`; default:
+        :data:`default_quality`.
+    """
+    quality = quality or default_quality
+    if source_id is not None:
+        key = cache_key(source_id, width, height, mode, format, quality)
+        converted = image_cache.get(key)
+        if converted is not None:
+            return converted
+
+    opened = callable(orig)
+    if opened:
+        orig = orig()
     if isinstance(orig, bytes):
         orig = BytesIO(orig)
 
-    digest = hashlib.md5(orig.read()).digest()
-    cache_key = (digest, mode, width, height)
-    if cache_key in cache:
-        return cache[cache_key]
+    try:
+        if source_id is None:
+            key = cache_key(_digest(orig), width, height, mode, format, quality)
+            converted = image_cache.get(key)
+            if converted is not None:
+                return converted
+            orig.seek(0)
+
+        converted = _resize(orig, width, height, mode, format, quality)
+    finally:
+        if opened:
+            orig.close()
+
+    image_cache.set(key, converted)
+    return converted
+
 
-    orig.seek(0)
+def _resize(
+    orig: IO[bytes],
+    width: int,
+    height: int,
+    mode: str,
+    format: str | None,
+    quality: str,
+) -> bytes:
     image = open_image(orig)
     image_format = image.format
     x, y = image.size
 
-    if (x, y) == (width, height):
-        orig.seek(0)
+    if (x, y) == (width, height) and format in (None, image_format):
         return orig.read()
 
-    if mode is SCALE:
+    if mode == SCALE:
         image = image.resize((width, height), Image.LANCZOS)
         assert image.size == (width, height)
-    elif mode is FIT:
+    elif mode == FIT:
         if x >= width or y >= height:
             # resize only if images exceed desired dimensions
-            image.thumbnail((width, height), Image.LANCZOS)
+            if quality == FAST:
+                # thumbnail() calls draft() with the reducing gap: JPEG images
+                # are decoded at the smallest scale still larger than target
+                image.thumbnail(
+                    (width, height), Image.BICUBIC, reducing_gap=FAST_REDUCING_GAP
+                )
+            else:
+                image.thumbnail((width, height), Image.LANCZOS)
             x1, y1 = image.size
             assert x1 == width or y1 == height
-    elif mode is CROP:
-        image = _crop_and_resize(image, width, height)
+    elif mode == CROP:
+        if quality == FAST:
+            image = _fast_crop_and_resize(image, width, height)
+        else:
+            image = _crop_and_resize(image, width, height)
         assert image.size == (width, height)
 
-    output = BytesIO()
-    image.save(output, get_save_format(image_format))
-    converted = output.getvalue()
-    cache[cache_key] = converted
-    return converted
+    save_format = format or get_save_format(image_format)
+    if save_format == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
 
+    output = BytesIO()
+    image.save(output, save_format)
+    return output.getvalue()
 
-def _crop_and_resize(image: Image.Image, width: int, height: int = 0) -> Image.Image:
-    if not height:
-        height = width
 
-    # Compute cropping coordinates
-    x0, y0 = image.size
+def _crop_box(
+    size: tuple[int, int], width: int, height: int
+) -> tuple[int, int, int, int]:
+    """Centered box of `size` with the proportions of `width` x `height`."""
+    x0, y0 = size
 
     w_ratio = 1.0 * x0 / width
     h_ratio = 1.0 * y0 / height
@@ -117,7 +271,35 @@ def _crop_and_resize(image: Image.Image, width: int, height: int = 0) -> Image.I
         y1 = 0
         y2 = y0
 
-    image = image.crop((x1, y1, x2, y2))
+    return x1, y1, x2, y2
+
+
+def _crop_and_resize(image: Image.Image, width: int, height: int = 0) -> Image.Image:
+    if not height:
+        height = width
+
+    image = image.crop(_crop_box(image.size, width, height))
     # image.load()
     image = image.resize((width, height), Image.LANCZOS)
     return image
+
+
+def _fast_crop_and_resize(image: Image.Image, width: int, height: int) -> Image.Image:
+    x0, y0 = image.size
+    x1, y1, x2, y2 = _crop_box(image.size, width, height)
+
+    # decode at the smallest scale where the cropped area is still larger than
+    # the target size (no-op for other formats than JPEG)
+    image.draft(
+        None,
+        (
+            int(x0 * width * FAST_REDUCING_GAP / (x2 - x1)),
+            int(y0 * height * FAST_REDUCING_GAP / (y2 - y1)),
+        ),
+    )
+    scale_x = image.size[0] / x0
+    scale_y = image.size[1] / y0
+    box = (x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y)
+    return image.resize(
+        (width, height), Image.BICUBIC, box=box, reducing_gap=FAST_REDUCING_GAP
+    )
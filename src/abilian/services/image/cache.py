@@ -0,0 +1,212 @@
+"""Two-tier cache for resized images.
+
+Renditions are kept in memory, in a least recently used list bounded in
+bytes (`max_memory`), in front of a directory shared by all processes
+(`cache_dir`, optionally bounded by `max_size` bytes). Without `cache_dir`
+(no application configured), only the memory tier is used.
+
+A key is a tuple whose first item is the source digest (hexadecimal), followed
+by the rendition parameters, output format included: `(digest, mode, width,
+height, format, quality)`. Files are named after the key, in
+`cache_dir/<digest[:2]>/`.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Tuple
+
+from flask import Flask
+
+ImageKey = Tuple[Any, ...]
+
+DEFAULT_MAX_MEMORY = 16 * 1024**2
+
+#: after an eviction, the disk tier is shrunk to this fraction of `max_size`,
+#: so that the directory isn't scanned again on the next write
+LOW_WATER = 0.9
+
+
+class ImageCache:
+    def __init__(
+        self,
+        max_memory: int = DEFAULT_MAX_MEMORY,
+        cache_dir: Path | None = None,
+        max_size: int = 0,
+    ):
+        self.max_memory = max_memory
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._memory: OrderedDict[ImageKey, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: int | None = None
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app: Flask):
+        self.max_memory = app.config.get("IMAGE_CACHE_MEMORY", DEFAULT_MAX_MEMORY)
+        self.max_size = app.config.get("IMAGE_CACHE_MAX_SIZE", 0)
+        cache_dir = app.config.get("IMAGE_CACHE_DIR")
+        if cache_dir is None:
+            cache_dir = Path(app.instance_path, "image_cache")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.clear_memory()
+        with self._disk_lock:
+            self._disk_size = None
+
+    def _path(self, key: ImageKey) -> Path:
+        digest = str(key[0])
+        name = "-".join(str(part) for part in key)
+        return self.cache_dir / (digest[0:2] or "_") / name
+
+    def get(self, key: ImageKey) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        if self.cache_dir is not None:
+            path = self._path(key)
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                pass
+            else:
+                if self.max_size:
+                    # eviction is based on modification times
+                    _touch(path)
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    __getitem__ = get
+
+    def __contains__(self, key: ImageKey) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+        return self.cache_dir is not None and self._path(key).exists()
+
+    def set(self, key: ImageKey, data: bytes):
+        self._remember(key, data)
+        if self.cache_dir is not None:
+            self._store(key, data)
+
+    __setitem__ = set
+
+    def _remember(self, key: ImageKey, data: bytes):
+        if len(data) > self.max_memory:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= len(previous)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.max_memory:
+                _key, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _store(self, key: ImageKey, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written then renamed: other processes never read a partial file
+        with NamedTemporaryFile(dir=str(path.parent), prefix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, str(path))
+
+        if not self.max_size:
+            return
+
+        with self._disk_lock:
+            if self._disk_size is not None:
+                self._disk_size += len(data)
+            if self._disk_size is None or self._disk_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used files, down to `LOW_WATER` of
+        `max_size`."""
+        files = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.name.startswith(".tmp"):
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+
+        # size is recomputed: other processes may have added files
+        total = sum(size for _mtime, size, _path in files)
+        if total > self.max_size:
+            target = self.max_size * LOW_WATER
+            for _mtime, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+        self._disk_size = total
+
+    def stats(self) -> dict[str, int]:
+        """Counters of this process, and size of each tier in bytes."""
+        with self._lock:
+            stats = {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_size": self._memory_size,
+            }
+        with self._disk_lock:
+            stats["disk_size"] = self._disk_size or 0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+    def clear(self):
+        """Remove all entries, from both tiers."""
+        self.clear_memory()
+        if self.cache_dir is None or not self.cache_dir.exists():
+            return
+
+        with self._disk_lock:
+            for path in self.cache_dir.glob("*/*"):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._disk_size = 0
+
+
+def _touch(path: Path):
+    try:
+        os.utime(str(path))
+    except FileNotFoundError:
+        pass
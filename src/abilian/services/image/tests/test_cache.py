@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from ..cache import ImageCache
+
+
+def test_memory_tier():
+    cache = ImageCache(max_memory=10)
+    cache.set(("a", "fit", 10, 10, "JPEG"), b"12345")
+    cache.set(("b", "fit", 10, 10, "JPEG"), b"12345")
+    assert cache.get(("a", "fit", 10, 10, "JPEG")) == b"12345"
+
+    # over budget: least recently used entry is dropped
+    cache.set(("c", "fit", 10, 10, "JPEG"), b"12345")
+    assert ("b", "fit", 10, 10, "JPEG") not in cache
+    assert ("a", "fit", 10, 10, "JPEG") in cache
+
+    # output format is part of the key
+    assert cache.get(("a", "fit", 10, 10, "PNG")) is None
+
+    # too large for memory
+    cache.set(("d", "fit", 10, 10, "JPEG"), b"x" * 11)
+    assert ("d", "fit", 10, 10, "JPEG") not in cache
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["memory_size"] == 10
+
+
+def test_disk_tier(tmp_path: Path):
+    key = ("abcdef", "crop", 32, 32, "JPEG")
+    cache = ImageCache(cache_dir=tmp_path)
+    cache.set(key, b"data")
+
+    # another process: shares the disk tier only
+    other = ImageCache(cache_dir=tmp_path)
+    assert other.get(key) == b"data"
+    assert other.get(key) == b"data"
+    assert other.stats()["disk_hits"] == 1
+    assert other.stats()["memory_hits"] == 1
+
+    cache.clear()
+    assert ImageCache(cache_dir=tmp_path).get(key) is None
+
+
+def test_disk_eviction(tmp_path: Path):
+    cache = ImageCache(max_memory=0, cache_dir=tmp_path, max_size=25)
+    for i in range(3):
+        cache.set((f"{i:02}", "fit", 10, 10, "JPEG"), b"x" * 10)
+        path = cache._path((f"{i:02}", "fit", 10, 10, "JPEG"))
+        past = time.time() - 100 + i
+        os.utime(str(path), (past, past))
+
+    # oldest entry is evicted
+    assert cache.get(("00", "fit", 10, 10, "JPEG")) is None
+    assert cache.get(("02", "fit", 10, 10, "JPEG")) == b"x" * 10
+    assert cache.stats()["evictions"] >= 1
+    assert cache.stats()["disk_size"] <= 25
@@ -2,9 +2,21 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from pytest import fixture
+from PIL import ImageChops, ImageStat
+from pytest import fixture, mark
 
-from .. import CROP, SCALE, get_save_format, get_size, resize
+from .. import (
+    BEST,
+    CROP,
+    FAST,
+    FIT,
+    SCALE,
+    get_format,
+    get_save_format,
+    get_size,
+    open_image,
+    resize,
+)
 
 
 @fixture
@@ -40,3 +52,41 @@ def test_scale(orig_image: bytes):
 def test_crop(orig_image: bytes):
     image = resize(orig_image, 500, 500, CROP)
     assert get_size(image) == (500, 500)
+
+
+def test_output_format(orig_image: bytes):
+    image = resize(orig_image, 100, 100, format="PNG")
+    assert get_format(image) == "PNG"
+
+    # cached separately from the default (JPEG) rendition
+    assert get_format(resize(orig_image, 100, 100)) == "JPEG"
+
+
+def test_source_id(orig_image: bytes):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return orig_image
+
+    image = resize(load, 100, 100, source_id="cat-v1")
+    assert get_size(image) == (100, 71)
+
+    # cached: source is not read again
+    assert resize(load, 100, 100, source_id="cat-v1") == image
+    assert len(calls) == 1
+
+    # another source version
+    resize(load, 100, 100, source_id="cat-v2")
+    assert len(calls) == 2
+
+
+@mark.parametrize("mode", [FIT, CROP])
+def test_fast_quality(orig_image: bytes, mode: str):
+    best = open_image(resize(orig_image, 64, 64, mode, quality=BEST))
+    fast = open_image(resize(orig_image, 64, 64, mode, quality=FAST))
+    assert fast.size == best.size
+
+    # same picture: small mean difference
+    diff = ImageChops.difference(fast.convert("L"), best.convert("L"))
+    assert ImageStat.Stat(diff).mean[0] < 8
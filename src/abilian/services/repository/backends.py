@@ -0,0 +1,372 @@
+"""Storage backends for the repository service.
+
+A backend stores content under keys derived from uuids. `get()` always
+returns a local :class:`Path`: remote backends serve it from a read-through
+local cache.
+
+Backend is selected with `REPOSITORY_BACKEND` config key: `"filesystem"`
+(default) or `"s3"`. The S3 backend requires `boto3` and is configured by
+the `REPOSITORY_S3` dict:
+
+- `bucket`: bucket name (required),
+- `prefix`: prefix of keys in bucket,
+- `endpoint_url`: for S3-compatible servers (MinIO, Ceph, a local stand-in...),
+- `client_options`: extra arguments for `boto3.client()` (credentials, region),
+- `cache_size`: maximum size in bytes of the local cache.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import typing
+from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryFile
+from typing import IO, Any, Iterator
+from uuid import UUID
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+from .compression import COMPRESSED_SUFFIX
+
+if typing.TYPE_CHECKING:
+    from abilian.app import Application
+
+#: suffixes of the names content can be stored under: plain, compressed
+SUFFIXES = ("", COMPRESSED_SUFFIX)
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_CACHE_SIZE = 1024**3
+
+#: suffix of files being written to the local cache, ignored by eviction
+TEMP_SUFFIX = ".tmp"
+
+
+def rel_path(uuid: UUID, suffix: str = "") -> Path:
+    """Relative path of the file named after this uuid, with a 2-level
+    fan-out."""
+    filename = str(uuid)
+    return Path(filename[0:2], filename[2:4], filename + suffix)
+
+
+class StorageBackend(metaclass=ABCMeta):
+    """Abstract base class for repository storage backends.
+
+    Content of an uuid is stored under one name: plain, or with a `suffix`
+    telling how it is encoded (see :data:`SUFFIXES`). Writing content under
+    one name removes the other ones.
+    """
+
+    #: local directory holding files returned by :meth:`get`
+    path: Path
+
+    def abs_path(self, uuid: UUID, suffix: str = "") -> Path:
+        top = self.path
+        dest = top / rel_path(uuid, suffix)
+        assert top in dest.parents
+        return dest
+
+    @abstractmethod
+    def exists(self, uuid: UUID) -> bool:
+        pass
+
+    @abstractmethod
+    def get(self, uuid: UUID) -> Path | None:
+        """Return local path to stored content, or `None`. Its suffix tells
+        how content is stored."""
+
+    @abstractmethod
+    def open_write(
+        self, uuid: UUID, suffix: str = ""
+    ) -> typing.ContextManager[IO[bytes]]:
+        """Context manager giving a binary file to write content to.
+
+        Content is stored when the context exits without error.
+        """
+
+    @abstractmethod
+    def delete(self, uuid: UUID):
+        """:raises:KeyError if content does not exist"""
+
+    def set(self, uuid: UUID, stream: IO[bytes]):
+        with self.open_write(uuid) as f:
+            shutil.copyfileobj(stream, f, CHUNK_SIZE)
+
+    def stream(self, uuid: UUID) -> IO[bytes] | None:
+        """Return a binary stream on stored content, or `None`."""
+        return open_path(self, uuid, lambda path: path.open("rb"))
+
+
+class FileSystemBackend(StorageBackend):
+    """Store files in a local directory."""
+
+    def __init__(self, path: Path):
+        if not path.exists():
+            path.mkdir(mode=0o775, parents=True)
+        self.path = path.resolve()
+
+    def exists(self, uuid: UUID) -> bool:
+        return self.get(uuid) is not None
+
+    def get(self, uuid: UUID) -> Path | None:
+        for suffix in SUFFIXES:
+            path = self.abs_path(uuid, suffix)
+            if path.exists():
+                return path
+        return None
+
+    @contextmanager
+    def open_write(self, uuid: UUID, suffix: str = "") -> Iterator[IO[bytes]]:
+        dest = self.abs_path(uuid, suffix)
+        if not dest.parent.exists():
+            dest.parent.mkdir(0o775, parents=True)
+
+        with dest.open("wb") as f:
+            yield f
+
+        for other in SUFFIXES:
+            if other != suffix:
+                _unlink(self.abs_path(uuid, other))
+
+    def delete(self, uuid: UUID):
+        found = False
+        for suffix in SUFFIXES:
+            found = _unlink(self.abs_path(uuid, suffix)) or found
+
+        if not found:
+            raise KeyError("No file can be found for this uuid", uuid)
+
+
+class LocalCache:
+    """Size-bounded local copy of remote files.
+
+    Least recently used files are evicted first; access time is tracked with
+    file modification time, so that it survives restarts and is shared by
+    processes using the same directory.
+    """
+
+    def __init__(self, path: Path, max_size: int = DEFAULT_CACHE_SIZE):
+        if not path.exists():
+            path.mkdir(mode=0o775, parents=True)
+        self.path = path.resolve()
+        self.max_size = max_size
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def abs_path(self, uuid: UUID, suffix: str = "") -> Path:
+        return self.path / rel_path(uuid, suffix)
+
+    def get(self, uuid: UUID) -> Path | None:
+        for suffix in SUFFIXES:
+            path = self.abs_path(uuid, suffix)
+            try:
+                os.utime(str(path))
+            except FileNotFoundError:
+                continue
+            return path
+        return None
+
+    def put(
+        self, uuid: UUID, fill: typing.Callable[[IO[bytes]], Any], suffix: str = ""
+    ) -> Path:
+        """Add file to cache; `fill` is called with a file to write to."""
+        dest = self.abs_path(uuid, suffix)
+        dest.parent.mkdir(0o775, parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            dir=str(dest.parent), suffix=TEMP_SUFFIX, delete=False
+        ) as f:
+            try:
+                fill(f)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, str(dest))
+
+        with self._lock:
+            if self._size is not None:
+                self._size += dest.stat().st_size
+        self.shrink()
+        return dest
+
+    def discard(self, uuid: UUID):
+        for suffix in SUFFIXES:
+            path = self.abs_path(uuid, suffix)
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+
+            with self._lock:
+                if self._size is not None:
+                    self._size -= size
+
+    def _files(self) -> list[tuple[float, int, Path]]:
+        files = []
+        for path in self.path.glob("*/*/*"):
+            if path.suffix == TEMP_SUFFIX:
+                # being written by `put()`
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def shrink(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _mtime, size, _path in self._files())
+
+            if self._size <= self.max_size:
+                return
+
+            for _mtime, size, path in sorted(self._files()):
+                if self._size <= self.max_size:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                self._size -= size
+
+
+class S3Backend(StorageBackend):
+    """Store files in an S3-compatible object store, with a local read-through
+    cache."""
+
+    def __init__(
+        self,
+        bucket: str,
+        cache: LocalCache,
+        prefix: str = "",
+        endpoint_url: str | None = None,
+        client_options: dict[str, Any] | None = None,
+    ):
+        if boto3 is None:
+            raise RuntimeError("S3 repository backend requires boto3")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+        self.path = cache.path
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, **(client_options or {})
+        )
+
+    def key(self, uuid: UUID, suffix: str = "") -> str:
+        return f"{self.prefix}{rel_path(uuid, suffix).as_posix()}"
+
+    def _remote_suffix(self, uuid: UUID) -> str | None:
+        """Suffix of the name content is stored under, or `None`."""
+        for suffix in SUFFIXES:
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=self.key(uuid, suffix))
+            except ClientError as e:
+                if _is_not_found(e):
+                    continue
+                raise
+            return suffix
+        return None
+
+    def exists(self, uuid: UUID) -> bool:
+        if self.cache.get(uuid) is not None:
+            return True
+        return self._remote_suffix(uuid) is not None
+
+    def get(self, uuid: UUID) -> Path | None:
+        path = self.cache.get(uuid)
+        if path is not None:
+            return path
+
+        for suffix in SUFFIXES:
+            key = self.key(uuid, suffix)
+
+            def download(f: IO[bytes], key=key):
+                self.client.download_fileobj(self.bucket, key, f)
+
+            try:
+                return self.cache.put(uuid, download, suffix)
+            except ClientError as e:
+                if not _is_not_found(e):
+                    raise
+        return None
+
+    @contextmanager
+    def open_write(self, uuid: UUID, suffix: str = "") -> Iterator[IO[bytes]]:
+        with TemporaryFile() as f:
+            yield f
+            f.seek(0)
+            self.client.upload_fileobj(f, self.bucket, self.key(uuid, suffix))
+        for other in SUFFIXES:
+            if other != suffix:
+                self.client.delete_object(Bucket=self.bucket, Key=self.key(uuid, other))
+        self.cache.discard(uuid)
+
+    def delete(self, uuid: UUID):
+        if not self.exists(uuid):
+            raise KeyError("No file can be found for this uuid", uuid)
+
+        for suffix in SUFFIXES:
+            self.client.delete_object(Bucket=self.bucket, Key=self.key(uuid, suffix))
+        self.cache.discard(uuid)
+
+
+def open_path(
+    backend: StorageBackend, uuid: UUID, opener: typing.Callable[[Path], IO[bytes]]
+) -> IO[bytes] | None:
+    """Open local path of content with `opener`, or return `None`.
+
+    A file of the local cache can be evicted between `get()` and opening:
+    it is then fetched again.
+    """
+    path = backend.get(uuid)
+    if path is None:
+        return None
+    try:
+        return opener(path)
+    except FileNotFoundError:
+        pass
+
+    path = backend.get(uuid)
+    if path is None:
+        return None
+    return opener(path)
+
+
+def _unlink(path: Path) -> bool:
+    """Remove file if it exists; tell if it did."""
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _is_not_found(error: ClientError) -> bool:
+    code = error.response.get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+def make_backend(app: Application) -> StorageBackend:
+    """Create storage backend from application configuration."""
+    name = app.config.get("REPOSITORY_BACKEND", "filesystem")
+
+    if name == "filesystem":
+        return FileSystemBackend(app.data_dir / "files")
+
+    if name == "s3":
+        config = dict(app.config.get("REPOSITORY_S3", {}))
+        cache_size = config.pop("cache_size", DEFAULT_CACHE_SIZE)
+        cache = LocalCache(app.data_dir / "files_cache", cache_size)
+        return S3Backend(cache=cache, **config)
+
+    raise ValueError(f"Invalid repository backend: {name!r}")
@@ -0,0 +1,198 @@
+"""Framed compression for repository files.
+
+A compressed file is made of independently compressed frames, each holding
+at most `frame_size` bytes of original content, followed by an index of frame
+offsets. Reading at any position only requires decompressing the frame that
+contains it, so seeks and HTTP range requests stay cheap.
+
+Layout::
+
+    MAGIC | frame_size (u32)
+    frame*: flag (u8) | length (u32) | data
+    index: offset (u64) for each frame
+    footer: content size (u64) | index offset (u64)
+
+Frames that don't shrink when compressed are stored as is (`flag` = 0).
+
+Compressed files are named with :data:`COMPRESSED_SUFFIX`; others are plain
+files. Content is never used to tell them apart: a plain file may start with
+:data:`MAGIC`.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+import struct
+import zlib
+from pathlib import Path
+from typing import IO, BinaryIO
+
+MAGIC = b"\x89ABZ\r\n\x1a\n"
+COMPRESSED_SUFFIX = ".abz"
+DEFAULT_FRAME_SIZE = 256 * 1024
+COMPRESSION_LEVEL = 6
+
+_HEADER = struct.Struct(">I")
+_FRAME = struct.Struct(">BI")
+_OFFSET = struct.Struct(">Q")
+_FOOTER = struct.Struct(">QQ")
+
+RAW = 0
+ZLIB = 1
+
+#: Content types that are already compressed and are stored as is.
+INCOMPRESSIBLE_MIMETYPES = [
+    r"image/(?!(svg\+xml|bmp|tiff|x-ms-bmp)$).*",
+    r"audio/.*",
+    r"video/.*",
+    r"application/zip",
+    r"application/gzip",
+    r"application/x-gzip",
+    r"application/x-bzip2",
+    r"application/x-xz",
+    r"application/x-7z-compressed",
+    r"application/x-rar-compressed",
+    r"application/vnd\.rar",
+    r"application/java-archive",
+    r"application/epub\+zip",
+    r"application/vnd\.openxmlformats-officedocument\..*",
+    r"application/vnd\.oasis\.opendocument\..*",
+]
+_INCOMPRESSIBLE_RE = re.compile(
+    "^({})$".format("|".join(INCOMPRESSIBLE_MIMETYPES)), re.IGNORECASE
+)
+
+
+def should_compress(mimetype: str | None) -> bool:
+    """Tell if content of this type is worth compressing."""
+    if not mimetype:
+        return True
+    mimetype = mimetype.split(";", 1)[0].strip()
+    return _INCOMPRESSIBLE_RE.match(mimetype) is None
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix == COMPRESSED_SUFFIX
+
+
+def write_compressed(
+    src: IO[bytes], dest: IO[bytes], frame_size: int = DEFAULT_FRAME_SIZE
+):
+    """Compress `src` stream into `dest` stream."""
+    dest.write(MAGIC + _HEADER.pack(frame_size))
+    offset = len(MAGIC) + _HEADER.size
+    offsets = []
+    size = 0
+
+    for chunk in iter(lambda: src.read(frame_size), b""):
+        size += len(chunk)
+        data = zlib.compress(chunk, COMPRESSION_LEVEL)
+        flag = ZLIB
+        if len(data) >= len(chunk):
+            data = chunk
+            flag = RAW
+
+        offsets.append(offset)
+        dest.write(_FRAME.pack(flag, len(data)))
+        dest.write(data)
+        offset += _FRAME.size + len(data)
+
+    for frame_offset in offsets:
+        dest.write(_OFFSET.pack(frame_offset))
+    dest.write(_FOOTER.pack(size, offset))
+
+
+class CompressedReader(io.RawIOBase):
+    """Read-only, seekable stream over a compressed file."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self._f = fileobj
+        header = fileobj.read(len(MAGIC) + _HEADER.size)
+        if header[: len(MAGIC)] != MAGIC:
+            raise ValueError("Not a compressed repository file")
+        (self.frame_size,) = _HEADER.unpack(header[len(MAGIC) :])
+
+        fileobj.seek(-_FOOTER.size, io.SEEK_END)
+        self.size, index_offset = _FOOTER.unpack(fileobj.read(_FOOTER.size))
+        end = fileobj.tell() - _FOOTER.size
+        fileobj.seek(index_offset)
+        index = fileobj.read(end - index_offset)
+        self._offsets = [
+            _OFFSET.unpack_from(index, i)[0] for i in range(0, len(index), _OFFSET.size)
+        ]
+
+        self._pos = 0
+        self._frame_no = -1
+        self._frame = b""
+
+    def _load_frame(self, frame_no: int) -> bytes:
+        if frame_no != self._frame_no:
+            self._f.seek(self._offsets[frame_no])
+            flag, length = _FRAME.unpack(self._f.read(_FRAME.size))
+            data = self._f.read(length)
+            if flag == ZLIB:
+                data = zlib.decompress(data)
+            self._frame_no = frame_no
+            self._frame = data
+        return self._frame
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self.size:
+            return 0
+
+        frame_no, start = divmod(self._pos, self.frame_size)
+        frame = self._load_frame(frame_no)
+        data = frame[start : start + len(buffer)]
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def open_file(path: Path) -> BinaryIO:
+    """Open a repository file for reading, decompressing it if needed."""
+    f = path.open("rb")
+    if not is_compressed(path):
+        return f
+
+    try:
+        reader = CompressedReader(f)
+    except BaseException:
+        f.close()
+        raise
+    return io.BufferedReader(reader, buffer_size=DEFAULT_FRAME_SIZE)
+
+
+def file_size(path: Path) -> int:
+    """Return size of original content stored at `path`."""
+    if not is_compressed(path):
+        return path.stat().st_size
+
+    with path.open("rb") as f:
+        f.seek(-_FOOTER.size, io.SEEK_END)
+        size, _index_offset = _FOOTER.unpack(f.read(_FOOTER.size))
+        return size
@@ -3,6 +3,7 @@ from __future__ import annotations
 import shutil
 import typing
 import weakref
+from io import BytesIO, TextIOBase
 from pathlib import Path
 from typing import IO, Any, Dict, Optional, Set, Union
 from uuid import UUID, uuid1
@@ -21,6 +22,14 @@ from abilian.core.models import Model
 from abilian.core.models.blob import Blob
 from abilian.services import Service, ServiceState
 
+from .backends import StorageBackend, make_backend, open_path, rel_path
+from .compression import (
+    COMPRESSED_SUFFIX,
+    open_file,
+    should_compress,
+    write_compressed,
+)
+
 if typing.TYPE_CHECKING:
     from abilian.app import Application
 
@@ -36,6 +45,12 @@ class RepositoryServiceState(ServiceState):
     #: :class:`Path` path to application repository
     path: Path | None = None
 
+    #: storage backend (see :mod:`.backends`)
+    backend: StorageBackend
+
+    #: store content compressed (see :mod:`.compression`)
+    compress: bool = False
+
 
 class RepositoryService(Service):
     """Service for storage of binary objects referenced in database."""
@@ -46,12 +61,12 @@ class RepositoryService(Service):
     def init_app(self, app: Application):
         super().init_app(app)
 
-        path = app.data_dir / "files"
-        if not path.exists():
-            path.mkdir(mode=0o775, parents=True)
+        backend = make_backend(app)
 
         with app.app_context():
-            self.app_state.path = path.resolve()
+            self.app_state.backend = backend
+            self.app_state.path = backend.path
+            self.app_state.compress = app.config.get("REPOSITORY_COMPRESSION", False)
 
     # data management: paths and accessors
     def rel_path(self, uuid: UUID) -> Path:
@@ -62,21 +77,24 @@ class RepositoryService(Service):
         """
         _assert_uuid(uuid)
 
-        filename = str(uuid)
-        return Path(filename[0:2], filename[2:4], filename)
+        return rel_path(uuid)
 
     def abs_path(self, uuid: UUID) -> Path:
-        """Return absolute :class:`Path` object for given uuid.
+        """Return absolute :class:`Path` object for given uuid, for plain
+        content (compressed content is named with a suffix: see :meth:`get`).
+
+        With a remote backend, this is the path in local cache.
 
         :param:uuid: :class:`UUID` instance
         """
         _assert_uuid(uuid)
 
-        top = self.app_state.path
-        rel_path = self.rel_path(uuid)
-        dest = top / rel_path
-        assert top in dest.parents
-        return dest
+        return self.app_state.backend.abs_path(uuid)
+
+    def exists(self, uuid: UUID) -> bool:
+        _assert_uuid(uuid)
+
+        return self.app_state.backend.exists(uuid)
 
     def get(self, uuid: UUID, default: Path | None = None) -> Path | None:
         """Return absolute :class:`Path` object for given uuid, if this uuid
@@ -86,34 +104,53 @@ class RepositoryService(Service):
         """
         _assert_uuid(uuid)
 
-        path = self.abs_path(uuid)
-        if not path.exists():
+        path = self.app_state.backend.get(uuid)
+        if path is None:
             return default
         return path
 
-    def set(self, uuid: UUID, content: Any, encoding: str | None = "utf-8"):
+    def open(self, uuid: UUID) -> IO[bytes] | None:
+        """Return a binary stream on content for given uuid, or `None` if this
+        uuid doesn't exist in repository.
+
+        Compressed files are transparently decompressed.
+
+        :param:uuid: :class:`UUID` instance
+        """
+        _assert_uuid(uuid)
+
+        return open_path(self.app_state.backend, uuid, open_file)
+
+    def set(
+        self,
+        uuid: UUID,
+        content: Any,
+        encoding: str | None = "utf-8",
+        mimetype: str | None = None,
+    ):
         """Store binary content with uuid as key.
 
         :param:uuid: :class:`UUID` instance
         :param:content: string, bytes, or any object with a `read()` method
         :param:encoding: encoding to use when content is Unicode
+        :param:mimetype: content type, used to skip compression of already
+            compressed content
         """
         _assert_uuid(uuid)
 
-        dest = self.abs_path(uuid)
-        if not dest.parent.exists():
-            dest.parent.mkdir(0o775, parents=True)
-
-        if hasattr(content, "read"):
+        if isinstance(content, TextIOBase):
             content = content.read()
+        if isinstance(content, str):
+            content = content.encode(encoding or "utf-8")
+        if isinstance(content, bytes):
+            content = BytesIO(content)
 
-        mode = "tw"
-        if not isinstance(content, str):
-            mode = "bw"
-            encoding = None
-
-        with dest.open(mode, encoding=encoding) as f:
-            f.write(content)
+        backend = self.app_state.backend
+        if self.app_state.compress and should_compress(mimetype):
+            with backend.open_write(uuid, COMPRESSED_SUFFIX) as f:
+                write_compressed(content, f)
+        else:
+            backend.set(uuid, content)
 
     def delete(self, uuid: UUID):
         """Delete file with given uuid.
@@ -123,11 +160,7 @@ class RepositoryService(Service):
         """
         _assert_uuid(uuid)
 
-        dest = self.abs_path(uuid)
-        if not dest.exists():
-            raise KeyError("No file can be found for this uuid", uuid)
-
-        dest.unlink()
+        self.app_state.backend.delete(uuid)
 
     def __getitem__(self, uuid: UUID) -> Path:
         _assert_uuid(uuid)
@@ -330,6 +363,23 @@ class SessionRepositoryService(Service):
         return session
 
     # Repository interface
+    def exists(self, session: Session | Blob, uuid: UUID) -> bool:
+        """Tell if content exists as seen by `session`, without fetching it
+        from a remote backend."""
+        _assert_uuid(uuid)
+
+        session = self._session_for(session)
+        transaction = self.app_state.get_transaction(session)
+        try:
+            val = transaction.get(uuid)
+        except KeyError:
+            return False
+
+        if val is _NULL_MARK:
+            return repository.exists(uuid)
+
+        return True
+
     def get(
         self, session: Session | Blob, uuid: UUID, default: Path | None = None
     ) -> Path | None:
@@ -348,18 +398,38 @@ class SessionRepositoryService(Service):
 
         return val
 
+    def open(self, session: Session | Blob, uuid: UUID) -> IO[bytes] | None:
+        """Return a binary stream on content as seen by `session`, or `None`.
+
+        Compressed files are transparently decompressed.
+        """
+        _assert_uuid(uuid)
+
+        session = self._session_for(session)
+        transaction = self.app_state.get_transaction(session)
+        try:
+            val = transaction.get(uuid)
+        except KeyError:
+            return None
+
+        if val is _NULL_MARK:
+            return repository.open(uuid)
+
+        return open_file(val)
+
     def set(
         self,
         session: Session | Blob,
         uuid: UUID,
         content: IO | bytes | str,
         encoding: str = "utf-8",
+        mimetype: str | None = None,
     ):
         _assert_uuid(uuid)
 
         session = self._session_for(session)
         transaction = self.app_state.get_transaction(session)
-        transaction.set(uuid, content, encoding)
+        transaction.set(uuid, content, encoding, mimetype)
 
     def delete(self, session: Session | Blob, uuid: UUID):
         _assert_uuid(uuid)
@@ -413,6 +483,7 @@ class RepositoryTransaction:
         self._parent = parent
         self._deleted: set[UUID] = set()
         self._set: set[UUID] = set()
+        self._mimetypes: dict[UUID, str] = {}
         self.__cleared = False
 
     @property
@@ -434,6 +505,7 @@ class RepositoryTransaction:
         del self.path
         del self._deleted
         del self._set
+        del self._mimetypes
         self.__cleared = True
 
     def begin(self, session: Session | None = None):
@@ -471,7 +543,8 @@ class RepositoryTransaction:
 
         for uuid in self._set:
             content = self.path / str(uuid)
-            repository.set(uuid, content.open("rb"))
+            with content.open("rb") as f:
+                repository.set(uuid, f, mimetype=self._mimetypes.get(uuid))
 
     def _commit_parent(self):
         p = self._parent
@@ -481,6 +554,7 @@ class RepositoryTransaction:
 
         p._set |= self._set
         p._set -= self._deleted
+        p._mimetypes.update(self._mimetypes)
 
         if self._set:
             p.begin()  # ensure p.path exists
@@ -508,9 +582,14 @@ class RepositoryTransaction:
         uuid: UUID,
         content: IO | bytes | str,
         encoding: str | None = "utf-8",
+        mimetype: str | None = None,
     ):
         self.begin()
         self._add_to(uuid, self._set, self._deleted)
+        if mimetype:
+            self._mimetypes[uuid] = mimetype
+        else:
+            self._mimetypes.pop(uuid, None)
 
         if hasattr(content, "read"):
             content = content.read()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator
+
+from pytest import fixture, importorskip, raises
+
+from .backends import FileSystemBackend, LocalCache, S3Backend
+
+
+def test_filesystem_backend(tmp_path: Path):
+    backend = FileSystemBackend(tmp_path / "files")
+    u = uuid.uuid4()
+    assert not backend.exists(u)
+    assert backend.get(u) is None
+
+    backend.set(u, BytesIO(b"content"))
+    assert backend.exists(u)
+    assert backend.get(u) == backend.abs_path(u)
+    with backend.stream(u) as f:
+        assert f.read() == b"content"
+
+    backend.delete(u)
+    assert not backend.exists(u)
+    with raises(KeyError):
+        backend.delete(u)
+
+
+def test_local_cache_eviction(tmp_path: Path):
+    cache = LocalCache(tmp_path / "cache", max_size=25)
+    uuids = [uuid.uuid4() for _i in range(3)]
+    for i, u in enumerate(uuids):
+        cache.put(u, lambda f: f.write(b"0123456789"))
+        # make access order deterministic
+        os.utime(str(cache.abs_path(u)), (i, i))
+
+    # third file exceeded size: least recently used file is gone
+    assert cache.get(uuids[0]) is None
+    assert cache.get(uuids[1]) is not None
+    assert cache.get(uuids[2]) is not None
+
+    cache.discard(uuids[1])
+    assert cache.get(uuids[1]) is None
+
+
+@fixture
+def s3_backend(tmp_path: Path) -> Iterator[S3Backend]:
+    importorskip("boto3")
+    moto_server = importorskip("moto.server")
+
+    server = moto_server.ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    options = {
+        "aws_access_key_id": "test",
+        "aws_secret_access_key": "test",
+        "region_name": "us-east-1",
+    }
+    backend = S3Backend(
+        bucket="repository",
+        cache=LocalCache(tmp_path / "cache"),
+        prefix="files/",
+        endpoint_url=f"http://{host}:{port}",
+        client_options=options,
+    )
+    backend.client.create_bucket(Bucket="repository")
+    yield backend
+    server.stop()
+
+
+def test_s3_backend(s3_backend: S3Backend):
+    backend = s3_backend
+    u = uuid.uuid4()
+    assert not backend.exists(u)
+    assert backend.get(u) is None
+
+    backend.set(u, BytesIO(b"content"))
+    assert backend.exists(u)
+
+    # read-through cache
+    assert backend.cache.get(u) is None
+    path = backend.get(u)
+    assert path == backend.cache.abs_path(u)
+    assert path.read_bytes() == b"content"
+
+    # overwrite invalidates cache
+    backend.set(u, BytesIO(b"new content"))
+    assert backend.get(u).read_bytes() == b"new content"
+
+    backend.delete(u)
+    assert not backend.exists(u)
+    assert backend.cache.get(u) is None
+    with raises(KeyError):
+        backend.delete(u)
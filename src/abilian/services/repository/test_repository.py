@@ -1,12 +1,24 @@
 from __future__ import annotations
 
+import io
+import os
 import uuid
+from io import BytesIO
 from pathlib import Path
 
 from pytest import raises
 from sqlalchemy.orm import Session
 
 from . import repository
+from .backends import TEMP_SUFFIX, LocalCache
+from .compression import (
+    MAGIC,
+    CompressedReader,
+    file_size,
+    is_compressed,
+    should_compress,
+    write_compressed,
+)
 
 UUID_STR = "4f80f02f-52e3-4fe2-b9f2-2c3e99449ce9"
 UUID = uuid.UUID(UUID_STR)
@@ -101,3 +113,90 @@ def test_delete_non_existent(session: Session):
     # same w/ __delitem__
     with raises(KeyError):
         del repository[u1]
+
+
+def test_compressed_roundtrip():
+    content = b"".join(b"line %d of some text\n" % i for i in range(50000))
+    out = BytesIO()
+    write_compressed(BytesIO(content), out, frame_size=4096)
+    assert len(out.getvalue()) < len(content)
+
+    out.seek(0)
+    reader = CompressedReader(out)
+    assert reader.size == len(content)
+    assert reader.read() == content
+
+    # random access
+    reader.seek(100000)
+    assert reader.read(20) == content[100000:100020]
+    reader.seek(-10, io.SEEK_END)
+    assert reader.read() == content[-10:]
+
+
+def test_compressed_incompressible_frames():
+    content = os.urandom(10000)
+    out = BytesIO()
+    write_compressed(BytesIO(content), out, frame_size=4096)
+    out.seek(0)
+    assert CompressedReader(out).read() == content
+
+
+def test_should_compress():
+    assert should_compress(None)
+    assert should_compress("application/pdf")
+    assert should_compress("application/msword")
+    assert should_compress("image/svg+xml")
+    assert not should_compress("image/jpeg")
+    assert not should_compress("application/zip")
+    assert not should_compress("application/vnd.oasis.opendocument.text")
+
+
+def test_set_compressed(session: Session):
+    repository.app_state.compress = True
+    content = b"my file content " * 1000
+
+    u1 = uuid.uuid4()
+    repository.set(u1, content, mimetype="text/plain")
+    p = repository.get(u1)
+    assert is_compressed(p)
+    assert file_size(p) == len(content)
+    with repository.open(u1) as f:
+        assert f.read() == content
+
+    # already compressed content is stored as is
+    u2 = uuid.uuid4()
+    repository.set(u2, content, mimetype="image/jpeg")
+    p = repository.get(u2)
+    assert p == repository.abs_path(u2)
+    assert not is_compressed(p)
+    assert p.open("rb").read() == content
+
+    # plain content that looks like a compressed file
+    fake = MAGIC + b"\x00" * 69
+    repository.set(u2, fake, mimetype="image/jpeg")
+    p = repository.get(u2)
+    assert file_size(p) == len(fake)
+    with repository.open(u2) as f:
+        assert f.read() == fake
+
+    # stored compressed: plain file is replaced
+    repository.set(u2, content, mimetype="text/plain")
+    assert is_compressed(repository.get(u2))
+    assert not p.exists()
+    repository.delete(u2)
+    assert repository.get(u2) is None
+
+
+def test_local_cache_shrink(tmp_path: Path):
+    cache = LocalCache(tmp_path, max_size=100)
+    u1, u2 = uuid.uuid4(), uuid.uuid4()
+    p1 = cache.put(u1, lambda f: f.write(b"x" * 60))
+    os.utime(str(p1), (0, 0))
+
+    # a file being written is neither counted nor evicted
+    temp = p1.parent / ("pending" + TEMP_SUFFIX)
+    temp.write_bytes(b"x" * 1000)
+    cache.put(u2, lambda f: f.write(b"y" * 60))
+    assert temp.exists()
+    assert cache.get(u1) is None
+    assert cache.get(u2) is not None
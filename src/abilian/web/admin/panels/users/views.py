@@ -42,9 +42,7 @@ class JsonUsersList(base.JSONView):
         search = kw.get("sSearch", "").replace("%", "").strip().lower()
 
         end = start + length
-        query = User.query.options(
-            sa.orm.subqueryload("groups"), sa.orm.undefer("photo")
-        ).filter(User.id != 0)
+        query = User.query.options(sa.orm.subqueryload("groups")).filter(User.id != 0)
         total_count = query.count()
 
         if search:
@@ -6,7 +6,7 @@ from typing import Optional
 
 import sqlalchemy as sa
 import sqlalchemy.orm
-from flask import current_app, send_file
+from flask import current_app
 from flask.blueprints import BlueprintSetupState
 from werkzeug.exceptions import BadRequest
 from werkzeug.utils import redirect
@@ -17,6 +17,7 @@ from abilian.i18n import _, _l
 from abilian.web import nav, url_for
 from abilian.web.action import ButtonAction, actions
 from abilian.web.blueprints import Blueprint
+from abilian.web.util import send_file_offloaded
 from abilian.web.views import BaseObjectView, ObjectCreate, ObjectDelete, ObjectEdit
 
 from .forms import AttachmentForm
@@ -86,15 +87,12 @@ class AttachmentDownload(BaseAttachmentView, BaseObjectView):
         metadata = blob.meta
         filename = metadata.get("filename", self.obj.name)
         content_type = metadata.get("mimetype")
-        stream = blob.file.open("rb")
 
-        return send_file(
-            stream,
+        return send_file_offloaded(
+            blob.file,
+            mimetype=content_type,
             as_attachment=True,
             attachment_filename=filename,
-            mimetype=content_type,
-            cache_timeout=0,
-            add_etags=False,
         )
 
 
@@ -40,10 +40,7 @@ def photo(user):
     if self_photo:
         # special case: for their own photo user has an etag, so that on change,
         # photo is immediatly reloaded from server.
-        #
-        # FIXME: there should be a photo_digest field on user object
-        acc = hashlib.md5(data)
-        etag = acc.hexdigest()
+        etag = user.photo_digest or hashlib.md5(data).hexdigest()
 
         if request.if_none_match and etag in request.if_none_match:
             return Response(status=304)
@@ -842,7 +842,9 @@ class ImageInput(FileInput):
     """An image widget with client-side preview.
 
     To show current image field data has to provide an attribute named
-    `url`.
+    `url`. Otherwise, with `thumb_urls` (default), thumbnails of saved blobs
+    and uploaded files are referenced by URL, and served (from cache) by
+    image views; other images are resized and inlined in page.
     """
 
     def __init__(
@@ -852,11 +854,13 @@ class ImageInput(FileInput):
         height: int = 120,
         resize_mode: str = image.CROP,
         valid_extensions: tuple[str, str, str] = ("jpg", "jpeg", "png"),
+        thumb_urls: bool = True,
     ):
         super().__init__(template=template)
         self.resize_mode = resize_mode
         self.valid_extensions = valid_extensions
         self.width, self.height = width, height
+        self.thumb_urls = thumb_urls
 
     def build_exisiting_files_list(self, field):
         existing = super().build_exisiting_files_list(field)
@@ -866,7 +870,9 @@ class ImageInput(FileInput):
                 if hasattr(value, "url"):
                     image_url = value.url
                 else:
-                    image_url = self.get_b64_thumb_url(
+                    image_url = self.get_blob_thumb_url(
+                        field, self.width, self.height
+                    ) or self.get_b64_thumb_url(
                         self.get_thumb(value, self.width, self.height)
                     )
 
@@ -881,6 +887,13 @@ class ImageInput(FileInput):
             if value:
                 if hasattr(value, "url"):
                     image_url = value.url
+                elif self.can_use_thumb_url(self.width, self.height):
+                    image_url = url_for(
+                        "uploads.thumbnail",
+                        handle=data["handle"],
+                        s=self.width,
+                        m=self.resize_mode,
+                    )
                 else:
                     with value.open("rb") as in_:
                         image_url = self.get_b64_thumb_url(
@@ -891,6 +904,29 @@ class ImageInput(FileInput):
 
         return uploaded
 
+    def can_use_thumb_url(self, width: int, height: int) -> bool:
+        # image views serve square thumbnails
+        return self.thumb_urls and width == height
+
+    def get_blob_thumb_url(self, field, width: int, height: int) -> str | None:
+        """URL of a thumbnail of field's blob, if field data comes from a saved
+        :class:`Blob`."""
+        blob = getattr(field, "blob", None)
+        if (
+            not self.can_use_thumb_url(width, height)
+            or not isinstance(blob, Blob)
+            or blob.id is None
+        ):
+            return None
+
+        return url_for(
+            "images.blob_image",
+            object_id=blob.id,
+            s=width,
+            m=self.resize_mode,
+            md5=blob.meta.get("md5"),
+        )
+
     def get_thumb(self, data, width, height):
         try:
             get_format(data)
@@ -920,6 +956,14 @@ class ImageInput(FileInput):
         width = kwargs.get("width", self.width)
         height = kwargs.get("heigth", self.height)
 
+        url = self.get_blob_thumb_url(field, width, height)
+        if url:
+            if self.resize_mode != image.CROP:
+                # actual size is not known without resizing
+                return render_template_string('<img src="{{ url }}" />', url=url)
+            tmpl = '<img src="{{ url }}" width="{{ width }}" height="{{ height }}" />'
+            return render_template_string(tmpl, url=url, width=width, height=height)
+
         thumb = self.get_thumb(data, width, height)
         width, height = image.get_size(thumb)
 
@@ -16,7 +16,7 @@ import abilian.i18n
 from abilian.web import csrf
 from abilian.web.filters import init_filters
 from abilian.web.util import url_for
-from abilian.web.views.images import user_photo_url
+from abilian.web.views.images import user_photo_srcset, user_photo_url
 
 
 class JinjaManagerMixin(Flask):
@@ -36,6 +36,7 @@ class JinjaManagerMixin(Flask):
             _n=abilian.i18n._n,
             url_for=url_for,
             user_photo_url=user_photo_url,
+            user_photo_srcset=user_photo_srcset,
             NO_VALUE=NO_VALUE,
             NEVER_SET=NEVER_SET,
         )
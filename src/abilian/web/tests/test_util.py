@@ -0,0 +1,70 @@
+""""""
+
+from __future__ import annotations
+
+from flask import Flask
+from pytest import raises
+
+from abilian.web.util import send_file_offloaded
+
+
+def _make_file(app: Flask):
+    path = app.data_dir / "files" / "ab" / "cd" / "abcd-file"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"file content")
+    return path
+
+
+def test_send_file_no_offload(app: Flask):
+    path = _make_file(app)
+    with app.test_request_context():
+        response = send_file_offloaded(path, mimetype="text/plain")
+        response.direct_passthrough = False
+        assert response.get_data() == b"file content"
+        assert "X-Accel-Redirect" not in response.headers
+        assert "X-Sendfile" not in response.headers
+
+
+def test_send_file_offload_nginx(app: Flask):
+    path = _make_file(app)
+    app.config["FILES_OFFLOAD"] = "nginx"
+    with app.test_request_context():
+        response = send_file_offloaded(
+            path,
+            mimetype="text/plain",
+            as_attachment=True,
+            attachment_filename="file.txt",
+        )
+        assert response.get_data() == b""
+        location = response.headers["X-Accel-Redirect"]
+        assert location == "/_protected_files/files/ab/cd/abcd-file"
+        assert "file.txt" in response.headers["Content-Disposition"]
+
+
+def test_send_file_offload_unicode_filename(app: Flask):
+    path = _make_file(app)
+    app.config["FILES_OFFLOAD"] = "nginx"
+    with app.test_request_context():
+        response = send_file_offloaded(
+            path, as_attachment=True, attachment_filename="œuvre €.pdf"
+        )
+        disposition = response.headers["Content-Disposition"]
+        # header must be encodable by the WSGI server
+        disposition.encode("latin-1")
+        assert "filename*=UTF-8''%C5%93uvre%20%E2%82%AC.pdf" in disposition
+        assert "filename=" in disposition
+
+
+def test_send_file_offload_apache(app: Flask):
+    path = _make_file(app)
+    app.config["FILES_OFFLOAD"] = "apache"
+    with app.test_request_context():
+        response = send_file_offloaded(path)
+        assert response.headers["X-Sendfile"] == str(path.resolve())
+
+
+def test_send_file_offload_invalid(app: Flask):
+    path = _make_file(app)
+    app.config["FILES_OFFLOAD"] = "iis"
+    with app.test_request_context(), raises(ValueError):
+        send_file_offloaded(path)
@@ -13,8 +13,10 @@ from wtforms import Form, IntegerField, StringField
 # noinspection PyUnresolvedReferences
 import abilian.web.forms  # noqa
 from abilian.core.entities import Entity
+from abilian.core.models.blob import Blob
 from abilian.web.forms.widgets import (
     EmailWidget,
+    ImageInput,
     MainTableView,
     Panel,
     Row,
@@ -82,6 +84,26 @@ def test_single_view(test_request_context: RequestContext):
     assert "mailto:joe@example.com" in res
 
 
+def test_image_input_thumb_url(test_request_context: RequestContext):
+    class Field:
+        blob = Blob(id=5, meta={"md5": "abcd"})
+
+    widget = ImageInput(width=64, height=64)
+    url = widget.get_blob_thumb_url(Field(), 64, 64)
+    assert url.startswith("/images/files/5?")
+    assert "s=64" in url and "md5=abcd" in url
+
+    # not square: image views can't serve it
+    assert widget.get_blob_thumb_url(Field(), 64, 32) is None
+
+    # not saved
+    Field.blob = Blob(meta={"md5": "abcd"})
+    assert widget.get_blob_thumb_url(Field(), 64, 64) is None
+
+    widget = ImageInput(thumb_urls=False)
+    assert widget.get_blob_thumb_url(Field(), 120, 120) is None
+
+
 @mark.skip
 def test_edit_view(app):
     with app.test_request_context():
@@ -3,9 +3,10 @@
 from __future__ import annotations
 
 import typing
+from functools import partial
 from typing import Dict
 
-from flask import current_app, send_file
+from flask import current_app
 from flask_login import current_user
 from flask_wtf.file import FileField, file_required
 from werkzeug.exceptions import BadRequest, NotFound
@@ -16,7 +17,9 @@ from abilian.core.util import unwrap
 from abilian.web import csrf, url_for
 from abilian.web.blueprints import Blueprint
 from abilian.web.forms import Form
+from abilian.web.util import send_file_offloaded
 from abilian.web.views import JSONView, View
+from abilian.web.views.images import BaseImageView
 
 if typing.TYPE_CHECKING:
     from abilian.web.uploads import FileUploadsExtension
@@ -89,15 +92,12 @@ class UploadView(BaseUploadsView, View):
         metadata = self.uploads.get_metadata(self.user, handle)
         filename = metadata.get("filename", handle)
         content_type = metadata.get("mimetype")
-        stream = file_obj.open("rb")
 
-        return send_file(
-            stream,
+        return send_file_offloaded(
+            file_obj,
+            mimetype=content_type,
             as_attachment=True,
             attachment_filename=filename,
-            mimetype=content_type,
-            cache_timeout=0,
-            add_etags=False,
         )
 
     def delete(self, handle, *args, **kwargs) -> dict:
@@ -108,3 +108,28 @@ class UploadView(BaseUploadsView, View):
 
 
 bp.add_url_rule("/<string:handle>", view_func=UploadView.as_view("handle"))
+
+
+class UploadThumbnailView(BaseUploadsView, BaseImageView):
+    """Thumbnail of an uploaded image, for previews in forms."""
+
+    max_size = 500
+
+    def prepare_args(self, args, kwargs):
+        args, kwargs = super().prepare_args(args, kwargs)
+        handle = kwargs["handle"]
+        file_path = self.uploads.get_file(self.user, handle)
+        if file_path is None:
+            raise NotFound()
+
+        metadata = self.uploads.get_metadata(self.user, handle)
+        kwargs["filename"] = metadata.get("filename", handle)
+        kwargs["image"] = partial(file_path.open, "rb")
+        # an upload handle is never reused for another content
+        kwargs["source_id"] = f"upload-{handle}"
+        return args, kwargs
+
+
+bp.add_url_rule(
+    "/<string:handle>/thumbnail", view_func=UploadThumbnailView.as_view("thumbnail")
+)
@@ -6,13 +6,24 @@ more ideas of stuff to implement.
 
 from __future__ import annotations
 
+import unicodedata
+from pathlib import Path
 from typing import Any
+from urllib.parse import quote
 
-from flask import current_app
+from flask import Response, current_app
 from flask import url_for as flask_url_for
-from flask.helpers import send_from_directory
+from flask.helpers import send_file, send_from_directory
 from werkzeug.routing import BuildError
 
+#: Response header used by each supported front-end server to serve a file in
+#: place of the application.
+OFFLOAD_HEADERS = {
+    "nginx": "X-Accel-Redirect",
+    "apache": "X-Sendfile",
+    "lighttpd": "X-Sendfile",
+}
+
 
 def url_for(obj: Any, **kw: Any) -> str:
     """Polymorphic variant of Flask's `url_for` function.
@@ -55,3 +66,81 @@ def send_file_from_directory(filename, directory, app=None):
         app = current_app
     cache_timeout = app.get_send_file_max_age(filename)
     return send_from_directory(directory, filename, cache_timeout=cache_timeout)
+
+
+def send_file_offloaded(
+    path: Path,
+    mimetype: str | None = None,
+    as_attachment: bool = False,
+    attachment_filename: str | None = None,
+    app: Any = None,
+) -> Response:
+    """Send a file from the application data directory, delegating the
+    transfer to the front-end server when `FILES_OFFLOAD` is configured.
+
+    With offloading enabled the response has an empty body and carries only
+    the internal redirect header: permission checks must have been done by
+    the caller. When `FILES_OFFLOAD` is not set the file is streamed by the
+    application, as in local development.
+
+    For nginx, `path` is made relative to `app.data_dir` and appended to
+    `FILES_OFFLOAD_NGINX_PREFIX`, which must be an `internal` location
+    aliased to the data directory::
+
+        location /_protected_files/ {
+            internal;
+            alias /path/to/instance/data/;
+        }
+    """
+    from abilian.services.repository.compression import is_compressed, open_file
+
+    if app is None:
+        app = current_app
+
+    mode = app.config.get("FILES_OFFLOAD")
+    # compressed repository files can't be served as is by the front-end
+    if not mode or is_compressed(path):
+        return send_file(
+            open_file(path),
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            attachment_filename=attachment_filename,
+            cache_timeout=0,
+            add_etags=False,
+        )
+
+    try:
+        header = OFFLOAD_HEADERS[mode]
+    except KeyError:
+        raise ValueError(f"Invalid value for FILES_OFFLOAD: {mode!r}")
+
+    path = Path(path).resolve()
+    if mode == "nginx":
+        rel_path = path.relative_to(app.data_dir.resolve())
+        prefix = app.config["FILES_OFFLOAD_NGINX_PREFIX"].rstrip("/")
+        location = f"{prefix}/{quote(rel_path.as_posix())}"
+    else:
+        location = str(path)
+
+    response = app.response_class(mimetype=mimetype)
+    response.headers[header] = location
+    if as_attachment:
+        options = _filename_options(attachment_filename) if attachment_filename else {}
+        response.headers.add("Content-Disposition", "attachment", **options)
+    return response
+
+
+def _filename_options(filename: str) -> dict[str, str]:
+    """`Content-Disposition` parameters for `filename`, as set by Flask's
+    `send_file`: names which are not latin-1 are sent RFC 2231 encoded, with
+    an ASCII fallback."""
+    try:
+        filename.encode("latin-1")
+    except UnicodeEncodeError:
+        return {
+            "filename": unicodedata.normalize("NFKD", filename)
+            .encode("ascii", "ignore")
+            .decode("ascii"),
+            "filename*": f"UTF-8''{quote(filename, safe='')}",
+        }
+    return {"filename": filename}
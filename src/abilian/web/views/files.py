@@ -4,10 +4,11 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 
-from flask import Response, request, send_file
+from flask import Response, request
 from werkzeug.exceptions import BadRequest
 
 from abilian.core.util import utc_dt
+from abilian.web.util import send_file_offloaded
 
 from .base import View
 
@@ -120,9 +121,4 @@ class BaseBlobDownload(BaseFileDownload):
         return self.content_type
 
     def make_response(self, *args, **kwargs):
-        blob = self.blob
-        stream = blob.file.open("rb")
-
-        return send_file(
-            stream, mimetype=self.content_type, cache_timeout=0, add_etags=False
-        )
+        return send_file_offloaded(self.blob.file, mimetype=self.content_type)
@@ -4,22 +4,45 @@ from __future__ import annotations
 
 import colorsys
 import hashlib
+import logging
+from functools import lru_cache, partial
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, Tuple
 
 import pkg_resources
 import sqlalchemy as sa
-import sqlalchemy.orm
-from flask import Blueprint, make_response, render_template, request
+from celery import shared_task
+from flask import (
+    Blueprint,
+    current_app,
+    has_app_context,
+    make_response,
+    render_template,
+    request,
+)
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session
 from werkzeug.exceptions import BadRequest, NotFound
 
+from abilian.core.celery import safe_session
 from abilian.core.models.blob import Blob
 from abilian.core.models.subjects import User
-from abilian.services.image import CROP, RESIZE_MODES, get_format, get_size, resize
+from abilian.services.image import (
+    CROP,
+    MIME_TYPES,
+    RESIZE_MODES,
+    can_save,
+    get_format,
+    get_size,
+    resize,
+)
 from abilian.web.util import url_for
 
 from .files import BaseFileDownload
 
+logger = logging.getLogger(__name__)
+
 blueprint = Blueprint("images", __name__, url_prefix="/images")
 route = blueprint.route
 
@@ -28,6 +51,51 @@ DEFAULT_AVATAR = Path(
 )
 DEFAULT_AVATAR_MD5 = hashlib.md5(DEFAULT_AVATAR.open("rb").read()).hexdigest()
 
+#: sizes of images listed in `srcset` attributes: a fixed ladder, so that
+#: pages share (and caches keep) few variants of each image
+SRCSET_SIZES = (16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 500)
+
+#: pixel densities listed in `srcset` attributes
+SRCSET_DENSITIES = (1, 1.5, 2, 3)
+
+#: sizes at which user photos are displayed: thumbnails are rendered in
+#: background when a photo is set
+AVATAR_SIZES = (16, 20, 45)
+
+_PHOTOS_KEY = "abilian_user_photos"
+
+
+def negotiate_format() -> str | None:
+    """Preferred image format accepted by the client, among `IMAGE_FORMATS`
+    supported by Pillow; `None` if the client doesn't list any of them
+    explicitly: the default format is then used (PNG or JPEG)."""
+    accepted = {value for value, quality in request.accept_mimetypes if quality}
+    for fmt in current_app.config.get("IMAGE_FORMATS", ()):
+        if MIME_TYPES.get(fmt) in accepted and can_save(fmt):
+            return fmt
+    return None
+
+
+def srcset_sizes(size: int) -> list[tuple[int, float]]:
+    """Sizes of an image displayed at `size` pixels, and their densities."""
+    sizes = [(size, 1)]
+    for density in SRCSET_DENSITIES[1:]:
+        wanted = size * density
+        variant = next((s for s in SRCSET_SIZES if s >= wanted), SRCSET_SIZES[-1])
+        if variant > sizes[-1][0]:
+            sizes.append((variant, density))
+    return sizes
+
+
+def srcset(url: Callable[[int], str], size: int) -> str:
+    """Value of a `srcset` attribute for an image displayed at `size` pixels.
+
+    :param url: function returning the URL of the image at a given size
+    """
+    return ", ".join(
+        f"{url(variant)} {density:g}x" for variant, density in srcset_sizes(size)
+    )
+
 
 class BaseImageView(BaseFileDownload):
     max_size = None
@@ -59,20 +127,35 @@ class BaseImageView(BaseFileDownload):
         kwargs["mode"] = resize_mode
         return args, kwargs
 
-    def make_response(self, image, size, mode, filename=None, *args, **kwargs):
+    def make_response(
+        self, image, size, mode, filename=None, source_id=None, *args, **kwargs
+    ):
         """
-        :param image: image as bytes
+        :param image: image as bytes or binary stream, or a function returning
+            one of them (see :func:`~abilian.services.image.resize`)
         :param size: requested maximum width/height size
         :param mode: one of 'scale', 'fit' or 'crop'
         :param filename: filename
+        :param source_id: stable identifier of image content, if known: a
+            cached thumbnail is then served without reading `image`
         """
         try:
+            if size:
+                fmt = negotiate_format()
+                image = resize(
+                    image, size, size, mode=mode, format=fmt, source_id=source_id
+                )
+            else:
+                image = _read(image)
             fmt = get_format(image)
         except OSError:
-            # not a known image file
+            # no file, or not a known image file
             raise NotFound()
 
-        self.content_type = "image/png" if fmt == "PNG" else "image/jpeg"
+        if size and mode == CROP:
+            assert get_size(image) == (size, size)
+
+        self.content_type = MIME_TYPES.get(fmt, "image/jpeg")
         ext = f".{str(fmt.lower())}"
 
         if not filename:
@@ -81,14 +164,13 @@ class BaseImageView(BaseFileDownload):
             filename += ext
         self.filename = filename
 
-        if size:
-            image = resize(image, size, size, mode=mode)
-            if mode == CROP:
-                assert get_size(image) == (size, size)
-        else:
-            image = image.read()
-
-        return make_response(image)
+        response = make_response(image)
+        if size and current_app.config.get("IMAGE_FORMATS"):
+            # format depends on Accept header
+            response.vary.add("Accept")
+        response.add_etag()
+        response.make_conditional(request)
+        return response
 
     def get_filename(self, *args, **kwargs):
         return self.filename
@@ -97,6 +179,15 @@ class BaseImageView(BaseFileDownload):
         return self.content_type
 
 
+def _read(image) -> bytes:
+    if callable(image):
+        image = image()
+    if isinstance(image, bytes):
+        return image
+    with image:
+        return image.read()
+
+
 class StaticImageView(BaseImageView):
     """View for static assets not served by static directory.
 
@@ -114,10 +205,13 @@ class StaticImageView(BaseImageView):
         if not self.image_path.exists():
             p = str(self.image_path)
             raise ValueError(f"Invalid image path: {repr(p)}")
+        with self.image_path.open("rb") as f:
+            self.image_digest = hashlib.md5(f.read()).hexdigest()
 
     def prepare_args(self, args, kwargs):
-        kwargs["image"] = self.image_path.open("rb")
+        kwargs["image"] = partial(self.image_path.open, "rb")
         kwargs["filename"] = self.image_path.name
+        kwargs["source_id"] = self.image_digest
         return BaseImageView.prepare_args(self, args, kwargs)
 
 
@@ -150,7 +244,8 @@ class BlobView(BaseImageView):
         meta = blob.meta
         filename = meta.get("filename", meta.get("md5", str(blob.uuid)))
         kwargs["filename"] = filename
-        kwargs["image"] = blob.file.open("rb")
+        kwargs["image"] = blob.open
+        kwargs["source_id"] = meta.get("md5")
         return args, kwargs
 
 
@@ -165,13 +260,19 @@ class UserMugshot(BaseImageView):
         args, kwargs = super().prepare_args(args, kwargs)
 
         user_id = kwargs["user_id"]
-        user = User.query.options(sa.orm.undefer(User.photo)).get(user_id)
-
-        if user is None:
+        # photo is loaded only if its thumbnail is not cached
+        result = (
+            User.query.add_columns(User.photo.isnot(None))
+            .filter(User.id == user_id)
+            .first()
+        )
+        if result is None:
             raise NotFound()
 
+        user, has_photo = result
         kwargs["user"] = user
-        kwargs["image"] = user.photo
+        kwargs["image"] = (lambda: user.photo) if has_photo else None
+        kwargs["source_id"] = user.photo_digest
         return args, kwargs
 
     def make_response(self, user, image, size, *args, **kwargs):
@@ -179,30 +280,127 @@ class UserMugshot(BaseImageView):
             # user has set a photo
             return super().make_response(image, size, *args, **kwargs)
 
-        # render svg avatar
-        if user.last_name:
-            letter = user.last_name[0]
-        elif user.first_name:
-            letter = user.first_name[0]
-        else:
-            letter = "?"
-        letter = letter.upper()
-        # generate bg color, pastel: sat=65% in hsl color space
-        id_hash = hash((user.name + user.email).encode("utf-8"))
-        hue = id_hash % 10
-        hue = (hue * 36) / 360.0  # 10 colors: 360 / 10
-        color = colorsys.hsv_to_rgb(hue, 0.65, 1.0)
-        color = [int(x * 255) for x in color]
-        color = f"rgb({color[0]}, {color[1]}, {color[2]})"
-        svg = render_template(
-            "default/avatar.svg", color=color, letter=letter, size=size
-        )
+        letter = initial(user)
+        color = avatar_color(user)
+        svg, etag = render_initials_avatar(letter, color, size)
         response = make_response(svg)
+        response.set_etag(etag)
+        response.make_conditional(request)
         self.content_type = "image/svg+xml"
-        self.filename = f"avatar-{id_hash}.svg"
+        self.filename = f"avatar-{etag}.svg"
         return response
 
 
+def initial(user: User) -> str:
+    if user.last_name:
+        letter = user.last_name[0]
+    elif user.first_name:
+        letter = user.first_name[0]
+    else:
+        letter = "?"
+    return letter.upper()
+
+
+def avatar_color(user: User) -> str:
+    """Background color of SVG avatar: one of 10 pastel colors (sat=65% in
+    hsv color space), the same in all processes for a given user."""
+    digest = hashlib.md5((user.name + user.email).encode("utf-8")).digest()
+    hue = (digest[0] % 10) * 36 / 360.0  # 10 colors: 360 / 10
+    color = [int(x * 255) for x in colorsys.hsv_to_rgb(hue, 0.65, 1.0)]
+    return f"rgb({color[0]}, {color[1]}, {color[2]})"
+
+
+@lru_cache(maxsize=1024)
+def render_initials_avatar(letter: str, color: str, size: int) -> tuple[bytes, str]:
+    """SVG avatar, and its ETag."""
+    svg = render_template(
+        "default/avatar.svg", color=color, letter=letter, size=size
+    ).encode("utf-8")
+    return svg, hashlib.md5(svg).hexdigest()
+
+
+def served_formats() -> list[str | None]:
+    """Output formats of resized images: default one, and `IMAGE_FORMATS`
+    supported by Pillow."""
+    return [None] + [
+        fmt for fmt in current_app.config.get("IMAGE_FORMATS", ()) if can_save(fmt)
+    ]
+
+
+def avatar_renditions() -> list[tuple[int, str, str | None]]:
+    """`(size, mode, format)` of user photo thumbnails served by
+    :class:`UserMugshot`: :data:`AVATAR_SIZES` and their `srcset` variants, in
+    each format."""
+    sizes = {variant for size in AVATAR_SIZES for variant, _d in srcset_sizes(size)}
+    return [(size, CROP, fmt) for size in sorted(sizes) for fmt in served_formats()]
+
+
+def blob_renditions() -> list[tuple[int, str, str | None]]:
+    """`(size, mode, format)` of image blob thumbnails listed by
+    `IMAGE_BLOB_RENDITIONS`, in each format."""
+    return [
+        (size, mode, fmt)
+        for size, mode in current_app.config.get("IMAGE_BLOB_RENDITIONS", ())
+        for fmt in served_formats()
+    ]
+
+
+def prerender_avatars(photo: bytes, digest: str):
+    """Cache thumbnails of a user photo, as served by :class:`UserMugshot`."""
+    for size, mode, fmt in avatar_renditions():
+        resize(photo, size, size, mode=mode, format=fmt, source_id=digest)
+
+
+@listens_for(Session, "after_flush")
+def _collect_user_photos(session: Session, flush_context):
+    # digests are read now: after commit, attributes are expired
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, User) or not obj.photo_digest:
+            continue
+        added = sa.inspect(obj).attrs.photo.history.added
+        if added and added[0]:
+            pending = session.info.setdefault(_PHOTOS_KEY, {})
+            pending[obj.id] = obj.photo_digest
+
+
+@listens_for(Session, "after_soft_rollback")
+def _discard_user_photos(session: Session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PHOTOS_KEY, None)
+
+
+@listens_for(Session, "after_commit")
+def _prerender_user_photos(session: Session):
+    if session.transaction.nested:
+        return
+
+    pending = session.info.pop(_PHOTOS_KEY, None)
+    if not pending or not has_app_context():
+        return
+
+    for user_id, digest in pending.items():
+        try:
+            prerender_user_photo.delay(user_id, digest)
+        except Exception:
+            logger.error("Failed to queue avatars of user %d", user_id, exc_info=True)
+
+
+@shared_task(ignore_result=True)
+def prerender_user_photo(user_id: int, digest: str):
+    """Cache avatar thumbnails of a user photo."""
+    session = safe_session()
+    photo = (
+        session.query(User.photo)
+        .filter(User.id == user_id, User.photo_digest == digest)
+        .scalar()
+    )
+    if photo is None:
+        # user deleted or photo changed since the task was queued
+        return
+
+    prerender_avatars(photo, digest)
+
+
 user_photo = UserMugshot.as_view("user_photo", set_expire=True, max_size=500)
 route("/users/<int:user_id>")(user_photo)
 route("/users/default")(
@@ -217,8 +415,13 @@ def user_url_args(user: User, size: int) -> tuple[str, dict[str, Any]]:
     if not user.is_anonymous:
         endpoint = "images.user_photo"
         kwargs["user_id"] = user.id
-        content = user.photo if user.photo else (user.name + user.email).encode("utf-8")
-        kwargs["md5"] = hashlib.md5(content).hexdigest()
+        digest = user.photo_digest
+        if digest is None:
+            # no photo (or set before digests were stored): SVG avatar
+            # depends on name
+            content = (user.name + user.email).encode("utf-8")
+            digest = hashlib.md5(content).hexdigest()
+        kwargs["md5"] = digest
 
     return endpoint, kwargs
 
@@ -227,3 +430,8 @@ def user_photo_url(user, size):
     """Return url to use for this user."""
     endpoint, kwargs = user_url_args(user, size)
     return url_for(endpoint, **kwargs)
+
+
+def user_photo_srcset(user, size):
+    """Return `srcset` attribute value for photo of this user."""
+    return srcset(lambda s: user_photo_url(user, s), size)
@@ -0,0 +1,75 @@
+""""""
+
+from __future__ import annotations
+
+from flask import Flask
+from pytest import mark
+
+from abilian.core.models.subjects import User
+from abilian.services.image import can_save
+from abilian.web.views.images import (
+    avatar_color,
+    avatar_renditions,
+    blob_renditions,
+    initial,
+    negotiate_format,
+    render_initials_avatar,
+    srcset,
+)
+
+
+def test_srcset():
+    value = srcset(lambda size: f"/img?s={size}", 32)
+    assert value == "/img?s=32 1x, /img?s=48 1.5x, /img?s=64 2x, /img?s=96 3x"
+
+    # 2x would be the same size as 1.5x
+    value = srcset(lambda size: f"/img?s={size}", 45)
+    assert value == "/img?s=45 1x, /img?s=96 1.5x, /img?s=192 3x"
+
+    # capped by largest size
+    value = srcset(lambda size: f"/img?s={size}", 384)
+    assert value == "/img?s=384 1x, /img?s=500 1.5x"
+
+
+@mark.skipif(not can_save("WEBP"), reason="requires Pillow with WebP support")
+def test_negotiate_format(app: Flask):
+    app.config["IMAGE_FORMATS"] = ["AVIF", "WEBP"]
+    accept = "image/webp,image/apng,image/*,*/*;q=0.8"
+    with app.test_request_context(headers={"Accept": accept}):
+        assert negotiate_format() == "WEBP"
+
+    # wildcards are not enough
+    with app.test_request_context(headers={"Accept": "image/*,*/*;q=0.8"}):
+        assert negotiate_format() is None
+
+    with app.test_request_context(headers={"Accept": "image/webp;q=0"}):
+        assert negotiate_format() is None
+
+
+def test_initials_avatar(app: Flask):
+    user = User(first_name="John", last_name="Doe", email="john@example.com")
+    assert initial(user) == "D"
+    assert initial(User(email="anonymous@example.com")) == "?"
+
+    # doesn't depend on process (hash randomization)
+    color = avatar_color(user)
+    assert color == avatar_color(
+        User(first_name="John", last_name="Doe", email="john@example.com")
+    )
+    assert color.startswith("rgb(")
+
+    with app.test_request_context():
+        svg, etag = render_initials_avatar("D", color, 32)
+        assert b'width="32"' in svg
+        assert render_initials_avatar("D", color, 32) == (svg, etag)
+
+
+def test_renditions(app: Flask):
+    app.config["IMAGE_FORMATS"] = []
+    app.config["IMAGE_BLOB_RENDITIONS"] = [(120, "crop")]
+    with app.app_context():
+        assert blob_renditions() == [(120, "crop", None)]
+        renditions = avatar_renditions()
+        assert (16, "crop", None) in renditions
+        # srcset variant
+        assert (32, "crop", None) in renditions